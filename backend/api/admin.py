@@ -1,9 +1,32 @@
-from django.contrib import admin
-from .models import Producto, Usuario, Pedido, DetallePedido, Notificacion, Configuracion
+from django.contrib import admin, messages
+from .models import Producto, Usuario, Pedido, DetallePedido, Notificacion, Configuracion, TipoCambio
+from .transiciones import NOMBRES_ESTADO, cambiar_estado
+
+
+def accion_cambiar_estado(estado):
+    @admin.action(description=f'Pasar los pedidos seleccionados a "{NOMBRES_ESTADO[estado]}"')
+    def accion(modeladmin, request, queryset):
+        resultado = cambiar_estado(queryset.values_list('pk', flat=True), estado)
+        rechazados = len(resultado['rechazados'])
+        modeladmin.message_user(
+            request,
+            f"{len(resultado['actualizados'])} pedidos actualizados; {rechazados} no admiten la transición.",
+            messages.WARNING if rechazados else messages.SUCCESS,
+        )
+    accion.__name__ = f'pasar_a_{estado}'
+    return accion
+
+
+class PedidoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cliente', 'estado', 'fecha_pedido', 'total_final_clp')
+    list_filter = ('estado',)
+    actions = [accion_cambiar_estado(estado) for estado in ('en_proceso', 'enviado', 'entregado')]
+
 
 admin.site.register(Producto)
 admin.site.register(Usuario)
-admin.site.register(Pedido)
+admin.site.register(Pedido, PedidoAdmin)
 admin.site.register(DetallePedido)
 admin.site.register(Notificacion)
 admin.site.register(Configuracion)
+admin.site.register(TipoCambio)
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+CLAIM_VERSION = 'version_token'
+# Lo único que se guarda del usuario: sin contraseña ni datos personales
+CAMPOS_CACHE = ('id', 'is_active', 'is_staff', 'is_superuser', 'version_token')
+
+
+def clave_usuario(usuario_id):
+    return f'autenticacion:usuario:{usuario_id}'
+
+
+def guardar_usuario(usuario):
+    cache.set(clave_usuario(usuario.pk), {campo: getattr(usuario, campo) for campo in CAMPOS_CACHE},
+              getattr(settings, 'AUTENTICACION_CACHE_TTL', 60))
+
+
+def usuario_en_cache(usuario_id):
+    """
+    Usuario armado con ``CAMPOS_CACHE``, o None si no está en el caché.
+
+    Los demás campos quedan diferidos: ``save()`` solo escribe los cargados
+    y leer uno lo consulta por separado, así que las vistas que los usan
+    los piden antes con ``cargar_campos``.
+    """
+    valores = cache.get(clave_usuario(usuario_id))
+    if valores is None:
+        return None
+    modelo = get_user_model()
+    # from_db espera los valores en el orden de los campos del modelo
+    campos = [campo.attname for campo in modelo._meta.concrete_fields if campo.attname in valores]
+    return modelo.from_db(None, campos, [valores[campo] for campo in campos])
+
+
+def cargar_campos(usuario, campos):
+    """
+    Lee en una sola consulta los ``campos`` que ``usuario`` todavía tiene diferidos.
+
+    Un usuario completo (p. ej. con ``force_authenticate``) no consulta.
+    Devuelve el mismo usuario.
+    """
+    diferidos = usuario.get_deferred_fields() & set(campos)
+    if diferidos:
+        from .signals import recordar_credenciales
+        usuario.refresh_from_db(fields=diferidos)
+        # Con las credenciales ya cargadas las señales pueden detectar su cambio y revocar los tokens
+        recordar_credenciales(type(usuario), usuario)
+    return usuario
+
+
+def invalidar_usuario(usuario_id):
+    cache.delete(clave_usuario(usuario_id))
+
+
+def token_revocado(token, usuario):
+    return token.get(CLAIM_VERSION, 0) != usuario.version_token
+
+
+class JWTCacheAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` que toma el usuario del caché en vez de consultarlo.
+
+    De cada usuario se guardan ``CAMPOS_CACHE`` por
+    ``AUTENTICACION_CACHE_TTL`` segundos; las señales de ``Usuario`` los
+    borran al guardar o eliminar. Un token con una
+    ``version_token`` distinta a la del usuario (cambio de contraseña, de
+    permisos o desactivación) se rechaza, también cuando el usuario viene del
+    caché. Con un caché por proceso (locmem) otro proceso puede aceptar un
+    token revocado hasta que venza el TTL.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            usuario_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        usuario = usuario_en_cache(usuario_id)
+        if usuario is None:
+            usuario = super().get_user(validated_token)
+            guardar_usuario(usuario)
+        elif not usuario.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if token_revocado(validated_token, usuario):
+            raise AuthenticationFailed('El token fue revocado.', code='token_not_valid')
+        return usuario
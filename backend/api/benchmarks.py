@@ -0,0 +1,942 @@
+"""
+Escenarios de rendimiento que se ejecutan con ``manage.py benchmark``.
+
+Cada escenario recibe las opciones del comando y devuelve un diccionario con
+sus mediciones. Todo lo que se escribe en la base de datos se revierte al
+terminar, por lo que se pueden ejecutar contra una copia de producción.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+from statistics import median
+from unittest import mock
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from .models import Configuracion, DetallePedido, Pedido, Producto, Usuario
+
+ESCENARIOS = {}
+
+
+def escenario(nombre):
+    def registrar(funcion):
+        ESCENARIOS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+class _Revertir(Exception):
+    pass
+
+
+VALOR_DOLAR = Decimal('950.00')
+
+
+def ejecutar(nombre, **opciones):
+    resultado = None
+    # El tipo de cambio se fija para no medir la red
+    try:
+        with mock.patch('api.utils.obtener_valor_dolar', return_value=(VALOR_DOLAR, 'benchmark')), transaction.atomic():
+            resultado = ESCENARIOS[nombre](**opciones)
+            raise _Revertir
+    except _Revertir:
+        pass
+    return resultado
+
+
+def medir(funcion, repeticiones=5):
+    """Ejecuta ``funcion`` varias veces y devuelve (resultado, consultas, ms)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as contexto:
+                inicio = time.perf_counter()
+                resultado = funcion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            transaction.set_rollback(True)
+    return resultado, contexto.captured_queries, percentiles(tiempos)
+
+
+def percentiles(tiempos):
+    ordenados = sorted(tiempos)
+    return {
+        'p50_ms': round(median(ordenados), 3),
+        'p95_ms': round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))], 3),
+    }
+
+
+def escrituras(consultas):
+    return sum(1 for q in consultas if q['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')))
+
+
+def crear_datos_base(productos=50):
+    configuracion = Configuracion.objects.order_by('pk').first() or Configuracion.objects.create()
+    if not configuracion.dolar_aduanero:
+        configuracion.dolar_aduanero = Decimal('940.00')
+        configuracion.save()
+    cliente, _ = Usuario.objects.get_or_create(username='benchmark')
+    lista = Producto.objects.bulk_create(
+        Producto(
+            nombre=f'Producto {i}', marca=f'Marca {i % 10}', precio_usd=Decimal('10.00') + i,
+            peso_kg=Decimal('0.50'), precio_final_clp=None,
+        )
+        for i in range(productos)
+    )
+    return cliente, lista
+
+
+def crear_pedido(cliente, productos, lineas, valor_dolar=VALOR_DOLAR):
+    pedido = Pedido.objects.create(cliente=cliente)
+    DetallePedido.objects.bulk_create(
+        DetallePedido(
+            pedido=pedido, producto=producto, cantidad=2, subtotal_usd=producto.precio_usd * 2,
+            subtotal_clp=producto.precio_usd * 2 * valor_dolar, peso_kg=producto.peso_kg * 2,
+        )
+        for producto in (productos[i % len(productos)] for i in range(lineas))
+    )
+    return pedido
+
+
+def _totales_legado(pedido):
+    """Cálculo anterior: suma en Python y guarda el pedido dos veces."""
+    detalles = pedido.detalles.all()
+    pedido.total_usd = sum(det.subtotal_usd for det in detalles)
+    pedido.peso_total_kg = sum(det.peso_kg for det in detalles)
+    pedido.total_clp = sum(det.subtotal_clp for det in detalles)
+    pedido.save()
+    configuracion = Configuracion.objects.first()
+    if configuracion and configuracion.dolar_aduanero:
+        seguro = (pedido.total_usd * Configuracion.objects.first().tasa_seguro) / Decimal('100.0')
+        flete = pedido.peso_total_kg * Configuracion.objects.first().costo_por_kg
+        valor_cif_clp = (pedido.total_usd + seguro + flete) * configuracion.dolar_aduanero
+        arancel = (valor_cif_clp * configuracion.tasa_arancel) / Decimal('100.0')
+        iva_importacion = ((valor_cif_clp + arancel) * configuracion.tasa_iva) / Decimal('100.0')
+        pedido.total_final_clp = pedido.total_clp + arancel + iva_importacion
+        pedido.save()
+
+
+@escenario('totales')
+def benchmark_totales(lineas=(1, 50, 500), repeticiones=5, **opciones):
+    from .totales import recalcular_totales
+    cliente, productos = crear_datos_base()
+    resultados = {}
+    for cantidad in lineas:
+        pedido = crear_pedido(cliente, productos, cantidad)
+        Configuracion.limpiar_cache()
+        _, consultas_legado, tiempo_legado = medir(
+            lambda: _totales_legado(Pedido.objects.get(pk=pedido.pk)), repeticiones)
+        _, consultas_nuevo, tiempo_nuevo = medir(
+            lambda: recalcular_totales(Pedido.objects.get(pk=pedido.pk)), repeticiones)
+        resultados[f'{cantidad}_lineas'] = {
+            'legado': {'consultas': len(consultas_legado), 'escrituras': escrituras(consultas_legado), **tiempo_legado},
+            'agregado': {'consultas': len(consultas_nuevo), 'escrituras': escrituras(consultas_nuevo), **tiempo_nuevo},
+        }
+    return resultados
+
+
+@escenario('checkout')
+def benchmark_checkout(lineas=(1, 30, 200), repeticiones=5, **opciones):
+    from rest_framework.test import APIRequestFactory
+    from .serializers import PedidoSerializer
+    cliente, productos = crear_datos_base(max(lineas))
+    peticion = APIRequestFactory().post('/api/v1/pedidos/')
+    peticion.user = cliente
+
+    def por_linea(detalles):
+        # Camino anterior: un INSERT y una lectura de producto por línea
+        pedido = Pedido.objects.create(cliente=cliente)
+        for detalle in detalles:
+            DetallePedido.objects.create(
+                pedido=pedido, producto=Producto.objects.get(pk=detalle['producto']), cantidad=detalle['cantidad'])
+        pedido.recalcular_totales()
+
+    def en_bloque(detalles):
+        serializer = PedidoSerializer(data={'detalles': detalles}, context={'request': peticion})
+        serializer.is_valid(raise_exception=True)
+        serializer.save(cliente=cliente)
+
+    resultados = {}
+    for cantidad in lineas:
+        detalles = [{'producto': producto.pk, 'cantidad': 2} for producto in productos[:cantidad]]
+        Configuracion.limpiar_cache()
+        _, consultas_legado, tiempo_legado = medir(lambda: por_linea(detalles), repeticiones)
+        _, consultas_nuevo, tiempo_nuevo = medir(lambda: en_bloque(detalles), repeticiones)
+        resultados[f'{cantidad}_lineas'] = {
+            'por_linea': {'consultas': len(consultas_legado), **tiempo_legado},
+            'en_bloque': {'consultas': len(consultas_nuevo), **tiempo_nuevo},
+        }
+    return resultados
+
+
+@escenario('transiciones')
+def benchmark_transiciones(pedidos=(10, 500), repeticiones=5, **opciones):
+    """Cambio de estado de muchos pedidos: uno por uno con save() frente a cambiar_estado()."""
+    from .transiciones import cambiar_estado
+    cliente, _ = crear_datos_base(1)
+
+    def por_pedido(ids):
+        # Camino anterior: un SELECT y un UPDATE de todas las columnas por pedido, sin notificar
+        for pk in ids:
+            pedido = Pedido.objects.get(pk=pk)
+            pedido.estado = 'enviado'
+            pedido.save()
+
+    resultados = {}
+    for cantidad in pedidos:
+        ids = [pedido.pk for pedido in Pedido.objects.bulk_create(
+            Pedido(cliente=cliente, estado='en_proceso') for _ in range(cantidad))]
+        _, consultas_legado, tiempo_legado = medir(lambda: por_pedido(ids), repeticiones)
+        _, consultas_nuevo, tiempo_nuevo = medir(lambda: cambiar_estado(ids, 'enviado'), repeticiones)
+        resultados[f'{cantidad}_pedidos'] = {
+            'por_pedido': {'consultas': len(consultas_legado), 'escrituras': escrituras(consultas_legado), **tiempo_legado},
+            'en_bloque': {'consultas': len(consultas_nuevo), 'escrituras': escrituras(consultas_nuevo),
+                          'notificaciones': cantidad, **tiempo_nuevo},
+        }
+    return resultados
+
+
+@escenario('catalogo')
+def benchmark_catalogo(productos=10000, tamano_pagina=10, repeticiones=5, **opciones):
+    from .precios import repreciar_productos
+    from .serializers import ProductoSerializer
+    crear_datos_base(productos)
+    Configuracion.limpiar_cache()
+
+    def sin_precalcular():
+        # Sin columna almacenada hay que calcular y ordenar en Python
+        lista = sorted(Producto.objects.all(), key=lambda producto: producto.precio_clp)
+        return ProductoSerializer(lista[:tamano_pagina], many=True).data
+
+    def precalculado():
+        lista = Producto.objects.order_by('precio_clp_efectivo')[:tamano_pagina]
+        return ProductoSerializer(lista, many=True).data
+
+    Producto.objects.update(precio_clp_efectivo=None)
+    _, consultas_sin, tiempo_sin = medir(sin_precalcular, repeticiones)
+    _, consultas_repreciar, tiempo_repreciar = medir(repreciar_productos, 1)
+    repreciar_productos()
+    _, consultas_con, tiempo_con = medir(precalculado, repeticiones)
+    return {
+        'productos': Producto.objects.count(),
+        'sin_precalcular': {'consultas': len(consultas_sin), **tiempo_sin},
+        'repreciar': {'consultas': len(consultas_repreciar), **tiempo_repreciar},
+        'precalculado': {'consultas': len(consultas_con), **tiempo_con},
+    }
+
+
+@escenario('paginacion')
+def benchmark_paginacion(productos=100000, repeticiones=5, **opciones):
+    from urllib.parse import parse_qs, urlparse
+    from rest_framework.pagination import Cursor
+    from rest_framework.test import APIRequestFactory
+    from .pagination import PaginacionCursor
+    from .views import ProductoViewSet
+    crear_datos_base(productos)
+    vista = ProductoViewSet.as_view({'get': 'list'})
+    factory = APIRequestFactory()
+    ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+    paginas = len(ids) // 10
+
+    def listar(parametros):
+        respuesta = vista(factory.get('/api/v1/productos/', parametros))
+        assert respuesta.status_code == 200, respuesta.data
+        return respuesta
+
+    paginador = PaginacionCursor()
+    paginador.base_url = 'http://benchmark/'
+    resultados = {}
+    for nombre, pagina in [('primera', 1), ('mitad', paginas // 2), ('ultima', paginas)]:
+        # Cursor que apunta justo antes de la misma página
+        posicion = ids[(pagina - 1) * 10 - 1] if pagina > 1 else None
+        cursor = paginador.encode_cursor(Cursor(offset=0, reverse=False, position=posicion and str(posicion)))
+        cursor = parse_qs(urlparse(cursor).query).get('cursor', [None])[0]
+        parametros_cursor = {'paginacion': 'cursor', **({'cursor': cursor} if cursor else {})}
+        _, _, tiempo_pagina = medir(lambda: listar({'page': pagina}), repeticiones)
+        _, _, tiempo_cursor = medir(lambda: listar(parametros_cursor), repeticiones)
+        resultados[nombre] = {'pagina': pagina, 'por_pagina': tiempo_pagina, 'cursor': tiempo_cursor}
+    return resultados
+
+
+PALABRAS = [
+    'zapatilla', 'polera', 'chaqueta', 'mochila', 'reloj', 'perfume', 'audifonos', 'notebook', 'cartera',
+    'lentes', 'pantalon', 'vestido', 'billetera', 'bufanda', 'gorro', 'camisa', 'sandalia', 'parka',
+]
+
+
+@escenario('busqueda')
+def benchmark_busqueda(productos=100000, repeticiones=5, **opciones):
+    import random
+    from django.db.models import Q
+    from rest_framework.test import APIRequestFactory
+    from .views import ProductoViewSet
+    aleatorio = random.Random(42)
+    Producto.objects.bulk_create(
+        (
+            Producto(
+                nombre=' '.join(aleatorio.sample(PALABRAS, 3)).capitalize(),
+                descripcion=' '.join(aleatorio.choices(PALABRAS, k=25)),
+                marca=f'Marca {i % 50}', precio_usd=Decimal('10.00'),
+            )
+            for i in range(productos)
+        ),
+        batch_size=5000,
+    )
+    vista = ProductoViewSet.as_view({'get': 'list'})
+    factory = APIRequestFactory()
+
+    def ilike(termino):
+        # Equivalente a filters.SearchFilter sobre nombre y descripción
+        return list(Producto.objects.filter(Q(nombre__icontains=termino) | Q(descripcion__icontains=termino)).order_by('id')[:10])
+
+    resultados = {'motor': connection.vendor, 'productos': productos}
+    for termino in ['mochila', 'audif', 'chaqeta']:
+        _, _, tiempo_ilike = medir(lambda: ilike(termino), repeticiones)
+        _, _, tiempo_api = medir(lambda: vista(factory.get('/api/v1/productos/', {'search': termino})), repeticiones)
+        resultados[termino] = {'ilike': tiempo_ilike, 'busqueda_api': tiempo_api}
+    return resultados
+
+
+class Endpoint:
+    """Petición representativa de un endpoint y su máximo de consultas permitido."""
+
+    def __init__(self, nombre, metodo, url, usuario='cliente', datos=None, max_consultas=None, estado=200):
+        self.nombre = nombre
+        self.metodo = metodo
+        self.url = url
+        self.usuario = usuario
+        self.datos = datos
+        self.max_consultas = max_consultas
+        self.estado = estado
+
+    def ejecutar(self, clientes, contexto):
+        cliente = clientes[self.usuario]
+        datos = self.datos(contexto) if callable(self.datos) else self.datos
+        respuesta = getattr(cliente, self.metodo)(self.url.format(**contexto), datos, format='json')
+        assert respuesta.status_code == self.estado, (self.nombre, respuesta.status_code, getattr(respuesta, 'data', None))
+        return respuesta
+
+
+CLAVE_BENCHMARK = 'clave-benchmark-123'
+
+ENDPOINTS = [
+    Endpoint('api-root', 'get', '/api/v1/', max_consultas=0),
+    Endpoint('productos-lista', 'get', '/api/v1/productos/', usuario='anonimo', max_consultas=3),
+    Endpoint('productos-filtro', 'get', '/api/v1/productos/?marca=Marca 1&disponible=true&ordering=-precio_usd', usuario='anonimo', max_consultas=3),
+    Endpoint('productos-busqueda', 'get', '/api/v1/productos/?search=producto', usuario='anonimo', max_consultas=3),
+    Endpoint('productos-cursor', 'get', '/api/v1/productos/?paginacion=cursor', usuario='anonimo', max_consultas=2),
+    Endpoint('productos-detalle', 'get', '/api/v1/productos/{producto}/', usuario='anonimo', max_consultas=1),
+    Endpoint('productos-crear', 'post', '/api/v1/productos/', usuario='admin', estado=201, max_consultas=3, datos={
+        'nombre': 'Nuevo', 'marca': 'Marca 1', 'precio_usd': '15.00', 'peso_kg': '0.40'}),
+    Endpoint('productos-actualizar', 'put', '/api/v1/productos/{producto}/', usuario='admin', max_consultas=4, datos={
+        'nombre': 'Editado', 'marca': 'Marca 1', 'precio_usd': '16.00', 'peso_kg': '0.40'}),
+    Endpoint('productos-eliminar', 'delete', '/api/v1/productos/{producto_libre}/', usuario='admin', estado=204, max_consultas=5),
+    Endpoint('pedidos-lista', 'get', '/api/v1/pedidos/', max_consultas=2),
+    Endpoint('pedidos-lista-expandida', 'get', '/api/v1/pedidos/?expand=cliente,detalles', max_consultas=3),
+    Endpoint('pedidos-detalle', 'get', '/api/v1/pedidos/{pedido}/', max_consultas=2),
+    # La respuesta lleva los datos del cliente, diferidos en el usuario del caché de autenticación
+    Endpoint('pedidos-crear', 'post', '/api/v1/pedidos/', estado=201, max_consultas=9, datos=lambda contexto: {
+        'detalles': [{'producto': pk, 'cantidad': 2} for pk in contexto['productos'][:20]]}),
+    Endpoint('pedidos-actualizar', 'patch', '/api/v1/pedidos/{pedido}/', max_consultas=12, datos=lambda contexto: {
+        'detalles': [{'producto': pk, 'cantidad': 3} for pk in contexto['productos'][5:25]]}),
+    Endpoint('pedidos-cambiar-estado', 'post', '/api/v1/pedidos/cambiar-estado/', usuario='admin', max_consultas=5,
+             datos=lambda contexto: {'ids': [contexto['pedido']], 'estado': 'en_proceso'}),
+    Endpoint('pedidos-eliminar', 'delete', '/api/v1/pedidos/{pedido}/', estado=204, max_consultas=5),
+    Endpoint('notificaciones-lista', 'get', '/api/v1/notificaciones/', max_consultas=2),
+    Endpoint('notificaciones-no-leidas', 'get', '/api/v1/notificaciones/?leida=false', max_consultas=2),
+    Endpoint('notificaciones-detalle', 'get', '/api/v1/notificaciones/{notificacion}/', max_consultas=1),
+    Endpoint('notificaciones-marcar-leidas', 'post', '/api/v1/notificaciones/marcar-leidas/', max_consultas=1),
+    Endpoint('notificaciones-difundir', 'post', '/api/v1/notificaciones/difundir/', usuario='admin', estado=202,
+             max_consultas=0, datos={'contenido': 'Envío gratis este fin de semana'}),
+    Endpoint('analitica-ventas', 'get', '/api/v1/analitica/ventas/', usuario='admin', max_consultas=5),
+    Endpoint('configuracion-lista', 'get', '/api/v1/configuracion/', usuario='admin', max_consultas=3),
+    Endpoint('configuracion-detalle', 'get', '/api/v1/configuracion/{configuracion}/', usuario='admin', max_consultas=1),
+    Endpoint('configuracion-actualizar', 'patch', '/api/v1/configuracion/{configuracion}/', usuario='admin', max_consultas=5,
+             datos={'tasa_iva': '19.00'}),
+    Endpoint('detalles-lista', 'get', '/api/v1/detalles/', max_consultas=2),
+    Endpoint('detalles-detalle', 'get', '/api/v1/detalles/{detalle}/', max_consultas=1),
+    Endpoint('detalles-crear', 'post', '/api/v1/detalles/', estado=201, max_consultas=6, datos=lambda contexto: {
+        'pedido': contexto['pedido'], 'producto': contexto['productos'][-1], 'cantidad': 1}),
+    Endpoint('detalles-actualizar', 'patch', '/api/v1/detalles/{detalle}/', max_consultas=5, datos={'cantidad': 4}),
+    Endpoint('detalles-eliminar', 'delete', '/api/v1/detalles/{detalle}/', estado=204, max_consultas=5),
+    Endpoint('usuarios-registro', 'post', '/api/v1/users/register/', usuario='anonimo', estado=201, max_consultas=3, datos={
+        'username': 'nuevo', 'first_name': 'Nuevo', 'last_name': 'Usuario', 'email': 'nuevo@example.com',
+        'password': 'Otra-clave-456', 'password2': 'Otra-clave-456'}),
+    # El caché de autenticación guarda solo los campos de permisos: el perfil lee el resto
+    Endpoint('usuarios-perfil', 'get', '/api/v1/users/profile/', max_consultas=1),
+    Endpoint('usuarios-perfil-actualizar', 'put', '/api/v1/users/profile/', max_consultas=2, datos={
+        'telefono': '+56911111111', 'direccion': 'Calle 123', 'first_name': 'Cliente', 'last_name': 'Benchmark'}),
+    Endpoint('usuarios-cambiar-clave', 'post', '/api/v1/users/change-password/', max_consultas=2, datos={
+        'old_password': CLAVE_BENCHMARK, 'new_password': 'Otra-clave-456'}),
+    Endpoint('usuarios-eliminar', 'delete', '/api/v1/users/delete/', estado=204, max_consultas=12),
+    Endpoint('token', 'post', '/api/v1/token/', usuario='anonimo', max_consultas=2, datos={
+        'username': 'cliente-benchmark', 'password': CLAVE_BENCHMARK}),
+    Endpoint('token-refresh', 'post', '/api/v1/token/refresh/', usuario='anonimo', max_consultas=0,
+             datos=lambda contexto: {'refresh': contexto['refresh']}),
+]
+
+
+def preparar_endpoints(productos=200, pedidos=20, lineas=10, notificaciones=50):
+    """Crea datos con volumen realista y clientes HTTP autenticados por JWT."""
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from .models import Notificacion
+
+    configuracion = Configuracion.objects.order_by('pk').first() or Configuracion.objects.create(dolar_aduanero=Decimal('940.00'))
+    cliente = Usuario.objects.create_user(username='cliente-benchmark', password=CLAVE_BENCHMARK)
+    admin = Usuario.objects.create_user(username='admin-benchmark', password=CLAVE_BENCHMARK, is_staff=True)
+    lista = Producto.objects.bulk_create(
+        Producto(nombre=f'Producto {i}', marca=f'Marca {i % 10}', precio_usd=Decimal('10.00') + i % 90,
+                 peso_kg=Decimal('0.50'), descripcion='Producto de prueba para benchmark')
+        for i in range(productos)
+    )
+    pedido = None
+    for _ in range(pedidos):
+        pedido = crear_pedido(cliente, lista[:productos - 1], lineas)
+    Notificacion.objects.bulk_create(
+        Notificacion(usuario=cliente, tipo='otro', contenido=f'Aviso {i}', leida=i % 3 == 0) for i in range(notificaciones)
+    )
+    from .precios import repreciar_productos
+    from .totales import recalcular_totales
+    repreciar_productos()
+    recalcular_totales(Pedido.objects.filter(cliente=cliente))
+
+    clientes = {'anonimo': APIClient()}
+    contexto = {
+        'productos': [producto.pk for producto in lista],
+        'producto': lista[0].pk,
+        'producto_libre': lista[-1].pk,
+        'pedido': pedido.pk,
+        'detalle': pedido.detalles.order_by('id').values_list('pk', flat=True).first(),
+        'notificacion': Notificacion.objects.filter(usuario=cliente).values_list('pk', flat=True).first(),
+        'configuracion': configuracion.pk,
+        'refresh': str(RefreshToken.for_user(cliente)),
+    }
+    for nombre, usuario in [('cliente', cliente), ('admin', admin)]:
+        clientes[nombre] = APIClient()
+        clientes[nombre].credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(usuario).access_token}')
+    return clientes, contexto
+
+
+@escenario('endpoints')
+def benchmark_endpoints(repeticiones=5, **opciones):
+    clientes, contexto = preparar_endpoints(productos=2000, pedidos=100, lineas=20, notificaciones=500)
+    resultados = {}
+    for endpoint in ENDPOINTS:
+        Configuracion.limpiar_cache()
+        _, consultas, tiempos = medir(lambda: endpoint.ejecutar(clientes, contexto), repeticiones)
+        resultados[endpoint.nombre] = {'consultas': len(consultas), 'max_consultas': endpoint.max_consultas, **tiempos}
+    return resultados
+
+
+@escenario('listados')
+def benchmark_listados(productos=1000, pedidos=200, lineas=10, tamano_pagina=100, repeticiones=5, **opciones):
+    """Bytes y tiempo de los listados compactos frente a todos los campos (``?fields=`` / ``?expand=``)."""
+    from .serializers import PedidoListaSerializer, ProductoListaSerializer
+    clientes, _ = preparar_endpoints(productos=productos, pedidos=pedidos, lineas=lineas, notificaciones=0)
+    Producto.objects.update(descripcion='Descripción extensa del producto con sus características. ' * 40)
+    cliente = clientes['cliente']
+    todos_productos = ','.join(ProductoListaSerializer.Meta.fields)
+    todos_pedidos = ','.join(PedidoListaSerializer.Meta.fields)
+    variantes = {
+        'productos_completo': f'/api/v1/productos/?page_size={tamano_pagina}&fields={todos_productos}',
+        'productos_compacto': f'/api/v1/productos/?page_size={tamano_pagina}',
+        'pedidos_completo': f'/api/v1/pedidos/?page_size={tamano_pagina}&fields={todos_pedidos}&expand=cliente,detalles',
+        'pedidos_compacto': f'/api/v1/pedidos/?page_size={tamano_pagina}',
+    }
+    resultados = {}
+    for nombre, url in variantes.items():
+        # Autenticado: el caché de respuestas del catálogo anónimo no interviene
+        respuesta, consultas, tiempos = medir(lambda: cliente.get(url), repeticiones)
+        resultados[nombre] = {'bytes': len(respuesta.content), 'consultas': len(consultas), **tiempos}
+    return resultados
+
+
+@escenario('lectura_rapida')
+def benchmark_lectura_rapida(filas=(10, 100, 1000), repeticiones=5, **opciones):
+    """Una página del listado: serializador + JSONRenderer frente a values() + api.lectura."""
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from .lectura import Lector, a_json, orjson
+    from .precios import repreciar_productos
+    from .serializers import PedidoListaSerializer, ProductoListaSerializer
+    cliente, productos = crear_datos_base(max(filas))
+    Producto.objects.update(descripcion='Descripción del producto con sus características. ' * 10)
+    repreciar_productos()
+    for _ in range(max(filas)):
+        crear_pedido(cliente, productos, 5)
+    request = Request(APIRequestFactory().get('/api/v1/'))
+    listados = {
+        'productos': (ProductoListaSerializer, Producto.objects.order_by('id'), None),
+        'pedidos': (PedidoListaSerializer, Pedido.objects.filter(cliente=cliente).order_by('id'), 'cliente,detalles'),
+    }
+    resultados = {'encoder': 'orjson' if orjson is not None else 'json'}
+    for nombre, (serializador, queryset, expand) in listados.items():
+        campos, expandir = serializador.elegir(expand=expand)
+        contexto = {'request': request, 'campos': campos, 'expandir': expandir}
+        queryset = serializador.preparar_queryset(queryset, campos, expandir)
+        for cantidad in filas:
+            def con_serializador():
+                return JSONRenderer().render(serializador(queryset[:cantidad], many=True, context=contexto).data)
+
+            def con_lector():
+                # El plan se arma en cada petición, así que entra en la medición
+                lector = Lector(serializador(context=contexto))
+                return a_json(lector.convertir(lector.preparar(queryset)[:cantidad]))
+
+            esperado, consultas_serializador, tiempo_serializador = medir(con_serializador, repeticiones)
+            obtenido, consultas_lector, tiempo_lector = medir(con_lector, repeticiones)
+            resultados[f'{nombre}_{cantidad}_filas'] = {
+                'serializador': {'consultas': len(consultas_serializador), **tiempo_serializador},
+                'lectura_rapida': {'consultas': len(consultas_lector), **tiempo_lector},
+                'identico': esperado == obtenido,
+                'aceleracion': round(tiempo_serializador['p50_ms'] / tiempo_lector['p50_ms'], 1),
+            }
+    return resultados
+
+
+@escenario('analitica')
+def benchmark_analitica(pedidos=(1000, 20000), lineas_por_pedido=5, lote_sincronizacion=500, repeticiones=5, **opciones):
+    """Panel de ventas: resúmenes mantenidos (api.resumenes) frente a agrupar pedidos y líneas en cada petición."""
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from .resumenes import reconstruir, sincronizar
+    from .totales import recalcular_totales
+    cliente, productos = crear_datos_base(productos=200)
+    admin = Usuario.objects.create_user(username='admin-analitica', is_staff=True)
+    api = APIClient()
+    api.force_authenticate(admin)
+    hasta = timezone.localdate()
+    desde = hasta - timedelta(days=29)
+    sumas = {'total_usd': Sum('total_usd'), 'total_clp': Sum('total_clp'), 'total_final_clp': Sum('total_final_clp')}
+
+    def agrupando():
+        # Lo mismo que entrega el endpoint, calculado desde las tablas de pedidos
+        pedidos_periodo = Pedido.objects.filter(fecha_pedido__date__range=(desde, hasta))
+        lineas = DetallePedido.objects.values('producto__marca').annotate(
+            pedidos=Count('pedido', distinct=True), unidades=Sum('cantidad'), total_clp=Sum('subtotal_clp'))
+        return [
+            list(Pedido.objects.values('estado').annotate(pedidos=Count('id'), **sumas).order_by()),
+            list(pedidos_periodo.annotate(dia=TruncDate('fecha_pedido')).values('dia').annotate(
+                pedidos=Count('id'), **sumas).order_by('dia')),
+            list(lineas.order_by('-total_clp')[:10]),
+            list(DetallePedido.objects.values('producto_id', 'producto__nombre').annotate(
+                pedidos=Count('pedido', distinct=True), unidades=Sum('cantidad'),
+                total_clp=Sum('subtotal_clp')).order_by('-total_clp')[:10]),
+        ]
+
+    resultados = {}
+    creados = 0
+    for cantidad in pedidos:
+        nuevos = Pedido.objects.bulk_create(Pedido(cliente=cliente) for _ in range(cantidad - creados))
+        DetallePedido.objects.bulk_create(
+            (
+                DetallePedido(pedido=pedido, producto=productos[(pedido.pk + i) % len(productos)], cantidad=2,
+                              subtotal_usd=Decimal('20.00'), subtotal_clp=Decimal('19000.00'), peso_kg=Decimal('1.00'))
+                for pedido in nuevos for i in range(lineas_por_pedido)
+            ),
+            batch_size=5000,
+        )
+        recalcular_totales(Pedido.objects.filter(pk__in=[pedido.pk for pedido in nuevos]))
+        creados = cantidad
+        _, consultas_reconstruir, tiempo_reconstruir = medir(reconstruir, 1)
+        reconstruir()
+        ids = list(Pedido.objects.order_by('-pk').values_list('pk', flat=True)[:lote_sincronizacion])
+
+        def sincronizar_lote():
+            Pedido.objects.filter(pk__in=ids).update(estado='en_proceso')
+            return sincronizar(ids)
+
+        def sincronizar_uno():
+            Pedido.objects.filter(pk=ids[0]).update(estado='en_proceso')
+            return sincronizar(ids[:1])
+
+        _, consultas_agrupando, tiempo_agrupando = medir(agrupando, repeticiones)
+        respuesta, consultas_resumenes, tiempo_resumenes = medir(lambda: api.get('/api/v1/analitica/ventas/'), repeticiones)
+        assert respuesta.status_code == 200, respuesta.status_code
+        _, consultas_uno, tiempo_uno = medir(sincronizar_uno, repeticiones)
+        _, consultas_lote, tiempo_lote = medir(sincronizar_lote, repeticiones)
+        resultados[f'{cantidad}_pedidos'] = {
+            'agrupando': {'consultas': len(consultas_agrupando), **tiempo_agrupando},
+            'resumenes': {'consultas': len(consultas_resumenes), **tiempo_resumenes},
+            'sincronizar_1_pedido': {'consultas': len(consultas_uno), **tiempo_uno},
+            f'sincronizar_{len(ids)}_pedidos': {'consultas': len(consultas_lote), **tiempo_lote},
+            'reconstruir': {'consultas': len(consultas_reconstruir), **tiempo_reconstruir},
+        }
+    return resultados
+
+
+@escenario('condicional')
+def benchmark_condicional(productos=2000, tamano_pagina=100, repeticiones=5, **opciones):
+    """Bytes enviados y tiempo de servidor del catálogo con GET condicional y compresión."""
+    clientes, _ = preparar_endpoints(productos=productos, pedidos=1, lineas=1, notificaciones=0)
+    anonimo = clientes['anonimo']
+    url = f'/api/v1/productos/?page_size={tamano_pagina}'
+    variantes = {
+        'completa': {},
+        'gzip': {'HTTP_ACCEPT_ENCODING': 'gzip'},
+        'brotli': {'HTTP_ACCEPT_ENCODING': 'br'},
+        'no_modificada': {'HTTP_IF_NONE_MATCH': anonimo.get(url)['ETag']},
+    }
+    resultados = {}
+    for nombre, cabeceras in variantes.items():
+        respuesta, consultas, tiempos = medir(lambda: anonimo.get(url, **cabeceras), repeticiones)
+        resultados[nombre] = {
+            'estado': respuesta.status_code, 'bytes': len(respuesta.content), 'consultas': len(consultas), **tiempos,
+        }
+    return resultados
+
+
+@escenario('cache_catalogo')
+def benchmark_cache_catalogo(productos=2000, repeticiones=5, **opciones):
+    """Listados anónimos del catálogo con y sin el caché de respuestas."""
+    from .cache_respuestas import cache_catalogo
+    clientes, _ = preparar_endpoints(productos=productos, pedidos=1, lineas=1, notificaciones=0)
+    anonimo = clientes['anonimo']
+    urls = [
+        '/api/v1/productos/',
+        '/api/v1/productos/?marca=Marca 1&disponible=true',
+        '/api/v1/productos/?search=producto&ordering=-precio_usd',
+    ]
+
+    def sin_cache():
+        cache_catalogo.limpiar()
+        return [anonimo.get(url) for url in urls]
+
+    _, consultas_sin_cache, tiempos_sin_cache = medir(sin_cache, repeticiones)
+    cache_catalogo.limpiar()
+    cache_catalogo.reiniciar_metricas()
+    _, consultas_con_cache, tiempos_con_cache = medir(lambda: [anonimo.get(url) for url in urls], repeticiones)
+    return {
+        'sin_cache': {'consultas': len(consultas_sin_cache), **tiempos_sin_cache},
+        'con_cache': {'consultas': len(consultas_con_cache), **tiempos_con_cache},
+        'metricas': cache_catalogo.metricas(),
+    }
+
+
+def imagen_sintetica(ancho=1600, alto=1200, calidad=90):
+    """JPEG de ``ancho`` x ``alto`` con degradado y ruido, parecido a una foto de producto."""
+    import io
+    from PIL import Image
+    degradado = Image.linear_gradient('L').resize((ancho, alto))
+    ruido = Image.effect_noise((ancho, alto), 12)
+    imagen = Image.merge('RGB', (degradado, ruido, degradado.transpose(Image.FLIP_LEFT_RIGHT)))
+    salida = io.BytesIO()
+    imagen.save(salida, format='JPEG', quality=calidad)
+    return salida.getvalue()
+
+
+@escenario('imagenes')
+def benchmark_imagenes(tamano_pagina=10, ancho_tarjeta=320, **opciones):
+    """Bytes de imagen de una página del catálogo: original frente a la variante de la tarjeta."""
+    import tempfile
+    from django.core.files.base import ContentFile
+    from django.test import override_settings
+    from .imagenes import generar_variantes
+    with tempfile.TemporaryDirectory() as directorio, override_settings(MEDIA_ROOT=directorio):
+        _, productos = crear_datos_base(productos=tamano_pagina)
+        contenido = imagen_sintetica()
+        for producto in productos:
+            producto.imagen.save(f'benchmark-{producto.pk}.jpg', ContentFile(contenido), save=False)
+        Producto.objects.bulk_update(productos, ['imagen'])
+
+        tiempos = []
+        for producto in productos:
+            inicio = time.perf_counter()
+            generar_variantes(producto.pk)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        resultados = {'original': len(contenido) * tamano_pagina, 'generacion': percentiles(tiempos)}
+        for producto in Producto.objects.filter(pk__in=[p.pk for p in productos]):
+            for formato, lista in producto.imagen_variantes['variantes'].items():
+                # La tarjeta usa la menor variante que cubra su ancho
+                tarjeta = next((v for v in lista if v['ancho'] >= ancho_tarjeta), lista[-1])
+                resultados[formato] = resultados.get(formato, 0) + tarjeta['bytes']
+        for formato in producto.imagen_variantes['variantes']:
+            resultados[f'reduccion_{formato}'] = round(1 - resultados[formato] / resultados['original'], 4)
+    return resultados
+
+
+def archivo_importacion(filas, formato='csv', desplazamiento=0):
+    """Catálogo de proveedor sintético en memoria, como lo recibiría la importación."""
+    import csv
+    import io
+    import json
+    registros = (
+        {
+            'marca': f'Proveedor {i % 50}', 'nombre': f'Articulo {i}', 'descripcion': f'Articulo importado {i}',
+            'precio_usd': f'{10 + (i + desplazamiento) % 500}.99', 'peso_kg': '0.75', 'disponible': 'true',
+        }
+        for i in range(filas)
+    )
+    if formato == 'ndjson':
+        return io.BytesIO(''.join(json.dumps(registro) + '\n' for registro in registros).encode())
+    texto = io.StringIO()
+    escritor = csv.DictWriter(texto, fieldnames=['marca', 'nombre', 'descripcion', 'precio_usd', 'peso_kg', 'disponible'])
+    escritor.writeheader()
+    escritor.writerows(registros)
+    return io.BytesIO(texto.getvalue().encode())
+
+
+@escenario('importacion')
+def benchmark_importacion(filas=100000, **opciones):
+    """Filas por segundo de la importación masiva: alta inicial y actualización de las mismas filas."""
+    from .importacion import importar_productos
+    crear_datos_base(productos=0)
+    resultados = {}
+    for nombre, formato, desplazamiento in (('csv_alta', 'csv', 0), ('csv_actualizacion', 'csv', 1),
+                                            ('ndjson_actualizacion', 'ndjson', 2)):
+        archivo = archivo_importacion(filas, formato, desplazamiento)
+        with CaptureQueriesContext(connection) as contexto:
+            inicio = time.perf_counter()
+            resultado = importar_productos(archivo, formato)
+            duracion = time.perf_counter() - inicio
+        resultados[nombre] = {
+            'filas': resultado.filas, 'guardadas': resultado.guardadas, 'con_error': resultado.con_error,
+            'consultas': len(contexto.captured_queries), 'segundos': round(duracion, 3),
+            'filas_por_segundo': round(resultado.filas / duracion),
+        }
+    return resultados
+
+
+@escenario('exportacion')
+def benchmark_exportacion(lineas=1000000, lineas_por_pedido=20, **opciones):
+    """Exportación en flujo de ``lineas`` líneas de pedido: velocidad y memoria máxima."""
+    import tracemalloc
+    from .exportacion import exportar, filas_pedidos
+    cliente, productos = crear_datos_base(productos=200)
+    for inicio in range(0, lineas, 50000):
+        pedidos = Pedido.objects.bulk_create(
+            Pedido(cliente=cliente, valor_dolar=VALOR_DOLAR)
+            for _ in range(min(50000, lineas - inicio) // lineas_por_pedido)
+        )
+        DetallePedido.objects.bulk_create(
+            (
+                DetallePedido(pedido=pedido, producto=productos[(pedido.pk + i) % len(productos)], cantidad=1,
+                              subtotal_usd=Decimal('10.00'), subtotal_clp=Decimal('9500.00'), peso_kg=Decimal('0.50'))
+                for pedido in pedidos for i in range(lineas_por_pedido)
+            ),
+            batch_size=5000,
+        )
+
+    resultados = {}
+    for formato in ('csv', 'ndjson'):
+        inicio = time.perf_counter()
+        total = sum(len(fragmento) for fragmento in exportar(filas_pedidos(), formato))
+        duracion = time.perf_counter() - inicio
+        tracemalloc.start()
+        for _ in exportar(filas_pedidos(), formato):
+            pass
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados[formato] = {
+            'lineas': lineas, 'bytes': total, 'segundos': round(duracion, 3),
+            'lineas_por_segundo': round(lineas / duracion), 'memoria_maxima_kb': round(pico / 1024),
+        }
+    return resultados
+
+
+@escenario('notificaciones')
+def benchmark_notificaciones(usuarios=1000000, **opciones):
+    """Difusión de una promoción a ``usuarios`` clientes y marcado masivo como leídas."""
+    from .models import Notificacion
+    from .notificaciones import difundir, marcar_leidas
+    for inicio in range(0, usuarios, 50000):
+        Usuario.objects.bulk_create(
+            (Usuario(username=f'benchmark-{i}', password='!') for i in range(inicio, min(usuarios, inicio + 50000))),
+            batch_size=5000,
+        )
+    # La carga de usuarios llena el registro de consultas y CaptureQueriesContext dejaría de contar
+    connection.queries_log.clear()
+    resultados = {}
+    inicio = time.perf_counter()
+    with CaptureQueriesContext(connection) as contexto:
+        creadas = difundir('Envío gratis este fin de semana')
+    duracion = time.perf_counter() - inicio
+    resultados['difusion'] = {
+        'notificaciones': creadas, 'consultas': len(contexto.captured_queries), 'segundos': round(duracion, 3),
+        'notificaciones_por_segundo': round(creadas / duracion),
+    }
+
+    cliente = Usuario.objects.get(username='benchmark-0')
+    Notificacion.objects.bulk_create(
+        Notificacion(usuario=cliente, tipo='otro', contenido=f'Aviso {i}') for i in range(1000)
+    )
+    seleccion = list(Notificacion.objects.filter(usuario=cliente).values_list('pk', flat=True)[:100])
+    for nombre, ids in (('marcar_seleccion', seleccion), ('marcar_todas', None)):
+        marcadas, consultas, tiempos = medir(lambda: marcar_leidas(cliente, ids), repeticiones=5)
+        resultados[nombre] = {'marcadas': marcadas, 'consultas': len(consultas), **tiempos}
+    return resultados
+
+
+
+@escenario('autenticacion')
+def benchmark_autenticacion(repeticiones=20, **opciones):
+    """Consultas y tiempo por petición para resolver el usuario de un JWT, con y sin caché."""
+    from django.test import RequestFactory
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from .autenticacion import JWTCacheAuthentication, invalidar_usuario
+    from .serializers import CustomTokenObtainPairSerializer
+
+    usuario = Usuario.objects.create_user(username='cliente-autenticacion', password=CLAVE_BENCHMARK)
+    acceso = str(CustomTokenObtainPairSerializer.get_token(usuario).access_token)
+    peticion = RequestFactory().get('/api/v1/users/profile/', HTTP_AUTHORIZATION=f'Bearer {acceso}')
+
+    def autenticar(clase):
+        try:
+            return clase().authenticate(peticion)
+        except AuthenticationFailed:
+            return None
+
+    resultados = {}
+    for nombre, clase in (('sin_cache', JWTAuthentication), ('con_cache', JWTCacheAuthentication)):
+        invalidar_usuario(usuario.pk)
+        autenticar(clase)
+        _, consultas, tiempos = medir(lambda: autenticar(clase), repeticiones)
+        resultados[nombre] = {'consultas': len(consultas), **tiempos}
+    resultados['consultas_ahorradas_por_peticion'] = resultados['sin_cache']['consultas'] - resultados['con_cache']['consultas']
+
+    # Cambio de contraseña: el token anterior se rechaza sin volver a la base de datos
+    usuario.set_password('Otra-clave-456')
+    usuario.save()
+    autenticar(JWTCacheAuthentication)
+    resultado, consultas, tiempos = medir(lambda: autenticar(JWTCacheAuthentication), repeticiones)
+    resultados['token_revocado'] = {'rechazado': resultado is None, 'consultas': len(consultas), **tiempos}
+    # El usuario se revierte con el escenario: no debe quedar en el caché
+    invalidar_usuario(usuario.pk)
+    return resultados
+
+
+class ConexionAsgi:
+    """Cliente HTTP mínimo que habla ASGI directo con la aplicación, sin servidor ni sockets."""
+
+    def __init__(self, aplicacion, ruta, consulta='', cabeceras=()):
+        import asyncio
+        self.estado = None
+        self.cabeceras = {}
+        self.recibidos = asyncio.Queue()
+        self._pedido_enviado = False
+        self._desconectar = asyncio.Event()
+        alcance = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': ruta, 'raw_path': ruta.encode(), 'query_string': consulta.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver'), *cabeceras], 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        self.tarea = asyncio.ensure_future(aplicacion(alcance, self._recibir, self._enviar))
+
+    async def _recibir(self):
+        if not self._pedido_enviado:
+            self._pedido_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self._desconectar.wait()
+        return {'type': 'http.disconnect'}
+
+    async def _enviar(self, mensaje):
+        if mensaje['type'] == 'http.response.start':
+            self.estado = mensaje['status']
+            self.cabeceras = {clave.decode().lower(): valor.decode() for clave, valor in mensaje['headers']}
+        elif mensaje.get('body'):
+            await self.recibidos.put(mensaje['body'])
+
+    async def siguiente(self, timeout=5):
+        """Siguiente fragmento que no sea un latido."""
+        import asyncio
+        while True:
+            fragmento = await asyncio.wait_for(self.recibidos.get(), timeout)
+            if not fragmento.startswith(b':'):
+                return fragmento
+
+    async def cerrar(self):
+        import asyncio
+        self._desconectar.set()
+        try:
+            await asyncio.wait_for(self.tarea, 5)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            pass
+
+
+@escenario('eventos')
+def benchmark_eventos(conexiones=2000, intervalo_sondeo=5, **opciones):
+    """
+    Conexiones SSE inactivas por proceso frente a clientes que consultan cada ``intervalo_sondeo`` s.
+
+    Las conexiones se abren contra la aplicación ASGI dentro del mismo proceso,
+    con un ticket cada una como el navegador. Se miden antes de crear datos:
+    los eventos se publican desde otro hilo, fuera de la transacción del
+    escenario.
+    """
+    import asyncio
+    import tracemalloc
+    from django.conf import settings
+    from django.test import override_settings
+    from backend.asgi import application
+    from .eventos import distribuidor, emitir_ticket, publicar
+
+    async def medir_sse():
+        tracemalloc.start()
+        antes, _ = tracemalloc.get_traced_memory()
+        inicio = time.perf_counter()
+        abiertas = []
+        # Por tandas, como llegan los clientes: cada ticket se canjea apenas se emite
+        for desde in range(1, conexiones + 1, 100):
+            tanda = [
+                ConexionAsgi(application, '/api/v1/eventos/', f'ticket={emitir_ticket(i)}')
+                for i in range(desde, min(desde + 100, conexiones + 1))
+            ]
+            await asyncio.gather(*(conexion.siguiente(timeout=60) for conexion in tanda))
+            abiertas.extend(tanda)
+        apertura = time.perf_counter() - inicio
+        despues, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultado = {
+            'conexiones': distribuidor.conexiones, 'apertura_s': round(apertura, 3),
+            'memoria_por_conexion_kb': round((despues - antes) / conexiones / 1024, 2),
+            'intervalo_backend_s': settings.EVENTOS_INTERVALO,
+        }
+        for nombre, usuarios in (('entrega_a_todos', None), ('entrega_por_usuario', list(range(1, conexiones + 1)))):
+            inicio = time.perf_counter()
+            await asyncio.to_thread(publicar, usuarios, 'notificacion', {'contenido': nombre})
+            await asyncio.gather(*(conexion.siguiente() for conexion in abiertas))
+            resultado[f'{nombre}_ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+        await asyncio.gather(*(conexion.cerrar() for conexion in abiertas))
+        return resultado
+
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        sse = asyncio.run(medir_sse())
+    # Sondeo: lo que cuesta cada consulta de un cliente a sus notificaciones pendientes
+    clientes, _ = preparar_endpoints(productos=2, pedidos=1, lineas=1, notificaciones=50)
+    _, consultas, tiempos = medir(lambda: clientes['cliente'].get('/api/v1/notificaciones/?leida=false'), 5)
+    return {
+        # Sin eventos nuevos cada lectura del registro es una consulta (MAX(id)), por proceso
+        'sse': {**sse, 'consultas_por_segundo': round(1 / settings.EVENTOS_INTERVALO, 2)},
+        'sondeo': {
+            'clientes': conexiones, 'intervalo_s': intervalo_sondeo, 'consultas_por_peticion': len(consultas), **tiempos,
+            'peticiones_por_segundo': round(conexiones / intervalo_sondeo, 1),
+            'consultas_por_segundo': round(conexiones * len(consultas) / intervalo_sondeo, 1),
+            'ms_de_servidor_por_segundo': round(conexiones * tiempos['p50_ms'] / intervalo_sondeo, 1),
+        },
+    }
+
+
+def comparar(base, actual, tolerancia=0.2, ruta=''):
+    """
+    Compara dos resultados de ``benchmark`` y devuelve las regresiones.
+
+    Una métrica de latencia empeora si supera la base en más de ``tolerancia``;
+    una cantidad de consultas, si simplemente aumenta.
+    """
+    regresiones = []
+    for clave, valor in actual.items():
+        anterior = base.get(clave) if isinstance(base, dict) else None
+        nombre = f'{ruta}.{clave}' if ruta else clave
+        if isinstance(valor, dict) and isinstance(anterior, dict):
+            regresiones += comparar(anterior, valor, tolerancia, nombre)
+        elif not isinstance(valor, (int, float)) or not isinstance(anterior, (int, float)):
+            continue
+        elif clave in ('p50_ms', 'p95_ms') and anterior and valor > anterior * (1 + tolerancia):
+            regresiones.append(f'{nombre}: {anterior} -> {valor}')
+        elif clave == 'consultas' and valor > anterior:
+            regresiones.append(f'{nombre}: {anterior} -> {valor}')
+    return regresiones
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+
+class _Vuelo:
+    """Cálculo en curso de una clave; los demás hilos esperan su resultado."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+
+
+class CacheRespuestas:
+    """
+    Caché LRU en memoria del proceso para cuerpos de respuesta ya renderizados.
+
+    Las claves incluyen la generación del recurso: al cambiar se descarta todo
+    lo anterior. Respeta un presupuesto de bytes desalojando lo menos usado y
+    calcula una sola vez cada clave aunque lleguen varias peticiones a la vez.
+    """
+
+    def __init__(self, max_bytes=None, espera_maxima=10):
+        self._max_bytes = max_bytes
+        self.espera_maxima = espera_maxima
+        self._bloqueo = threading.Lock()
+        self._entradas = OrderedDict()
+        self._en_vuelo = {}
+        self._generacion = None
+        self._bytes = 0
+        self.reiniciar_metricas()
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, 'CACHE_CATALOGO_MAX_BYTES', 32 * 1024 * 1024)
+
+    def reiniciar_metricas(self):
+        self._metricas = {'aciertos': 0, 'fallos': 0, 'esperas': 0, 'desalojos': 0}
+
+    def metricas(self):
+        with self._bloqueo:
+            metricas = dict(self._metricas, entradas=len(self._entradas), bytes=self._bytes)
+        consultas = metricas['aciertos'] + metricas['fallos'] + metricas['esperas']
+        metricas['proporcion_aciertos'] = (metricas['aciertos'] + metricas['esperas']) / consultas if consultas else None
+        return metricas
+
+    def limpiar(self):
+        with self._bloqueo:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def obtener(self, generacion, clave, calcular):
+        """
+        Devuelve la entrada ``(contenido, tipo)`` de ``clave`` o la calcula.
+
+        ``calcular`` puede devolver None si el resultado no debe guardarse; en
+        ese caso quienes esperaban lo calculan por su cuenta.
+        """
+        clave = (generacion, clave)
+        with self._bloqueo:
+            if generacion != self._generacion:
+                # Escritura en el catálogo: lo anterior ya no sirve
+                self._entradas.clear()
+                self._bytes = 0
+                self._generacion = generacion
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self._metricas['aciertos'] += 1
+                return entrada
+            vuelo = self._en_vuelo.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[clave] = _Vuelo()
+                self._metricas['fallos'] += 1
+            else:
+                self._metricas['esperas'] += 1
+
+        if not lider:
+            vuelo.evento.wait(self.espera_maxima)
+            return vuelo.resultado if vuelo.resultado is not None else calcular()
+
+        try:
+            vuelo.resultado = calcular()
+            if vuelo.resultado is not None:
+                self._guardar(clave, vuelo.resultado)
+            return vuelo.resultado
+        finally:
+            with self._bloqueo:
+                self._en_vuelo.pop(clave, None)
+            vuelo.evento.set()
+
+    def _guardar(self, clave, entrada):
+        tamano = len(entrada[0])
+        with self._bloqueo:
+            if clave[0] != self._generacion or tamano > self.max_bytes:
+                return
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior[0])
+            self._entradas[clave] = entrada
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, desalojada = self._entradas.popitem(last=False)
+                self._bytes -= len(desalojada[0])
+                self._metricas['desalojos'] += 1
+
+
+cache_catalogo = CacheRespuestas()
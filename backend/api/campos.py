@@ -0,0 +1,124 @@
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def _lista(valor):
+    return [parte.strip() for parte in (valor or '').split(',') if parte.strip()]
+
+
+class CamposDinamicosMixin:
+    """
+    Serializador de listado cuyos campos se eligen con ``?fields=`` y ``?expand=``.
+
+    Sin ``fields`` se envían los de ``Meta.campos_por_defecto``. ``expandibles``
+    son relaciones que reemplazan (o agregan) un campo solo si se piden en
+    ``expand``. La vista deja la selección en el contexto (``campos``,
+    ``expandir``) y usa ``preparar_queryset`` para leer solo esas columnas.
+    """
+
+    # {campo: función que crea el serializador anidado}
+    expandibles = {}
+
+    @classmethod
+    def elegir(cls, fields=None, expand=None):
+        """Valida ``?fields=`` / ``?expand=`` y devuelve ``(campos, expandir)``."""
+        disponibles = list(cls.Meta.fields)
+        campos, expandir = _lista(fields), _lista(expand)
+        errores = {}
+        desconocidos = [campo for campo in campos if campo not in disponibles]
+        if desconocidos:
+            errores['fields'] = f"Campos desconocidos: {', '.join(desconocidos)}. Disponibles: {', '.join(disponibles)}."
+        no_expandibles = [campo for campo in expandir if campo not in cls.expandibles]
+        if no_expandibles:
+            errores['expand'] = (f"No se puede expandir: {', '.join(no_expandibles)}. "
+                                 f"Expandibles: {', '.join(cls.expandibles) or 'ninguno'}.")
+        if errores:
+            raise ValidationError(errores)
+        campos = campos or list(cls.Meta.campos_por_defecto)
+        return [campo for campo in disponibles if campo in campos or campo in expandir], expandir
+
+    @classmethod
+    def columnas(cls, campos):
+        """Columnas del modelo que necesitan ``campos`` (siempre incluye la clave primaria)."""
+        modelo = cls.Meta.model
+        concretos = {campo.name for campo in modelo._meta.concrete_fields}
+        extra = getattr(cls.Meta, 'columnas', {})
+        columnas = {modelo._meta.pk.name}
+        for campo in campos:
+            columnas.update(extra.get(campo, [campo] if campo in concretos else []))
+        return columnas
+
+    @classmethod
+    def lectores(cls, construir_url=None):
+        """Valor de cada campo calculado a partir de una fila de ``values()`` (lo usa ``api.lectura``)."""
+        return {}
+
+    @classmethod
+    def expandir_queryset(cls, queryset, relacion):
+        """Agrega al queryset lo que necesita ``relacion``; devuelve ``(queryset, columnas)``."""
+        return queryset, set()
+
+    @classmethod
+    def preparar_queryset(cls, queryset, campos, expandir, columnas_extra=()):
+        """Lee solo las columnas de ``campos`` y carga solo las relaciones expandidas."""
+        columnas = cls.columnas(campos) | set(columnas_extra)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        for relacion in expandir:
+            queryset, columnas_relacion = cls.expandir_queryset(queryset, relacion)
+            columnas |= columnas_relacion
+        return queryset.only(*columnas)
+
+    def get_fields(self):
+        campos = super().get_fields()
+        # Solo el serializador del listado; los anidados conservan sus campos
+        if self.parent is not None and not isinstance(self.parent, serializers.ListSerializer):
+            return campos
+        elegidos = self.context.get('campos')
+        expandir = self.context.get('expandir', ())
+        if elegidos is None:
+            elegidos, expandir = self.elegir()
+        for nombre in expandir:
+            campos[nombre] = self.expandibles[nombre]()
+        return {nombre: campo for nombre, campo in campos.items() if nombre in elegidos}
+
+
+class CamposDinamicosViewMixin:
+    """
+    Usa ``serializer_lista_class`` en el listado, con ``?fields=`` y ``?expand=``.
+
+    La consulta del listado lee solo las columnas y relaciones pedidas; el
+    detalle, la creación y la edición siguen con ``serializer_class``.
+    """
+
+    serializer_lista_class = None
+
+    def es_listado(self):
+        return getattr(self, 'action', None) == 'list' and self.serializer_lista_class is not None
+
+    def seleccion_campos(self):
+        if not hasattr(self, '_seleccion_campos'):
+            parametros = self.request.query_params
+            self._seleccion_campos = self.serializer_lista_class.elegir(parametros.get('fields'), parametros.get('expand'))
+        return self._seleccion_campos
+
+    def get_serializer_class(self):
+        if self.es_listado():
+            return self.serializer_lista_class
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        contexto = super().get_serializer_context()
+        if self.es_listado() and getattr(self, 'request', None) is not None:
+            contexto['campos'], contexto['expandir'] = self.seleccion_campos()
+        return contexto
+
+    def columnas_orden(self):
+        # Se leen para que la paginación por cursor no recargue la fila
+        return {campo.lstrip('-') for campo in [*getattr(self, 'ordering_fields', []), *(getattr(self, 'ordering', None) or [])]}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.es_listado() or getattr(self, 'swagger_fake_view', False):
+            return queryset
+        campos, expandir = self.seleccion_campos()
+        return self.serializer_lista_class.preparar_queryset(queryset, campos, expandir, self.columnas_orden())
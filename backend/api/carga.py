@@ -0,0 +1,88 @@
+"""
+Prueba de carga por HTTP contra un servidor en ejecución (``manage.py prueba_carga``).
+
+A diferencia de ``api.benchmarks``, que mide dentro del proceso, aquí se mide
+el servidor completo: workers, hilos y conexiones a la base de datos. Las
+escrituras (checkout) quedan en la base y el comando las borra al terminar.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from .benchmarks import percentiles
+
+ESCENARIOS = ['productos', 'checkout']
+
+
+def percentil(ordenados, proporcion):
+    return round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * proporcion))], 3)
+
+
+def medir_carga(peticion, concurrencia=16, duracion=10, calentamiento=2):
+    """
+    Ejecuta ``peticion(sesion)`` en ``concurrencia`` hilos durante ``duracion`` s.
+
+    Cada hilo usa su propia sesión HTTP con keep-alive. Lo que ocurre durante
+    el ``calentamiento`` no se cuenta. ``peticion`` devuelve True si la
+    respuesta fue la esperada.
+    """
+    fin_calentamiento = time.perf_counter() + calentamiento
+    fin = fin_calentamiento + duracion
+
+    def trabajador(_):
+        sesion = requests.Session()
+        tiempos, errores = [], 0
+        while (inicio := time.perf_counter()) < fin:
+            try:
+                correcta = peticion(sesion)
+            except requests.RequestException:
+                correcta = False
+            if inicio < fin_calentamiento:
+                continue
+            if correcta:
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            else:
+                errores += 1
+        return tiempos, errores
+
+    with ThreadPoolExecutor(concurrencia) as ejecutor:
+        resultados = list(ejecutor.map(trabajador, range(concurrencia)))
+    tiempos = sorted(tiempo for parcial, _ in resultados for tiempo in parcial)
+    errores = sum(errores for _, errores in resultados)
+    if not tiempos:
+        return {'peticiones': 0, 'errores': errores}
+    return {
+        'peticiones': len(tiempos), 'errores': errores,
+        'peticiones_por_segundo': round(len(tiempos) / duracion, 1),
+        **percentiles(tiempos), 'p99_ms': percentil(tiempos, 0.99),
+    }
+
+
+def peticiones(url_base, token, productos):
+    """Funciones ``peticion(sesion)`` de cada escenario."""
+    url_base = url_base.rstrip('/')
+    autorizacion = {'Authorization': f'Bearer {token}'}
+    detalles = [{'producto': pk, 'cantidad': 1} for pk in productos[:3]]
+
+    def listar_productos(sesion):
+        return sesion.get(f'{url_base}/api/v1/productos/', timeout=30).status_code == 200
+
+    def checkout(sesion):
+        respuesta = sesion.post(f'{url_base}/api/v1/pedidos/', json={'detalles': detalles},
+                                headers=autorizacion, timeout=30)
+        return respuesta.status_code == 201
+
+    return {'productos': listar_productos, 'checkout': checkout}
+
+
+def comparar_carga(base, actual):
+    """Líneas legibles con el cambio de throughput y p99 de cada escenario."""
+    lineas = []
+    for nombre, medicion in actual.items():
+        anterior = base.get(nombre)
+        if not isinstance(medicion, dict) or not isinstance(anterior, dict) or 'p99_ms' not in medicion:
+            continue
+        lineas.append(
+            f"{nombre}: {anterior.get('peticiones_por_segundo')} -> {medicion['peticiones_por_segundo']} pet/s, "
+            f"p99 {anterior.get('p99_ms')} -> {medicion['p99_ms']} ms"
+        )
+    return lineas
@@ -0,0 +1,116 @@
+import hashlib
+import json
+from functools import partial
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, urlencode
+from rest_framework.response import Response
+from .models import VersionColeccion
+
+
+def etag_recurso(request, *partes):
+    """ETag débil a partir del sello del recurso y de la representación pedida."""
+    clave = ':'.join(str(parte) for parte in (*partes, request.get_full_path(), request.accepted_renderer.format))
+    return 'W/"%s"' % hashlib.md5(clave.encode()).hexdigest()
+
+
+def consulta_normalizada(request):
+    """Parámetros de la consulta ordenados y sin valores vacíos."""
+    return urlencode(sorted(
+        (clave, valor) for clave, valores in request.query_params.lists() for valor in valores if valor != ''
+    ))
+
+
+class RespuestaCacheada(Response):
+    """Respuesta con el cuerpo ya renderizado; ``data`` se decodifica solo si se pide."""
+
+    def __init__(self, contenido, content_type):
+        super().__init__(content_type=content_type)
+        self._contenido = contenido
+        self['Content-Type'] = content_type
+
+    @property
+    def data(self):
+        if self._data is None and getattr(self, '_contenido', None):
+            self._data = json.loads(self._contenido)
+        return self._data
+
+    @data.setter
+    def data(self, valor):
+        self._data = valor
+
+    @property
+    def rendered_content(self):
+        return self._contenido
+
+
+class RespuestaCondicionalMixin:
+    """
+    GET condicional (ETag / Last-Modified) para listados y detalles.
+
+    El listado se sella con la versión de ``coleccion`` y el detalle con
+    ``fecha_modificacion`` del objeto. Si el cliente ya tiene la versión vigente
+    se responde 304 sin serializar el recurso (ni consultarlo, en el listado).
+
+    Con ``cache_respuestas`` los listados anónimos se sirven ya renderizados
+    desde memoria mientras la versión de la colección no cambie.
+    """
+
+    coleccion = None
+    # CacheRespuestas para los listados anónimos en JSON; None lo desactiva
+    cache_respuestas = None
+
+    def list(self, request, *args, **kwargs):
+        version, modificado = VersionColeccion.obtener(self.coleccion)
+        etag = etag_recurso(request, self.coleccion, version)
+        generar = partial(super().list, request, *args, **kwargs)
+        # Sin fila de versión no hay generación que distinga un catálogo de otro
+        if self.cache_respuestas is not None and modificado is not None and self._listado_cacheable(request):
+            # La fecha evita reutilizar un número de versión revertido por un rollback
+            generar = partial(self._listar_con_cache, request, (version, modificado), generar)
+        return self._responder_condicional(request, etag, modificado, generar)
+
+    def _listado_cacheable(self, request):
+        return not request.user.is_authenticated and request.accepted_renderer.format == 'json'
+
+    def _listar_con_cache(self, request, generacion, generar):
+        calculada = []
+
+        def calcular():
+            respuesta = generar()
+            calculada.append(respuesta)
+            if respuesta.status_code != 200:
+                return None
+            if isinstance(respuesta, RespuestaCacheada):
+                # La lectura rápida ya entrega el cuerpo renderizado
+                return respuesta.rendered_content, request.accepted_media_type
+            contenido = request.accepted_renderer.render(
+                respuesta.data, request.accepted_media_type, self.get_renderer_context())
+            return contenido, request.accepted_media_type
+
+        # Los enlaces de paginación y las URLs de imágenes son absolutas: dependen del host y del esquema
+        clave = (request.scheme, request.get_host(), consulta_normalizada(request))
+        entrada = self.cache_respuestas.obtener(generacion, clave, calcular)
+        if calculada:
+            return calculada[0]
+        return RespuestaCacheada(*entrada)
+
+    def retrieve(self, request, *args, **kwargs):
+        instancia = self.get_object()
+        modificado = instancia.fecha_modificacion
+        etag = etag_recurso(request, self.coleccion, instancia.pk, modificado.timestamp())
+        return self._responder_condicional(
+            request, etag, modificado, lambda: Response(self.get_serializer(instancia).data))
+
+    def _responder_condicional(self, request, etag, modificado, generar):
+        ultima_modificacion = int(modificado.timestamp()) if modificado else None
+        respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if respuesta is None:
+            respuesta = generar()
+        if respuesta.status_code not in (200, 304):
+            return respuesta
+        respuesta['ETag'] = etag
+        if ultima_modificacion is not None:
+            respuesta['Last-Modified'] = http_date(ultima_modificacion)
+        # El navegador puede guardar la respuesta pero debe revalidarla siempre
+        patch_cache_control(respuesta, no_cache=True)
+        return respuesta
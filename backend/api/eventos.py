@@ -0,0 +1,322 @@
+import asyncio
+import json
+import secrets
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .autenticacion import token_revocado, usuario_en_cache
+from .models import Evento
+
+# Marca en la cola de una conexión: la secuencia volvió a empezar
+REINICIO = object()
+
+# Tipo de los eventos que agrupan varios: ``datos`` es ``{"<usuario_id>": [evento, ...]}``
+LOTE = 'lote'
+
+
+class BackendBaseDatos:
+    """
+    Pub/sub sobre la tabla ``Evento``, sin servicios externos.
+
+    La secuencia de la tabla numera los eventos de forma atómica entre todos
+    los procesos (web, worker) y las filas no se descartan antes de
+    ``EVENTOS_RETENCION`` segundos. Los eventos son avisos: uno confirmado
+    después de otro con número mayor puede no llegar a las conexiones
+    abiertas, y el cliente vuelve a consultar la API.
+    """
+
+    def publicar(self, usuarios, evento):
+        """Publica ``evento`` para una lista de ids de usuario (None: todos); devuelve su número."""
+        ahora = timezone.now()
+        # Un error no debe invalidar la transacción de quien publica
+        with transaction.atomic():
+            numero = Evento.objects.create(
+                usuarios=list(usuarios) if usuarios is not None else None,
+                tipo=evento['tipo'], datos=evento['datos'], fecha_creacion=ahora,
+            ).pk
+            retencion = getattr(settings, 'EVENTOS_RETENCION', 300)
+            # Se conserva siempre el recién creado: el último número no retrocede
+            Evento.objects.filter(fecha_creacion__lt=ahora - timedelta(seconds=retencion), pk__lt=numero).delete()
+        return numero
+
+    def ultimo(self):
+        return Evento.objects.aggregate(ultimo=Max('pk'))['ultimo'] or 0
+
+    def leer_desde(self, cursor):
+        """
+        Eventos posteriores a ``cursor``: ``([(numero, usuarios, evento), ...], ultimo)``.
+
+        Un ``ultimo`` menor que ``cursor`` indica que la secuencia volvió a
+        empezar (tabla vaciada) y que conviene leer desde cero.
+        """
+        ultimo = self.ultimo()
+        if ultimo <= cursor:
+            return [], ultimo
+        # Un cursor muy atrasado solo recupera los últimos EVENTOS_MAX_PENDIENTES
+        desde = max(cursor, ultimo - getattr(settings, 'EVENTOS_MAX_PENDIENTES', 1000))
+        filas = Evento.objects.filter(pk__gt=desde, pk__lte=ultimo).order_by('pk').values_list(
+            'pk', 'usuarios', 'tipo', 'datos')
+        return [(numero, usuarios, {'tipo': tipo, 'datos': datos}) for numero, usuarios, tipo, datos in filas], ultimo
+
+
+def en_hilo(funcion):
+    """
+    ``funcion`` como corrutina en un hilo del ejecutor.
+
+    La conexión a la base de datos del hilo se cierra (o vuelve al pool) al
+    terminar: esos hilos no pasan por el fin de petición que la cerraría.
+    """
+    def ejecutar(*args):
+        try:
+            return funcion(*args)
+        finally:
+            connection.close()
+    return sync_to_async(ejecutar, thread_sensitive=False)
+
+
+backend = BackendBaseDatos()
+
+
+def publicar(usuarios, tipo, datos):
+    """Publica un evento para una lista de ids de usuario (None: todos); devuelve su número."""
+    try:
+        return backend.publicar(usuarios, {'tipo': tipo, 'datos': datos})
+    except Exception as e:
+        # Un evento perdido no debe romper la escritura que lo originó
+        print(f"Error al publicar el evento {tipo}: {e}")
+        return None
+
+
+def publicar_varios(eventos):
+    """
+    Publica una lista de ``(usuarios, tipo, datos)`` como un solo evento ``LOTE``.
+
+    Cada conexión recibe solo los eventos de su usuario, todos con el número
+    del lote. Devuelve ese número.
+    """
+    if not eventos:
+        return None
+    por_usuario = defaultdict(list)
+    for usuarios, tipo, datos in eventos:
+        for usuario_id in usuarios:
+            por_usuario[str(usuario_id)].append({'tipo': tipo, 'datos': datos})
+    return publicar(sorted(int(usuario_id) for usuario_id in por_usuario), LOTE, dict(por_usuario))
+
+
+class Distribuidor:
+    """
+    Reparte los eventos del backend entre las conexiones abiertas del proceso.
+
+    Una sola tarea lee el backend cada ``EVENTOS_INTERVALO`` segundos para
+    todas las conexiones; cada conexión solo tiene una cola en memoria. Si la
+    cola de un cliente lento se llena se le cierra la conexión y, al
+    reconectar con ``Last-Event-ID``, recupera lo que perdió.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.suscripciones = defaultdict(set)
+        self._loop = None
+        self._tarea = None
+        self._listo = None
+
+    @property
+    def conexiones(self):
+        return sum(len(colas) for colas in self.suscripciones.values())
+
+    @asynccontextmanager
+    async def suscribir(self, usuario_id):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Un loop nuevo (p. ej. otro asyncio.run) no hereda las colas del anterior
+            self.suscripciones.clear()
+            self._loop, self._tarea = loop, None
+        cola = asyncio.Queue(maxsize=getattr(settings, 'EVENTOS_COLA', 100))
+        self.suscripciones[usuario_id].add(cola)
+        if self._tarea is None or self._tarea.done():
+            # Sin await entre la comprobación y la creación: una sola tarea por loop
+            self._listo = asyncio.Event()
+            self._tarea = loop.create_task(self._ciclo(self._listo))
+        try:
+            # Hasta que el lector fije su cursor, lo que se publique podría quedar atrás
+            await self._listo.wait()
+            yield cola
+        finally:
+            colas = self.suscripciones.get(usuario_id)
+            if colas is not None:
+                colas.discard(cola)
+                if not colas:
+                    del self.suscripciones[usuario_id]
+
+    async def _ciclo(self, listo):
+        leer = en_hilo(self.backend.leer_desde)
+        cursor = None
+        while self.suscripciones:
+            try:
+                if cursor is None:
+                    # Lo publicado antes de la primera conexión no se reparte
+                    cursor = await en_hilo(self.backend.ultimo)()
+                    listo.set()
+                else:
+                    eventos, ultimo = await leer(cursor)
+                    if ultimo < cursor:
+                        self.reiniciar()
+                        eventos, ultimo = await leer(0)
+                    cursor = ultimo
+                    for numero, usuarios, evento in eventos:
+                        self.repartir(numero, usuarios, evento)
+            except Exception as e:
+                print(f"Error al leer los eventos: {e}")
+            await asyncio.sleep(getattr(settings, 'EVENTOS_INTERVALO', 0.5))
+
+    def repartir(self, numero, usuarios, evento):
+        if usuarios is None:
+            destinos = list(self.suscripciones)
+        elif len(usuarios) > len(self.suscripciones):
+            buscados = set(usuarios)
+            destinos = [usuario for usuario in self.suscripciones if usuario in buscados]
+        else:
+            destinos = [usuario for usuario in usuarios if usuario in self.suscripciones]
+        for usuario in destinos:
+            for cola in self.suscripciones.get(usuario, ()):
+                self._encolar(cola, (numero, evento))
+
+    def reiniciar(self):
+        """Avisa a todas las conexiones que los números vuelven a empezar."""
+        for colas in self.suscripciones.values():
+            for cola in colas:
+                self._encolar(cola, REINICIO)
+
+    @staticmethod
+    def _encolar(cola, elemento):
+        try:
+            cola.put_nowait(elemento)
+        except asyncio.QueueFull:
+            # Se vacía y se marca el cierre: el cliente reconecta y recupera
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(None)
+
+
+distribuidor = Distribuidor(backend)
+
+
+def formatear(numero, evento, usuario_id):
+    """Mensajes SSE de ``evento`` para ``usuario_id``; un lote da uno por cada evento del usuario."""
+    eventos = evento['datos'].get(str(usuario_id), []) if evento['tipo'] == LOTE else [evento]
+    return ''.join(
+        f"id: {numero}\nevent: {evento['tipo']}\n"
+        f"data: {json.dumps(evento['datos'], cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+        for evento in eventos
+    )
+
+
+async def flujo_eventos(usuario_id, ultimo_id=None):
+    async with distribuidor.suscribir(usuario_id) as cola:
+        yield f"retry: {getattr(settings, 'EVENTOS_REINTENTO_MS', 3000)}\n\n"
+        enviado = ultimo_id or 0
+        if ultimo_id is not None:
+            leer = en_hilo(backend.leer_desde)
+            pendientes, ultimo = await leer(ultimo_id)
+            if ultimo < ultimo_id:
+                # El cliente viene de antes de que la secuencia volviera a empezar
+                enviado = 0
+                pendientes, _ = await leer(0)
+            for numero, usuarios, evento in pendientes:
+                if usuarios is None or usuario_id in usuarios:
+                    enviado = numero
+                    yield formatear(numero, evento, usuario_id)
+        latido = getattr(settings, 'EVENTOS_LATIDO', 15)
+        while True:
+            try:
+                elemento = await asyncio.wait_for(cola.get(), timeout=latido)
+            except asyncio.TimeoutError:
+                # Mantiene viva la conexión frente a proxies con timeout de inactividad
+                yield ': latido\n\n'
+                continue
+            if elemento is None:
+                return
+            if elemento is REINICIO:
+                enviado = 0
+                continue
+            numero, evento = elemento
+            if numero > enviado:
+                enviado = numero
+                yield formatear(numero, evento, usuario_id)
+
+
+def clave_ticket(ticket):
+    return f'eventos:ticket:{ticket}'
+
+
+def emitir_ticket(usuario_id):
+    """Ticket de un solo uso que abre el flujo de eventos de ``usuario_id`` por ``EVENTOS_TICKET_TTL`` segundos."""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(clave_ticket(ticket), usuario_id, getattr(settings, 'EVENTOS_TICKET_TTL', 30))
+    return ticket
+
+
+def canjear_ticket(ticket):
+    """Usuario del ticket, que deja de servir; None si no existe, venció o ya se usó."""
+    clave = clave_ticket(ticket)
+    usuario_id = cache.get(clave)
+    # Solo quien lo borra lo usa: dos conexiones con el mismo ticket no pasan ambas
+    if usuario_id is None or not cache.delete(clave):
+        return None
+    return usuario_id
+
+
+def usuario_del_token(request):
+    """
+    Id del usuario según el access token JWT de la cabecera Authorization.
+
+    No consulta la base de datos; si el usuario está en el caché de
+    autenticación se rechazan los tokens revocados.
+    """
+    autenticacion = JWTAuthentication()
+    cabecera = autenticacion.get_header(request)
+    crudo = autenticacion.get_raw_token(cabecera) if cabecera else None
+    if not crudo:
+        return None
+    try:
+        token = autenticacion.get_validated_token(crudo)
+    except (InvalidToken, TokenError):
+        return None
+    usuario_id = token.get(jwt_settings.USER_ID_CLAIM)
+    usuario = usuario_en_cache(usuario_id)
+    if usuario is not None and (not usuario.is_active or token_revocado(token, usuario)):
+        return None
+    return usuario_id
+
+
+async def vista_eventos(request):
+    """
+    Server-Sent Events con las notificaciones nuevas y los cambios de estado de los pedidos.
+
+    EventSource no permite cabeceras: el navegador pide un ticket con
+    ``POST eventos/ticket/`` y lo pasa en ``?ticket=``. El JWT no viaja en la
+    URL, que queda en los registros de acceso. Otros clientes pueden usar la
+    cabecera Authorization.
+    """
+    ticket = request.GET.get('ticket')
+    usuario_id = canjear_ticket(ticket) if ticket else usuario_del_token(request)
+    if usuario_id is None:
+        return JsonResponse({'detail': 'Ticket o token inválido o ausente.'}, status=401)
+    ultimo_id = request.headers.get('Last-Event-ID') or request.GET.get('ultimo')
+    ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+    respuesta = StreamingHttpResponse(flujo_eventos(int(usuario_id), ultimo_id), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    # Evita que nginx acumule el flujo antes de enviarlo
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
@@ -0,0 +1,126 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework import renderers, serializers
+from .models import Pedido
+
+FORMATOS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+# Una fila por línea de pedido: (columna, campo de Pedido.objects.values_list)
+COLUMNAS = [
+    ('pedido_id', 'id'),
+    ('fecha_pedido', 'fecha_pedido'),
+    ('estado', 'estado'),
+    ('cliente_id', 'cliente_id'),
+    ('cliente_username', 'cliente__username'),
+    ('cliente_email', 'cliente__email'),
+    ('total_usd', 'total_usd'),
+    ('total_clp', 'total_clp'),
+    ('total_final_clp', 'total_final_clp'),
+    ('peso_total_kg', 'peso_total_kg'),
+    ('valor_dolar', 'valor_dolar'),
+    ('detalle_id', 'detalles__id'),
+    ('producto_id', 'detalles__producto_id'),
+    ('producto_marca', 'detalles__producto__marca'),
+    ('producto_nombre', 'detalles__producto__nombre'),
+    ('cantidad', 'detalles__cantidad'),
+    ('subtotal_usd', 'detalles__subtotal_usd'),
+    ('subtotal_clp', 'detalles__subtotal_clp'),
+    ('peso_kg', 'detalles__peso_kg'),
+]
+
+
+class FiltrosExportacionSerializer(serializers.Serializer):
+    formato = serializers.ChoiceField(choices=list(FORMATOS), default='csv')
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    estado = serializers.ListField(
+        child=serializers.ChoiceField(choices=[codigo for codigo, _ in Pedido.ESTADOS_PEDIDO]), required=False)
+
+    def to_internal_value(self, data):
+        # ?estado=enviado,entregado
+        if isinstance(data.get('estado'), str):
+            data = {**data, 'estado': [estado for estado in data['estado'].split(',') if estado]}
+        return super().to_internal_value(data)
+
+    def validate(self, data):
+        if data.get('desde') and data.get('hasta') and data['desde'] > data['hasta']:
+            raise serializers.ValidationError('La fecha desde no puede ser posterior a la fecha hasta.')
+        return data
+
+
+class RenderizadorArchivo(renderers.BaseRenderer):
+    """Acepta cualquier ``Accept`` en las descargas; los errores salen como JSON."""
+    media_type = '*/*'
+    format = 'archivo'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode() if data is not None else b''
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def filas_pedidos(desde=None, hasta=None, estado=None, tamano_lote=None):
+    """
+    Recorre las líneas de los pedidos como tuplas en el orden de ``COLUMNAS``.
+
+    Una sola consulta con los joins a cliente, detalles y producto, leída con
+    un cursor del servidor en bloques de ``tamano_lote``: la memoria no crece
+    con el tamaño de la tabla. Los pedidos sin líneas salen con esas columnas
+    vacías. ``desde`` y ``hasta`` son fechas locales inclusivas.
+    """
+    pedidos = Pedido.objects.all()
+    if desde:
+        pedidos = pedidos.filter(fecha_pedido__gte=_inicio_del_dia(desde))
+    if hasta:
+        pedidos = pedidos.filter(fecha_pedido__lt=_inicio_del_dia(hasta + timedelta(days=1)))
+    if estado:
+        pedidos = pedidos.filter(estado__in=estado)
+    filas = pedidos.order_by('id', 'detalles__id').values_list(*(campo for _, campo in COLUMNAS))
+    return filas.iterator(chunk_size=tamano_lote or getattr(settings, 'EXPORTACION_TAMANO_LOTE', 2000))
+
+
+class _Eco:
+    """Destino de csv.writer que devuelve la línea en vez de escribirla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _en_bloques(textos, tamano):
+    # Agrupa las líneas para no enviar un fragmento HTTP por fila
+    bloque = []
+    for texto in textos:
+        bloque.append(texto)
+        if len(bloque) >= tamano:
+            yield ''.join(bloque).encode()
+            bloque = []
+    if bloque:
+        yield ''.join(bloque).encode()
+
+
+def exportar(filas, formato, filas_por_bloque=500):
+    """Genera el archivo en fragmentos de bytes a partir de ``filas_pedidos``."""
+    columnas = [columna for columna, _ in COLUMNAS]
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        textos = (escritor.writerow(fila) for fila in filas)
+        return _en_bloques(_con_cabecera(escritor.writerow(columnas), textos), filas_por_bloque)
+    codificador = DjangoJSONEncoder(ensure_ascii=False)
+    textos = (codificador.encode(dict(zip(columnas, fila))) + '\n' for fila in filas)
+    return _en_bloques(textos, filas_por_bloque)
+
+
+def _con_cabecera(cabecera, textos):
+    yield cabecera
+    yield from textos
+
+
+def nombre_archivo(formato, desde=None, hasta=None):
+    rango = '-'.join(fecha.isoformat() for fecha in (desde, hasta) if fecha)
+    return f"pedidos{'-' + rango if rango else ''}.{formato}"
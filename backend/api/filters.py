@@ -0,0 +1,38 @@
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from rest_framework import filters
+
+
+class BusquedaProductoFilter(filters.SearchFilter):
+    """
+    Búsqueda de productos con el mismo parámetro ``?search=`` de SearchFilter.
+
+    En PostgreSQL usa la columna ``busqueda`` (tsvector en español con índice
+    GIN) con coincidencia por prefijo, y la similitud de trigramas sobre
+    ``nombre`` para tolerar errores de tipeo (desde
+    ``BUSQUEDA_SIMILITUD_MINIMA``). Sin ``?ordering=`` explícito los
+    resultados se ordenan por relevancia. En otros motores se usa el
+    ``icontains`` de SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        termino = ' '.join(self.get_search_terms(request))
+        if not termino or connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        palabras = re.findall(r'\w+', termino)
+        if not palabras:
+            return queryset.none()
+        consulta = SearchQuery(' & '.join(f'{palabra}:*' for palabra in palabras), config='spanish', search_type='raw')
+        # Umbral explícito: el de pg_trgm (word_similarity_threshold, 0.6) descarta errores de una letra
+        minima = getattr(settings, 'BUSQUEDA_SIMILITUD_MINIMA', 0.3)
+        queryset = queryset.annotate(similitud=TrigramWordSimilarity(termino, 'nombre')).annotate(
+            relevancia=SearchRank(F('busqueda'), consulta) + F('similitud'),
+        ).filter(Q(busqueda=consulta) | Q(similitud__gt=minima))
+
+        if not request.query_params.get(filters.OrderingFilter.ordering_param):
+            queryset = queryset.order_by('-relevancia', 'id')
+        return queryset
@@ -0,0 +1,121 @@
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .models import Producto, VersionColeccion
+
+EXTENSIONES = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def anchos():
+    return getattr(settings, 'IMAGEN_ANCHOS', [160, 320, 640, 1024])
+
+
+def formatos():
+    return getattr(settings, 'IMAGEN_FORMATOS', ['webp', 'jpeg'])
+
+
+def _preparar(imagen, formato):
+    # JPEG no admite transparencia: se aplana sobre fondo blanco
+    if formato == 'jpeg' and imagen.mode != 'RGB':
+        fondo = Image.new('RGB', imagen.size, 'white')
+        if imagen.mode in ('RGBA', 'LA', 'P'):
+            imagen = imagen.convert('RGBA')
+            fondo.paste(imagen, mask=imagen.getchannel('A'))
+        else:
+            fondo.paste(imagen.convert('RGB'))
+        return fondo
+    if formato == 'webp' and imagen.mode not in ('RGB', 'RGBA'):
+        return imagen.convert('RGBA' if 'A' in imagen.getbands() or imagen.mode == 'P' else 'RGB')
+    return imagen
+
+
+def crear_variantes(contenido, prefijo):
+    """
+    Genera las variantes redimensionadas de una imagen y las guarda.
+
+    Nunca se amplía la imagen: los anchos mayores al original se omiten y, si
+    el original es más angosto que todos, se guarda una variante a su tamaño.
+    Devuelve ``{formato: [{'nombre', 'ancho', 'alto', 'bytes'}, ...]}``.
+    """
+    calidad = getattr(settings, 'IMAGEN_CALIDAD', 80)
+    with Image.open(contenido) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    medidas = [ancho for ancho in sorted(anchos()) if ancho < original.width] or [original.width]
+    if original.width not in medidas and original.width < max(anchos()):
+        medidas.append(original.width)
+
+    variantes = {}
+    for formato in formatos():
+        base = _preparar(original, formato)
+        for ancho in medidas:
+            alto = max(1, round(original.height * ancho / original.width))
+            redimensionada = base if ancho == original.width else base.resize((ancho, alto), Image.LANCZOS)
+            salida = io.BytesIO()
+            redimensionada.save(salida, format=formato.upper(), quality=calidad, optimize=True)
+            nombre = default_storage.save(f'{prefijo}-{ancho}.{EXTENSIONES[formato]}', ContentFile(salida.getvalue()))
+            variantes.setdefault(formato, []).append(
+                {'nombre': nombre, 'ancho': ancho, 'alto': alto, 'bytes': salida.tell()})
+    return variantes
+
+
+def _borrar(variantes):
+    for lista in variantes.get('variantes', {}).values():
+        for variante in lista:
+            default_storage.delete(variante['nombre'])
+
+
+def generar_variantes(producto_id, forzar=False):
+    """
+    Crea las variantes de la imagen de un producto fuera del ciclo de la petición.
+
+    Se guardan solo si la imagen no cambió mientras se procesaba; las variantes
+    anteriores se eliminan. Devuelve True si el producto quedó actualizado.
+    """
+    fila = Producto.objects.filter(pk=producto_id).values('imagen', 'imagen_variantes').first()
+    if fila is None:
+        return False
+    origen, anteriores = fila['imagen'] or '', fila['imagen_variantes'] or {}
+    if anteriores.get('origen', '') == origen and not forzar:
+        return False
+
+    nuevas = {}
+    if origen:
+        prefijo = f'productos/variantes/{producto_id}/{os.path.splitext(os.path.basename(origen))[0]}'
+        with default_storage.open(origen, 'rb') as archivo:
+            nuevas = {'origen': origen, 'variantes': crear_variantes(archivo, prefijo)}
+
+    actualizado = Producto.objects.filter(pk=producto_id, imagen=origen).update(
+        imagen_variantes=nuevas, fecha_modificacion=timezone.now())
+    if not actualizado:
+        # La imagen cambió durante el proceso; la siguiente ejecución la tomará
+        _borrar(nuevas)
+        return False
+    _borrar(anteriores)
+    VersionColeccion.incrementar(VersionColeccion.PRODUCTOS)
+    return True
+
+
+def url_variante(variante, construir_url=None):
+    url = default_storage.url(variante['nombre'])
+    return construir_url(url) if construir_url else url
+
+
+def variantes_con_url(variantes, construir_url=None):
+    """``{formato: [{url, ancho, alto}, ...]}`` de menor a mayor ancho."""
+    return {
+        formato: [{'url': url_variante(v, construir_url), 'ancho': v['ancho'], 'alto': v['alto']} for v in lista]
+        for formato, lista in variantes.get('variantes', {}).items()
+    }
+
+
+def srcset(variantes, construir_url=None):
+    """Valor de ``srcset`` por formato: ``{'webp': 'url 160w, url 320w', ...}``."""
+    return {
+        formato: ', '.join(f"{url_variante(v, construir_url)} {v['ancho']}w" for v in lista)
+        for formato, lista in variantes.get('variantes', {}).items()
+    }
@@ -0,0 +1,188 @@
+import codecs
+import csv
+import json
+import logging
+from itertools import islice
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+from .models import Configuracion, Producto, VersionColeccion
+from .precios import factor_clp
+from .serializers import CAMPOS_IMPORTACION, ProductoImportacionSerializer
+
+FORMATOS = ('csv', 'ndjson')
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorImportacion(ValueError):
+    """El archivo completo no se puede importar (formato o cabecera inválidos)."""
+
+
+def detectar_formato(nombre='', content_type=''):
+    """Formato a partir de la extensión del archivo o del Content-Type."""
+    nombre, content_type = (nombre or '').lower(), (content_type or '').lower()
+    if nombre.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    if nombre.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def leer_filas(archivo, formato):
+    """
+    Recorre un archivo binario fila por fila: ``(numero, datos o None, error)``.
+
+    ``numero`` es la línea del archivo (la cabecera del CSV es la 1). Nunca se
+    carga el archivo completo en memoria.
+    """
+    lineas = codecs.iterdecode(archivo, 'utf-8-sig')
+    if formato == 'csv':
+        lector = csv.DictReader(lineas)
+        columnas = set(lector.fieldnames or [])
+        if not {'marca', 'nombre'} <= columnas:
+            raise ErrorImportacion('La cabecera del CSV debe incluir las columnas marca y nombre.')
+        if columnas - set(CAMPOS_IMPORTACION):
+            raise ErrorImportacion(f"Columnas desconocidas: {', '.join(sorted(columnas - set(CAMPOS_IMPORTACION)))}.")
+        for fila in lector:
+            if None in fila:
+                yield lector.line_num, None, 'La fila tiene más columnas que la cabecera.'
+                continue
+            # Las celdas vacías cuentan como no informadas
+            yield lector.line_num, {clave: valor for clave, valor in fila.items() if valor != ''}, None
+        return
+    for numero, linea in enumerate(lineas, start=1):
+        if not linea.strip():
+            continue
+        try:
+            datos = json.loads(linea)
+        except ValueError as e:
+            yield numero, None, f'JSON inválido: {e}'
+            continue
+        if not isinstance(datos, dict):
+            yield numero, None, 'Cada línea debe ser un objeto JSON.'
+            continue
+        yield numero, datos, None
+
+
+class ResultadoImportacion:
+    """Totales de la importación y errores por fila (hasta ``max_errores``)."""
+
+    def __init__(self, max_errores):
+        self.max_errores = max_errores
+        self.filas = 0
+        self.guardadas = 0
+        self.con_error = 0
+        self.errores = []
+
+    def error(self, numero, detalle):
+        self.con_error += 1
+        if len(self.errores) < self.max_errores:
+            self.errores.append({'fila': numero, 'errores': detalle})
+
+    def como_dict(self):
+        return {
+            'filas': self.filas,
+            'guardadas': self.guardadas,
+            'con_error': self.con_error,
+            'errores': self.errores,
+            'errores_omitidos': self.con_error - len(self.errores),
+        }
+
+
+def _precio_efectivo(datos, factor):
+    # Igual que Producto.calcular_precio_clp, con el factor calculado una vez
+    if datos.get('precio_final_clp'):
+        return datos['precio_final_clp']
+    return datos['precio_usd'] * factor if factor is not None else None
+
+
+def _guardar_lote(lote, factor, resultado):
+    """Upsert del lote: un INSERT ... ON CONFLICT por cada conjunto de columnas informadas."""
+    # Si la misma clave se repite en el lote gana la última fila
+    por_clave = {(datos['marca'], datos['nombre']): (numero, datos) for numero, datos in lote}
+    grupos = {}
+    for numero, datos in por_clave.values():
+        grupos.setdefault(frozenset(datos), []).append((numero, datos))
+    resultado.guardadas += len(lote) - len(por_clave)
+
+    for columnas, filas in grupos.items():
+        productos = [
+            Producto(**datos, precio_clp_efectivo=_precio_efectivo(datos, factor)) for _, datos in filas
+        ]
+        try:
+            with transaction.atomic():
+                Producto.objects.bulk_create(
+                    productos,
+                    update_conflicts=True,
+                    unique_fields=['marca', 'nombre'],
+                    update_fields=sorted(columnas - {'marca', 'nombre'}) + ['precio_clp_efectivo', 'fecha_modificacion'],
+                )
+        except DatabaseError:
+            # Las filas quedan informadas en el resultado; el detalle de la base va al log
+            logger.exception('Error al guardar un lote de la importación de productos')
+            for numero, _ in filas:
+                resultado.error(numero, {'non_field_errors': ['No se pudo guardar la fila.']})
+            continue
+        resultado.guardadas += len(filas)
+
+    sin_precio_fijo = [datos for columnas, filas in grupos.items() if 'precio_final_clp' not in columnas for _, datos in filas]
+    if sin_precio_fijo:
+        # Esas filas recibieron el precio desde precio_usd, pero un producto existente puede
+        # tener precio_final_clp: se restituye en un UPDATE por lote (abarcar de más no importa,
+        # precio_clp_efectivo = precio_final_clp vale para todo producto con precio fijo)
+        Producto.objects.filter(
+            marca__in={datos['marca'] for datos in sin_precio_fijo},
+            nombre__in={datos['nombre'] for datos in sin_precio_fijo},
+            precio_final_clp__gt=0,
+        ).exclude(precio_clp_efectivo=F('precio_final_clp')).update(precio_clp_efectivo=F('precio_final_clp'))
+
+
+def importar_productos(archivo, formato, tamano_lote=None, max_errores=None):
+    """
+    Crea o actualiza productos desde un archivo CSV o NDJSON.
+
+    Cada fila se valida con ``ProductoImportacionSerializer`` y las válidas se
+    guardan en lotes de ``tamano_lote`` con un upsert por (marca, nombre), por
+    lo que la memoria usada no depende del tamaño del archivo. Devuelve un
+    ``ResultadoImportacion``.
+    """
+    tamano_lote = tamano_lote or getattr(settings, 'IMPORTACION_TAMANO_LOTE', 1000)
+    resultado = ResultadoImportacion(max_errores or getattr(settings, 'IMPORTACION_MAX_ERRORES', 1000))
+    if formato not in FORMATOS:
+        raise ErrorImportacion(f'Formato no soportado: {formato}.')
+
+    from .utils import obtener_valor_dolar
+    valor_dolar, _ = obtener_valor_dolar()
+    factor = factor_clp(valor_dolar, Configuracion.get_solo()) if valor_dolar else None
+
+    # Una sola instancia: los campos del serializer se construyen una vez
+    validador = ProductoImportacionSerializer()
+    filas = leer_filas(archivo, formato)
+    while True:
+        bloque = list(islice(filas, tamano_lote))
+        if not bloque:
+            break
+        lote = []
+        for numero, datos, error in bloque:
+            resultado.filas += 1
+            if error:
+                resultado.error(numero, {'non_field_errors': [error]})
+                continue
+            desconocidas = set(datos) - set(CAMPOS_IMPORTACION)
+            if desconocidas:
+                resultado.error(numero, {campo: ['Columna desconocida.'] for campo in sorted(desconocidas)})
+                continue
+            try:
+                lote.append((numero, validador.run_validation(datos)))
+            except ValidationError as e:
+                resultado.error(numero, as_serializer_error(e))
+        if lote:
+            _guardar_lote(lote, factor, resultado)
+
+    if resultado.guardadas:
+        # bulk_create no emite post_save: se invalida el catálogo una vez
+        VersionColeccion.incrementar(VersionColeccion.PRODUCTOS)
+    return resultado
@@ -0,0 +1,271 @@
+"""
+Lectura rápida de los listados: filas de ``values()`` convertidas a JSON sin
+crear instancias del modelo ni recorrer el serializador fila por fila.
+
+El plan de conversión se arma una vez por petición a partir de los campos del
+serializador del listado (los mismos que eligió ``?fields=``/``?expand=``), con
+un convertidor ya resuelto por campo. El resultado es idéntico byte a byte al
+de ``JSONRenderer`` con el serializador; si algún campo no se sabe leer de una
+fila, la vista vuelve al camino normal.
+"""
+import json
+from decimal import Decimal, getcontext
+from operator import itemgetter
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from .campos import CamposDinamicosViewMixin
+from .condicional import RespuestaCacheada
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class NoSoportado(Exception):
+    """Campo que no se puede convertir desde una fila de ``values()``."""
+
+
+def a_json(datos):
+    """Los mismos bytes que ``JSONRenderer`` (compacto, UTF-8) para datos con tipos JSON."""
+    contenido = None
+    if orjson is not None:
+        try:
+            contenido = orjson.dumps(datos)
+        except TypeError:
+            # Enteros de más de 64 bits, por ejemplo
+            pass
+    if contenido is None:
+        contenido = json.dumps(datos, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    return contenido.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def _identidad(valor):
+    return valor
+
+
+def _decimal(campo):
+    coercion = getattr(campo, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if campo.decimal_places is None or campo.normalize_output or campo.localize or not coercion:
+        return campo.to_representation
+    # Lo mismo que DecimalField.quantize, con el contexto y la escala calculados una vez
+    contexto = getcontext().copy()
+    if campo.max_digits is not None:
+        contexto.prec = campo.max_digits
+    escala = Decimal('.1') ** campo.decimal_places
+    redondeo = campo.rounding
+
+    def convertir(valor):
+        if not isinstance(valor, Decimal):
+            return campo.to_representation(valor)
+        return '{:f}'.format(valor.quantize(escala, rounding=redondeo, context=contexto))
+    return convertir
+
+
+def _fecha_hora(campo):
+    formato = getattr(campo, 'format', api_settings.DATETIME_FORMAT)
+    zona = campo.timezone if hasattr(campo, 'timezone') else campo.default_timezone()
+    if formato is None or formato.lower() != ISO_8601 or zona is None:
+        return campo.to_representation
+
+    def convertir(valor):
+        if getattr(valor, 'tzinfo', None) is None:
+            return campo.to_representation(valor)
+        texto = valor.astimezone(zona).isoformat()
+        return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+    return convertir
+
+
+def _fecha(campo):
+    formato = getattr(campo, 'format', api_settings.DATE_FORMAT)
+    if formato is None or formato.lower() != ISO_8601:
+        return campo.to_representation
+    return lambda valor: valor.isoformat() if valor else None
+
+
+def _archivo(campo, campo_modelo):
+    if not getattr(campo, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda nombre: nombre or None
+    storage = campo_modelo.storage
+    request = campo.context.get('request')
+
+    def convertir(nombre):
+        if not nombre:
+            return None
+        url = storage.url(nombre)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convertir
+
+
+# Campos cuyo valor en la fila ya es su representación (str, int, bool)
+IDENTICOS = (serializers.BooleanField, serializers.IntegerField, serializers.CharField, serializers.ChoiceField)
+
+
+def _campo_modelo(modelo, fuente):
+    try:
+        campo = modelo._meta.get_field(fuente)
+    except FieldDoesNotExist:
+        campo = next((campo for campo in modelo._meta.concrete_fields if campo.attname == fuente), None)
+    if campo is None or not campo.concrete:
+        raise NoSoportado(fuente)
+    return campo
+
+
+def _convertidor(campo, campo_modelo=None):
+    if isinstance(campo, serializers.SerializerMethodField):
+        return _identidad
+    if isinstance(campo, serializers.DecimalField):
+        return _decimal(campo)
+    if isinstance(campo, serializers.DateTimeField):
+        return _fecha_hora(campo)
+    if isinstance(campo, serializers.DateField):
+        return _fecha(campo)
+    if isinstance(campo, serializers.FileField):
+        if campo_modelo is None:
+            raise NoSoportado(campo.field_name)
+        return _archivo(campo, campo_modelo)
+    if isinstance(campo, serializers.PrimaryKeyRelatedField):
+        if campo.pk_field is not None:
+            raise NoSoportado(campo.field_name)
+        return _identidad
+    if isinstance(campo, serializers.RelatedField):
+        raise NoSoportado(campo.field_name)
+    if isinstance(campo, IDENTICOS):
+        return _identidad
+    return campo.to_representation
+
+
+class Lector:
+    """
+    Plan de lectura de un serializador de listado ya construido (con su contexto).
+
+    ``preparar`` deja el queryset en ``values()`` con las columnas justas y
+    ``convertir`` transforma las filas de una página en dicts listos para JSON.
+    Lanza ``NoSoportado`` si el serializador tiene un campo que no sabe leer.
+    """
+
+    def __init__(self, serializador):
+        request = serializador.context.get('request')
+        lectores = serializador.lectores(request.build_absolute_uri if request is not None else None)
+        self.modelo = serializador.Meta.model
+        self.pk = self.modelo._meta.pk.attname
+        self.relaciones = []
+        self.columnas, self.pasos = self._plan(serializador, self.modelo, '', lectores)
+        self.columnas.add(self.pk)
+
+    def _plan(self, serializador, modelo, prefijo, lectores):
+        columnas, pasos = set(), []
+        for campo in serializador._readable_fields:
+            nombre = campo.field_name
+            if nombre in lectores:
+                # Los lectores solo existen en el serializador del listado (CamposDinamicosMixin)
+                columnas |= serializador.columnas([nombre])
+                pasos.append((nombre, lectores[nombre], _convertidor(campo)))
+            elif isinstance(campo, serializers.ListSerializer):
+                if prefijo:
+                    raise NoSoportado(nombre)
+                pasos.append((nombre, self._relacion_inversa(modelo, campo), _identidad))
+            elif isinstance(campo, serializers.BaseSerializer):
+                relacionado = _campo_modelo(modelo, campo.source)
+                if relacionado.many_to_many or relacionado.related_model is None:
+                    raise NoSoportado(nombre)
+                anidado = f'{prefijo}{campo.source}__'
+                columnas_anidadas, pasos_anidados = self._plan(campo, relacionado.related_model, anidado, {})
+                clave = anidado + relacionado.related_model._meta.pk.attname
+                columnas |= columnas_anidadas | {clave}
+                pasos.append((nombre, self._anidado(clave, pasos_anidados), _identidad))
+            elif isinstance(campo, serializers.SerializerMethodField) or '.' in campo.source or campo.source == '*':
+                raise NoSoportado(nombre)
+            else:
+                campo_modelo = _campo_modelo(modelo, campo.source)
+                columnas.add(prefijo + campo.source)
+                pasos.append((nombre, itemgetter(prefijo + campo.source), _convertidor(campo, campo_modelo)))
+        return columnas, pasos
+
+    @staticmethod
+    def _anidado(clave, pasos):
+        def obtener(fila):
+            return None if fila[clave] is None else convertir_fila(pasos, fila)
+        return obtener
+
+    def _relacion_inversa(self, modelo, campo):
+        relacion = _campo_modelo_inverso(modelo, campo.source)
+        columnas, pasos = self._plan(campo.child, relacion.related_model, '', {})
+        columnas.add(relacion.related_model._meta.pk.attname)
+        grupos = {}
+        self.relaciones.append((relacion, columnas, pasos, grupos))
+        return lambda fila: grupos.get(fila[self.pk], [])
+
+    def preparar(self, queryset, columnas_extra=()):
+        """``values()`` con las columnas del plan, las de orden y las anotaciones que son campos."""
+        nombres = {nombre for nombre, _, _ in self.pasos}
+        anotaciones = [nombre for nombre in queryset.query.annotations if nombre in nombres]
+        concretos = {campo.attname for campo in self.modelo._meta.concrete_fields}
+        columnas = self.columnas | {columna for columna in columnas_extra if columna in concretos}
+        return queryset.prefetch_related(None).values(*sorted(columnas), *anotaciones)
+
+    def convertir(self, filas):
+        filas = list(filas)
+        ids = [fila[self.pk] for fila in filas]
+        for relacion, columnas, pasos, grupos in self.relaciones:
+            # Una consulta por relación para toda la página, como el prefetch del serializador
+            enlace = relacion.field.attname
+            grupos.clear()
+            for hija in relacion.related_model._default_manager.filter(
+                    **{f'{enlace}__in': ids}).values(enlace, *sorted(columnas)):
+                grupos.setdefault(hija[enlace], []).append(convertir_fila(pasos, hija))
+        return [convertir_fila(self.pasos, fila) for fila in filas]
+
+
+def _campo_modelo_inverso(modelo, nombre):
+    try:
+        relacion = modelo._meta.get_field(nombre)
+    except FieldDoesNotExist:
+        raise NoSoportado(nombre)
+    if not relacion.one_to_many or relacion.concrete:
+        raise NoSoportado(nombre)
+    return relacion
+
+
+def convertir_fila(pasos, fila):
+    resultado = {}
+    for nombre, obtener, convertir in pasos:
+        valor = obtener(fila)
+        resultado[nombre] = None if valor is None else convertir(valor)
+    return resultado
+
+
+class LecturaRapidaViewMixin(CamposDinamicosViewMixin):
+    """
+    Listado en JSON leído con ``values()`` y ``api.lectura.Lector``.
+
+    Se usa solo cuando la respuesta sería el JSON compacto de ``JSONRenderer``;
+    el navegador de la API, ``?format=api`` o un campo que el lector no soporte
+    siguen por el serializador. ``LECTURA_RAPIDA = False`` la desactiva.
+    """
+
+    def lector_rapido(self, request):
+        if not getattr(settings, 'LECTURA_RAPIDA', True) or not self.es_listado():
+            return None
+        if type(request.accepted_renderer) is not JSONRenderer or request.accepted_media_type != JSONRenderer.media_type:
+            return None
+        if not (api_settings.COMPACT_JSON and api_settings.UNICODE_JSON and api_settings.STRICT_JSON):
+            return None
+        try:
+            return Lector(self.get_serializer())
+        except NoSoportado:
+            return None
+
+    def list(self, request, *args, **kwargs):
+        lector = self.lector_rapido(request)
+        if lector is None:
+            return super().list(request, *args, **kwargs)
+        queryset = lector.preparar(self.filter_queryset(self.get_queryset()), self.columnas_orden())
+        pagina = self.paginate_queryset(queryset)
+        datos = lector.convertir(queryset if pagina is None else pagina)
+        if pagina is not None:
+            datos = self.get_paginated_response(datos).data
+        return RespuestaCacheada(a_json(datos), request.accepted_media_type)
@@ -0,0 +1,47 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from api.benchmarks import ESCENARIOS, comparar, ejecutar
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta escenarios de rendimiento y revierte los datos creados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('escenarios', nargs='*', help='Escenarios a ejecutar (por defecto todos).')
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados.')
+        parser.add_argument('--comparar', help='Resultados JSON anteriores contra los que comparar.')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Aumento de latencia aceptado al comparar (0.2 = 20%%).')
+
+    def handle(self, *args, **opciones):
+        nombres = opciones['escenarios'] or sorted(ESCENARIOS)
+        desconocidos = set(nombres) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+        resultados = {}
+        # Las mediciones de consultas requieren que Django registre el SQL y
+        # las peticiones simuladas usan el mismo host que las pruebas
+        with override_settings(DEBUG=True, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for nombre in nombres:
+                self.stdout.write(f'Ejecutando {nombre}...')
+                resultados[nombre] = ejecutar(nombre, repeticiones=opciones['repeticiones'])
+
+        salida = json.dumps(resultados, indent=2, default=str)
+        if opciones['salida']:
+            with open(opciones['salida'], 'w') as archivo:
+                archivo.write(salida)
+        self.stdout.write(salida)
+
+        if opciones['comparar']:
+            with open(opciones['comparar']) as archivo:
+                base = json.load(archivo)
+            regresiones = comparar(base, resultados, opciones['tolerancia'])
+            for regresion in regresiones:
+                self.stderr.write(f'Regresión: {regresion}')
+            if regresiones:
+                raise CommandError(f'{len(regresiones)} regresiones respecto de {opciones["comparar"]}.')
+            self.stdout.write(self.style.SUCCESS('Sin regresiones.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.exportacion import FORMATOS, FiltrosExportacionSerializer, exportar, filas_pedidos
+
+
+class Command(BaseCommand):
+    help = 'Exporta los pedidos con sus líneas en CSV o NDJSON sin cargarlos en memoria.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=list(FORMATOS), default='csv')
+        parser.add_argument('--desde', help='Fecha inicial inclusiva (AAAA-MM-DD).')
+        parser.add_argument('--hasta', help='Fecha final inclusiva (AAAA-MM-DD).')
+        parser.add_argument('--estado', help='Uno o varios estados separados por coma.')
+        parser.add_argument('--salida', help='Archivo de destino; por defecto la salida estándar.')
+        parser.add_argument('--lote', type=int, help='Filas por viaje del cursor (EXPORTACION_TAMANO_LOTE).')
+
+    def handle(self, *args, **opciones):
+        filtros = FiltrosExportacionSerializer(data={
+            clave: opciones[clave] for clave in ('formato', 'desde', 'hasta', 'estado') if opciones[clave]
+        })
+        if not filtros.is_valid():
+            raise CommandError(filtros.errors)
+        datos = dict(filtros.validated_data)
+        formato = datos.pop('formato')
+        fragmentos = exportar(filas_pedidos(tamano_lote=opciones['lote'], **datos), formato)
+        if opciones['salida']:
+            with open(opciones['salida'], 'wb') as archivo:
+                for fragmento in fragmentos:
+                    archivo.write(fragmento)
+            self.stderr.write(self.style.SUCCESS(f"Pedidos exportados en {opciones['salida']}."))
+        else:
+            for fragmento in fragmentos:
+                self.stdout.write(fragmento.decode(), ending='')
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.models import Producto
+
+
+def _iniciar_proceso():
+    import django
+    django.setup()
+
+
+def _generar_lote(ids, forzar):
+    from api.imagenes import generar_variantes
+    generados = errores = 0
+    for producto_id in ids:
+        try:
+            generados += generar_variantes(producto_id, forzar=forzar)
+        except Exception as e:
+            errores += 1
+            print(f"Error al generar las variantes del producto {producto_id}: {e}")
+    return generados, errores
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes (miniaturas WebP/JPEG) de las imágenes de productos pendientes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1,
+                            help='Procesos en paralelo (por defecto, uno por núcleo).')
+        parser.add_argument('--lote', type=int, default=20, help='Productos por tarea enviada a cada proceso.')
+        parser.add_argument('--todas', action='store_true', help='Regenera también las imágenes ya procesadas.')
+
+    def handle(self, *args, **opciones):
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True)
+        if not opciones['todas']:
+            # Pendientes: sin variantes o generadas para otra imagen
+            productos = [pk for pk, imagen, variantes in productos.values_list('pk', 'imagen', 'imagen_variantes')
+                         if (variantes or {}).get('origen') != imagen]
+        else:
+            productos = list(productos.values_list('pk', flat=True))
+        lotes = [productos[i:i + opciones['lote']] for i in range(0, len(productos), opciones['lote'])]
+
+        if opciones['procesos'] <= 1:
+            resultados = [_generar_lote(lote, opciones['todas']) for lote in lotes]
+        else:
+            # Los procesos hijos abren sus propias conexiones
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=opciones['procesos'], initializer=_iniciar_proceso) as ejecutor:
+                resultados = list(ejecutor.map(_generar_lote, lotes, [opciones['todas']] * len(lotes)))
+
+        generados = sum(generado for generado, _ in resultados)
+        errores = sum(error for _, error in resultados)
+        self.stdout.write(self.style.SUCCESS(f'{generados} productos con variantes generadas, {errores} errores.'))
@@ -0,0 +1,24 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from api.importacion import FORMATOS, ErrorImportacion, detectar_formato, importar_productos
+
+
+class Command(BaseCommand):
+    help = 'Crea o actualiza productos por (marca, nombre) desde un archivo CSV o NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ruta', help='Archivo a importar.')
+        parser.add_argument('--formato', choices=FORMATOS, help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--lote', type=int, help='Filas por upsert (IMPORTACION_TAMANO_LOTE).')
+
+    def handle(self, *args, **opciones):
+        formato = opciones['formato'] or detectar_formato(opciones['ruta'])
+        try:
+            with open(opciones['ruta'], 'rb') as archivo:
+                resultado = importar_productos(archivo, formato, tamano_lote=opciones['lote'])
+        except (OSError, ErrorImportacion) as e:
+            raise CommandError(str(e))
+        for error in resultado.errores:
+            self.stderr.write(f"Fila {error['fila']}: {json.dumps(error['errores'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.filas} filas leídas, {resultado.guardadas} productos guardados, {resultado.con_error} con error.'))
@@ -0,0 +1,65 @@
+import json
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from api.carga import ESCENARIOS, comparar_carga, medir_carga, peticiones
+from api.models import Pedido, Usuario
+
+USUARIO_CARGA = 'usuario-carga'
+CLAVE_CARGA = 'clave-carga-123'
+
+
+class Command(BaseCommand):
+    help = 'Mide throughput y latencia (p50/p95/p99) de un servidor en ejecución.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('escenarios', nargs='*', help=f"Escenarios ({', '.join(ESCENARIOS)}; por defecto todos).")
+        parser.add_argument('--url', default='http://localhost:8000', help='Servidor a medir.')
+        parser.add_argument('--concurrencia', type=int, default=16, help='Clientes simultáneos.')
+        parser.add_argument('--duracion', type=int, default=20, help='Segundos medidos por escenario.')
+        parser.add_argument('--calentamiento', type=int, default=3, help='Segundos iniciales que no se cuentan.')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados.')
+        parser.add_argument('--comparar', help='Resultados JSON anteriores (p. ej. con otro perfil de servidor).')
+
+    def handle(self, *args, **opciones):
+        nombres = opciones['escenarios'] or ESCENARIOS
+        desconocidos = set(nombres) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+        # El servidor usa la misma base de datos: el cliente de carga se crea aquí
+        usuario, _ = Usuario.objects.get_or_create(username=USUARIO_CARGA)
+        usuario.set_password(CLAVE_CARGA)
+        usuario.save()
+        url = opciones['url'].rstrip('/')
+        try:
+            token = requests.post(f'{url}/api/v1/token/', json={'username': USUARIO_CARGA, 'password': CLAVE_CARGA},
+                                  timeout=30).json()['access']
+            productos = [p['id'] for p in requests.get(f'{url}/api/v1/productos/', timeout=30).json()['results']]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            raise CommandError(f'No se pudo preparar la prueba contra {url}: {e}')
+        if not productos:
+            raise CommandError('El catálogo está vacío: el checkout necesita productos.')
+
+        funciones = peticiones(url, token, productos)
+        resultados = {'configuracion': {
+            'url': url, 'concurrencia': opciones['concurrencia'], 'duracion_s': opciones['duracion']}}
+        try:
+            for nombre in nombres:
+                self.stdout.write(f'Ejecutando {nombre}...')
+                resultados[nombre] = medir_carga(
+                    funciones[nombre], opciones['concurrencia'], opciones['duracion'], opciones['calentamiento'])
+        finally:
+            borrados, _ = Pedido.objects.filter(cliente=usuario).delete()
+            if borrados:
+                self.stdout.write(f'{borrados} registros de checkout eliminados.')
+
+        salida = json.dumps(resultados, indent=2)
+        if opciones['salida']:
+            with open(opciones['salida'], 'w') as archivo:
+                archivo.write(salida)
+        self.stdout.write(salida)
+
+        if opciones['comparar']:
+            with open(opciones['comparar']) as archivo:
+                for linea in comparar_carga(json.load(archivo), resultados):
+                    self.stdout.write(linea)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.resumenes import TAMANO_LOTE, reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los resúmenes de ventas del panel de administración.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE,
+                            help='Pedidos procesados por lote.')
+
+    def handle(self, *args, **opciones):
+        procesados = reconstruir(opciones['tamano_lote'])
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes reconstruidos con {procesados} pedidos.'))
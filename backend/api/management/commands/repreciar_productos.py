@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.precios import repreciar_productos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el precio en CLP precalculado de todos los productos.'
+
+    def handle(self, *args, **opciones):
+        actualizados = repreciar_productos()
+        self.stdout.write(self.style.SUCCESS(f'{actualizados} productos repreciados.'))
@@ -0,0 +1,63 @@
+import re
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from .models import iniciar_memoria_peticion, terminar_memoria_peticion
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se negocia solo gzip
+    brotli = None
+
+acepta_brotli = re.compile(r'\bbr\b')
+
+
+class MemoriaPeticionMiddleware:
+    """Abre una memoria por petición para valores como Configuracion.get_solo()."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = iniciar_memoria_peticion()
+        try:
+            return self.get_response(request)
+        finally:
+            terminar_memoria_peticion(token)
+
+
+class CompresionMiddleware(GZipMiddleware):
+    """
+    Comprime con brotli o gzip según ``Accept-Encoding``.
+
+    Las respuestas menores a ``COMPRESION_MIN_BYTES`` se envían sin comprimir:
+    el ahorro no compensa el tiempo de CPU.
+    """
+
+    def process_response(self, request, response):
+        minimo = getattr(settings, 'COMPRESION_MIN_BYTES', 1024)
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            # Comprimir retendría los eventos en el búfer del compresor
+            return response
+        if not response.streaming and len(response.content) < minimo:
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not acepta_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        comprimido = brotli.compress(response.content, quality=getattr(settings, 'COMPRESION_BROTLI_CALIDAD', 5))
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        # El cuerpo ya no es idéntico byte a byte, igual que en GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_producto_peso_kg'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracion',
+            name='dolar_observado',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='configuracion',
+            name='fecha_actualizacion_dolar_observado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_producto_precio_clp_efectivo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'id'], name='notificacion_usuario_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['cliente', 'id'], name='pedido_cliente_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['precio_usd', 'id'], name='producto_precio_usd_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['peso_kg', 'id'], name='producto_peso_kg_id_idx'),
+        ),
+    ]
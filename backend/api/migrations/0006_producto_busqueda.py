@@ -0,0 +1,62 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:55
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# La columna se mantiene con un trigger para cubrir también bulk_create y update()
+SQL_BUSQUEDA = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION api_producto_busqueda_actualizar() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda :=
+        setweight(to_tsvector('spanish', coalesce(NEW.nombre, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(NEW.descripcion, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_producto_busqueda_trigger
+    BEFORE INSERT OR UPDATE OF nombre, descripcion ON api_producto
+    FOR EACH ROW EXECUTE FUNCTION api_producto_busqueda_actualizar();
+
+UPDATE api_producto SET
+    busqueda = setweight(to_tsvector('spanish', coalesce(nombre, '')), 'A') ||
+               setweight(to_tsvector('spanish', coalesce(descripcion, '')), 'B');
+
+CREATE INDEX api_producto_busqueda_gin ON api_producto USING gin (busqueda);
+CREATE INDEX api_producto_nombre_trgm ON api_producto USING gin (nombre gin_trgm_ops);
+"""
+
+SQL_BUSQUEDA_REVERSA = """
+DROP INDEX IF EXISTS api_producto_nombre_trgm;
+DROP INDEX IF EXISTS api_producto_busqueda_gin;
+DROP TRIGGER IF EXISTS api_producto_busqueda_trigger ON api_producto;
+DROP FUNCTION IF EXISTS api_producto_busqueda_actualizar();
+"""
+
+
+def crear_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_BUSQUEDA)
+
+
+def eliminar_busqueda(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SQL_BUSQUEDA_REVERSA)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(crear_busqueda, eliminar_busqueda),
+    ]
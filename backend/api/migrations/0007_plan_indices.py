@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_producto_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['pedido', 'producto'], name='detalle_pedido_producto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(condition=models.Q(('leida', False)), fields=['usuario', 'id'], name='notificacion_no_leidas_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['marca', 'id'], name='producto_marca_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['id'], name='producto_disponible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['marca', 'id'], name='producto_disp_marca_idx'),
+        ),
+    ]
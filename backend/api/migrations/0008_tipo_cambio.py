@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+def copiar_valores_configuracion(apps, schema_editor):
+    """Inicia el historial con los valores que ya guardaba Configuracion."""
+    from django.utils import timezone
+    Configuracion = apps.get_model('api', 'Configuracion')
+    TipoCambio = apps.get_model('api', 'TipoCambio')
+    configuracion = Configuracion.objects.order_by('pk').first()
+    if configuracion is None:
+        return
+    valores = [
+        ('aduanero', configuracion.dolar_aduanero, configuracion.fecha_actualizacion_dolar_aduanero),
+        ('observado', configuracion.dolar_observado, configuracion.fecha_actualizacion_dolar_observado),
+    ]
+    for tipo, valor, actualizado in valores:
+        if valor and actualizado:
+            fecha = timezone.localtime(actualizado).date()
+            if tipo == 'aduanero':
+                fecha = fecha.replace(day=1)
+            TipoCambio.objects.get_or_create(tipo=tipo, fecha=fecha, defaults={'valor': valor, 'fuente': 'configuracion'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_plan_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TipoCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('observado', 'Dólar observado'), ('aduanero', 'Dólar aduanero')], max_length=10)),
+                ('fecha', models.DateField()),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fuente', models.CharField(blank=True, max_length=50)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'fecha'), name='tipo_cambio_tipo_fecha_uniq')],
+            },
+        ),
+        migrations.RunPython(copiar_valores_configuracion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def desambiguar_duplicados(apps, schema_editor):
+    # Los productos repetidos conservan el nombre en el de menor id; el resto lleva su id
+    Producto = apps.get_model('api', 'Producto')
+    repetidos = (
+        Producto.objects.values('marca', 'nombre').annotate(total=Count('id')).filter(total__gt=1)
+    )
+    for clave in repetidos:
+        duplicados = Producto.objects.filter(marca=clave['marca'], nombre=clave['nombre']).order_by('id')[1:]
+        for producto in duplicados:
+            sufijo = f" ({producto.pk})"
+            producto.nombre = producto.nombre[:100 - len(sufijo)] + sufijo
+            producto.save(update_fields=['nombre'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_producto_imagen_variantes'),
+    ]
+
+    operations = [
+        migrations.RunPython(desambiguar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.UniqueConstraint(fields=('marca', 'nombre'), name='producto_marca_nombre_uniq'),
+        ),
+    ]
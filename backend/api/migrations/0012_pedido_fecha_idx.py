@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_producto_marca_nombre_uniq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['fecha_pedido'], name='pedido_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_pedido_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='version_token',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
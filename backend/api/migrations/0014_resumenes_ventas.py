@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_usuario_version_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AporteResumen',
+            fields=[
+                ('pedido', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('aportes', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumenVentas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('dia', 'Día'), ('estado', 'Estado'), ('marca', 'Marca'), ('producto', 'Producto')], max_length=10)),
+                ('clave', models.CharField(max_length=50)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('total_usd', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_clp', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('total_final_clp', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('peso_total_kg', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', '-total_clp'], name='resumen_ventas_ranking_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'clave'), name='resumen_ventas_dimension_clave_uniq')],
+            },
+        ),
+    ]
@@ -1,8 +1,28 @@
+import time
+import uuid
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractUser
 from decimal import Decimal
 from django.utils import timezone
 
+# Memoria de la petición en curso; None fuera de una petición HTTP
+_memoria_peticion = ContextVar('memoria_peticion', default=None)
+# Copia de la configuración compartida por todo el proceso: (instancia, version, expira_en)
+_configuracion_proceso = None
+# Versión de la configuración en el caché compartido; cambia con cada guardado
+CLAVE_VERSION_CONFIGURACION = 'configuracion:version'
+
+def iniciar_memoria_peticion():
+    return _memoria_peticion.set({})
+
+def terminar_memoria_peticion(token):
+    _memoria_peticion.reset(token)
+
 class Configuracion(models.Model):
     porcentaje_comision = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('15.0'))
     tasa_seguro = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('1.0'))
@@ -11,17 +31,124 @@ class Configuracion(models.Model):
     tasa_iva = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('19.0'))
     dolar_aduanero = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     fecha_actualizacion_dolar_aduanero = models.DateTimeField(null=True, blank=True)
+    # Último valor bueno del dólar observado, usado cuando la API no responde
+    dolar_observado = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    fecha_actualizacion_dolar_observado = models.DateTimeField(null=True, blank=True)
+    # Sello para las respuestas condicionales (ETag / Last-Modified)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Configuración - Comisión: {self.porcentaje_comision}%"
 
+    @classmethod
+    def get_solo(cls):
+        """
+        Devuelve la configuración vigente (o None) sin repetir la consulta.
+
+        El resultado se guarda para la petición actual y para el proceso por
+        ``CONFIGURACION_CACHE_TTL`` segundos. La copia del proceso solo se usa
+        mientras la versión del caché compartido no cambie: las señales de
+        guardado y borrado la cambian, y así los demás workers releen la fila.
+        """
+        global _configuracion_proceso
+        memoria = _memoria_peticion.get()
+        if memoria is not None and 'configuracion' in memoria:
+            return memoria['configuracion']
+
+        version = cls.version_cache()
+        en_proceso = _configuracion_proceso
+        if en_proceso is not None and en_proceso[1] == version and en_proceso[2] > time.monotonic():
+            configuracion = en_proceso[0]
+        else:
+            configuracion = cls.objects.order_by('pk').first()
+            ttl = getattr(settings, 'CONFIGURACION_CACHE_TTL', 60)
+            _configuracion_proceso = (configuracion, version, time.monotonic() + ttl)
+        if memoria is not None:
+            memoria['configuracion'] = configuracion
+        return configuracion
+
+    @staticmethod
+    def version_cache():
+        version = cache.get(CLAVE_VERSION_CONFIGURACION)
+        if version is None:
+            # Sin clave (caché vacío o descartada) todos los procesos releen la fila
+            cache.add(CLAVE_VERSION_CONFIGURACION, uuid.uuid4().hex, None)
+            version = cache.get(CLAVE_VERSION_CONFIGURACION)
+        return version
+
+    @classmethod
+    def limpiar_cache(cls):
+        global _configuracion_proceso
+        _configuracion_proceso = None
+        cache.set(CLAVE_VERSION_CONFIGURACION, uuid.uuid4().hex, None)
+        memoria = _memoria_peticion.get()
+        if memoria is not None:
+            memoria.pop('configuracion', None)
+
     def actualizar_dolar_aduanero(self):
-        from .utils import obtener_dolar_aduanero
-        valor = obtener_dolar_aduanero()
+        from .tipos_cambio import actualizar_dolar_aduanero
+        valor = actualizar_dolar_aduanero()
         if valor:
             self.dolar_aduanero = valor
             self.fecha_actualizacion_dolar_aduanero = timezone.now()
-            self.save()
+            # La instancia puede ser la copia en memoria de get_solo: no pisa los demás campos
+            self.save(update_fields=['dolar_aduanero', 'fecha_actualizacion_dolar_aduanero'])
+        return valor
+
+class VersionColeccion(models.Model):
+    """
+    Contador que cambia con cada escritura de una colección.
+
+    Permite responder listados condicionales (ETag) con una lectura por clave
+    primaria en vez de recorrer la tabla.
+    """
+
+    PRODUCTOS = 'productos'
+    CONFIGURACION = 'configuracion'
+
+    nombre = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    fecha_modificacion = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.nombre} v{self.version}"
+
+    @classmethod
+    def incrementar(cls, nombre):
+        ahora = timezone.now()
+        if not cls.objects.filter(nombre=nombre).update(version=models.F('version') + 1, fecha_modificacion=ahora):
+            cls.objects.get_or_create(nombre=nombre, defaults={'version': 1, 'fecha_modificacion': ahora})
+
+    @classmethod
+    def obtener(cls, nombre):
+        """Devuelve (version, fecha_modificacion); (0, None) si nunca se escribió."""
+        return cls.objects.filter(nombre=nombre).values_list('version', 'fecha_modificacion').first() or (0, None)
+
+class TipoCambio(models.Model):
+    """Valor histórico de un tipo de cambio, uno por tipo y fecha de vigencia."""
+
+    OBSERVADO = 'observado'
+    ADUANERO = 'aduanero'
+    TIPOS = [
+        (OBSERVADO, 'Dólar observado'),
+        (ADUANERO, 'Dólar aduanero'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    # Desde cuándo rige el valor; el aduanero rige por mes completo
+    fecha = models.DateField()
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    fuente = models.CharField(max_length=50, blank=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # También sirve la búsqueda del valor vigente a una fecha
+            models.UniqueConstraint(fields=['tipo', 'fecha'], name='tipo_cambio_tipo_fecha_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.fecha}: {self.valor}"
 
 class Producto(models.Model):
     nombre = models.CharField(max_length=100)
@@ -32,7 +159,30 @@ class Producto(models.Model):
     fecha_compra = models.DateField(null=True, blank=True)
     disponible = models.BooleanField(default=True)
     imagen = models.ImageField(upload_to='productos/', null=True, blank=True)
+    # Miniaturas WebP/JPEG de la imagen; las genera api.imagenes en segundo plano
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
     precio_final_clp = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Precio en CLP precalculado; lo mantiene api.precios.repreciar_productos
+    precio_clp_efectivo = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+    # Lo mantiene un trigger de PostgreSQL a partir de nombre y descripción
+    busqueda = SearchVectorField(null=True, editable=False)
+    # Sello para las respuestas condicionales; los update() masivos también lo fijan
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor sobre los órdenes permitidos en ProductoViewSet
+            models.Index(fields=['precio_usd', 'id'], name='producto_precio_usd_id_idx'),
+            models.Index(fields=['peso_kg', 'id'], name='producto_peso_kg_id_idx'),
+            # Filtros de ProductoViewSet (marca, disponible) con el orden por defecto
+            models.Index(fields=['marca', 'id'], name='producto_marca_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(disponible=True), name='producto_disponible_idx'),
+            models.Index(fields=['marca', 'id'], condition=models.Q(disponible=True), name='producto_disp_marca_idx'),
+        ]
+        constraints = [
+            # Clave natural del catálogo; la usa el upsert de api.importacion
+            models.UniqueConstraint(fields=['marca', 'nombre'], name='producto_marca_nombre_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} - {self.marca}"
@@ -41,20 +191,34 @@ class Producto(models.Model):
     def precio_clp(self):
         if self.precio_final_clp:
             return self.precio_final_clp
-        else:
-            from .utils import obtener_valor_dolar
-            valor_dolar, _ = obtener_valor_dolar()
-            if valor_dolar:
-                configuracion = Configuracion.objects.first()
-                porcentaje_comision = configuracion.porcentaje_comision if configuracion else Decimal('0')
-                precio_usd_con_comision = self.precio_usd + (self.precio_usd * porcentaje_comision / Decimal('100.0'))
-                return precio_usd_con_comision * Decimal(valor_dolar)
-            else:
-                return Decimal('0')
+        if self.precio_clp_efectivo is not None:
+            return self.precio_clp_efectivo
+        return self.calcular_precio_clp() or Decimal('0')
+
+    def calcular_precio_clp(self):
+        if self.precio_final_clp:
+            return self.precio_final_clp
+        from .utils import obtener_valor_dolar
+        valor_dolar, _ = obtener_valor_dolar()
+        if valor_dolar:
+            configuracion = Configuracion.get_solo()
+            porcentaje_comision = configuracion.porcentaje_comision if configuracion else Decimal('0')
+            precio_usd_con_comision = self.precio_usd + (self.precio_usd * porcentaje_comision / Decimal('100.0'))
+            return precio_usd_con_comision * Decimal(valor_dolar)
+        return None
+
+    def save(self, *args, **kwargs):
+        self.precio_clp_efectivo = self.calcular_precio_clp()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'precio_clp_efectivo' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['precio_clp_efectivo']
+        super().save(*args, **kwargs)
 
 class Usuario(AbstractUser):
     telefono = models.CharField(max_length=20, blank=True)
     direccion = models.CharField(max_length=255, blank=True)
+    # Va en cada JWT; al aumentarla se revocan los tokens emitidos antes
+    version_token = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
@@ -77,54 +241,25 @@ class Pedido(models.Model):
     comprobante_pago = models.FileField(upload_to='comprobantes/', null=True, blank=True)
     total_final_clp = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'id'], name='pedido_cliente_id_idx'),
+            # Exportación y reportes por rango de fechas
+            models.Index(fields=['fecha_pedido'], name='pedido_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido #{self.id} - {self.cliente.username}"
 
     def save(self, *args, **kwargs):
         if not self.id:
-            from .utils import obtener_valor_dolar
-            valor_dolar, _ = obtener_valor_dolar()
-            if valor_dolar:
-                self.valor_dolar = Decimal(valor_dolar)
-            else:
-                self.valor_dolar = Decimal('0')
+            from .tipos_cambio import dolar_observado_vigente
+            self.valor_dolar = dolar_observado_vigente() or Decimal('0')
         super().save(*args, **kwargs)
 
-    def actualizar_totales(self):
-        detalles = self.detalles.all()
-        self.total_usd = sum(det.subtotal_usd for det in detalles)
-        self.peso_total_kg = sum(det.peso_kg for det in detalles)
-        self.total_clp = sum(det.subtotal_clp for det in detalles)
-        self.save()
-
-    def calcular_seguro(self):
-        configuracion = Configuracion.objects.first()
-        tasa_seguro = configuracion.tasa_seguro if configuracion else Decimal('0')
-        return (self.total_usd * tasa_seguro) / Decimal('100.0')
-
-    def calcular_flete(self):
-        configuracion = Configuracion.objects.first()
-        costo_por_kg = configuracion.costo_por_kg if configuracion else Decimal('0')
-        return self.peso_total_kg * costo_por_kg
-
-    def calcular_impuesto_aduanero(self):
-        configuracion = Configuracion.objects.first()
-        if configuracion and configuracion.dolar_aduanero:
-            dolar_aduanero = configuracion.dolar_aduanero
-
-            tasa_arancel = configuracion.tasa_arancel
-            tasa_iva = configuracion.tasa_iva
-
-            valor_cif_usd = self.total_usd + self.calcular_seguro() + self.calcular_flete()
-            valor_cif_clp = valor_cif_usd * dolar_aduanero
-
-            arancel = (valor_cif_clp * tasa_arancel) / Decimal('100.0')
-            iva_importacion = ((valor_cif_clp + arancel) * tasa_iva) / Decimal('100.0')
-
-            total_impuestos = arancel + iva_importacion
-
-            self.total_final_clp = self.total_clp + total_impuestos
-            self.save()
+    def recalcular_totales(self):
+        from .totales import recalcular_totales
+        return recalcular_totales(self)
 
 class DetallePedido(models.Model):
     pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='detalles')
@@ -134,18 +269,35 @@ class DetallePedido(models.Model):
     subtotal_clp = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     peso_kg = models.DecimalField(max_digits=5, decimal_places=2, default=0)
 
+    class Meta:
+        indexes = [
+            # Reconciliación de detalles por producto dentro de un pedido
+            models.Index(fields=['pedido', 'producto'], name='detalle_pedido_producto_idx'),
+        ]
+
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre}"
 
     def save(self, *args, **kwargs):
+        self.calcular_subtotales()
+        super().save(*args, **kwargs)
+
+    def calcular_subtotales(self, configuracion=None):
+        """
+        Calcula los subtotales de la línea sin guardarla.
+
+        Recibe opcionalmente la configuración para que un pedido completo
+        comparta la misma lectura.
+        """
         self.subtotal_usd = self.cantidad * self.producto.precio_usd
-        self.peso_kg = self.cantidad * self.producto.peso_kg
+        self.peso_kg = self.cantidad * (self.producto.peso_kg or Decimal('0'))
 
         if self.producto.precio_final_clp:
             self.subtotal_clp = self.cantidad * self.producto.precio_final_clp
         else:
             if self.pedido.valor_dolar:
-                configuracion = Configuracion.objects.first()
+                if configuracion is None:
+                    configuracion = Configuracion.get_solo()
                 porcentaje_comision = configuracion.porcentaje_comision if configuracion else Decimal('0')
                 precio_usd_con_comision = self.producto.precio_usd + (self.producto.precio_usd * porcentaje_comision / Decimal('100.0'))
                 precio_clp = precio_usd_con_comision * self.pedido.valor_dolar
@@ -153,8 +305,6 @@ class DetallePedido(models.Model):
             else:
                 self.subtotal_clp = Decimal('0')
 
-        super().save(*args, **kwargs)
-
 class Notificacion(models.Model):
     TIPO_NOTIFICACION = [
         ('estado_pedido', 'Estado de Pedido'),
@@ -168,5 +318,82 @@ class Notificacion(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     leida = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'id'], name='notificacion_usuario_id_idx'),
+            models.Index(fields=['usuario', 'id'], condition=models.Q(leida=False), name='notificacion_no_leidas_idx'),
+        ]
+
     def __str__(self):
         return f"Notificación para {self.usuario.username} - {self.tipo}"
+
+class ResumenVentas(models.Model):
+    """
+    Ventas acumuladas por día, estado, marca o producto.
+
+    Cada fila es un grupo (``dimension``, ``clave``): la fecha del pedido en
+    ISO, el estado, la marca o el id del producto. La mantiene
+    ``api.resumenes`` aplicando solo la diferencia de los pedidos que cambian
+    y se recalcula completa con ``manage.py reconstruir_resumenes``.
+    """
+
+    DIA = 'dia'
+    ESTADO = 'estado'
+    MARCA = 'marca'
+    PRODUCTO = 'producto'
+    DIMENSIONES = [
+        (DIA, 'Día'),
+        (ESTADO, 'Estado'),
+        (MARCA, 'Marca'),
+        (PRODUCTO, 'Producto'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSIONES)
+    clave = models.CharField(max_length=50)
+    pedidos = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    total_usd = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_clp = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    # En marca y producto es la parte del total final proporcional al subtotal en CLP
+    total_final_clp = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    peso_total_kg = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # También sirve el rango de fechas de la dimensión día
+            models.UniqueConstraint(fields=['dimension', 'clave'], name='resumen_ventas_dimension_clave_uniq'),
+        ]
+        indexes = [
+            # Ranking de marcas y productos más vendidos
+            models.Index(fields=['dimension', '-total_clp'], name='resumen_ventas_ranking_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_dimension_display()} {self.clave}: {self.pedidos} pedidos"
+
+class AporteResumen(models.Model):
+    """Lo que un pedido ya sumó en ResumenVentas, para aplicar después solo la diferencia."""
+
+    # Sin clave foránea: el aporte de un pedido borrado se necesita para descontarlo
+    pedido = models.BigIntegerField(primary_key=True)
+    # {"dimension:clave": [pedidos, unidades, total_usd, total_clp, total_final_clp, peso_total_kg]}
+    aportes = models.JSONField(default=dict)
+
+class Evento(models.Model):
+    """
+    Registro de los eventos en tiempo real que reparte ``api.eventos``.
+
+    El id es el correlativo que los clientes devuelven en ``Last-Event-ID``:
+    lo asigna la secuencia de la base de datos, así que dos procesos que
+    publican a la vez nunca repiten número. Las filas de más de
+    ``EVENTOS_RETENCION`` segundos se borran al publicar.
+    """
+
+    # Ids de los usuarios destinatarios; null: todos
+    usuarios = models.JSONField(null=True)
+    tipo = models.CharField(max_length=20)
+    datos = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    fecha_creacion = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Evento #{self.pk} ({self.tipo})"
@@ -0,0 +1,51 @@
+from itertools import islice
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from .eventos import publicar
+from .models import Notificacion, Pedido, Usuario
+
+
+def usuarios_destino(usuarios=None, registrados_desde=None, con_pedidos=None, incluir_personal=False):
+    """Usuarios activos que reciben una difusión, según los filtros opcionales."""
+    destino = Usuario.objects.filter(is_active=True)
+    if not incluir_personal:
+        destino = destino.filter(is_staff=False)
+    if usuarios:
+        destino = destino.filter(pk__in=usuarios)
+    if registrados_desde:
+        destino = destino.filter(date_joined__date__gte=registrados_desde)
+    if con_pedidos is not None:
+        tiene_pedidos = Exists(Pedido.objects.filter(cliente=OuterRef('pk')))
+        destino = destino.filter(tiene_pedidos if con_pedidos else ~tiene_pedidos)
+    return destino
+
+
+def difundir(contenido, tipo='promocion', tamano_lote=None, **filtros):
+    """
+    Crea una notificación por cada usuario de ``usuarios_destino(**filtros)``.
+
+    Los ids se leen con un cursor del servidor y las filas se insertan con
+    ``bulk_create`` en lotes de ``tamano_lote``: la memoria no depende de la
+    cantidad de usuarios. Devuelve la cantidad de notificaciones creadas.
+    """
+    tamano_lote = tamano_lote or getattr(settings, 'NOTIFICACIONES_TAMANO_LOTE', 5000)
+    ids = usuarios_destino(**filtros).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=tamano_lote)
+    creadas = 0
+    while True:
+        lote = list(islice(ids, tamano_lote))
+        if not lote:
+            return creadas
+        Notificacion.objects.bulk_create(
+            Notificacion(usuario_id=usuario_id, tipo=tipo, contenido=contenido) for usuario_id in lote
+        )
+        # bulk_create no emite post_save: un aviso por lote para los conectados
+        publicar(lote, 'notificacion', {'tipo': tipo, 'contenido': contenido})
+        creadas += len(lote)
+
+
+def marcar_leidas(usuario, ids=None):
+    """Marca como leídas las notificaciones del usuario (todas o ``ids``) con un único UPDATE."""
+    pendientes = Notificacion.objects.filter(usuario=usuario, leida=False)
+    if ids is not None:
+        pendientes = pendientes.filter(pk__in=ids)
+    return pendientes.update(leida=True)
@@ -0,0 +1,66 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+MAX_PAGE_SIZE = getattr(settings, 'MAX_PAGE_SIZE', 100)
+
+
+class PaginacionPorPagina(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class PaginacionCursor(CursorPagination):
+    """
+    Paginación por cursor: cada página filtra desde la última posición vista
+    en lugar de usar OFFSET, y no calcula COUNT(*).
+
+    Un cursor no puede guardar una posición nula, así que al ordenar por un
+    campo que admite nulos (por ejemplo ``peso_kg``) esas filas se omiten.
+    Los empates se desempatan por ``id`` en el mismo sentido, para que el
+    desplazamiento dentro de una posición repetida apunte siempre a las
+    mismas filas (y se usen los índices ``(campo, id)``).
+    """
+
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if any(campo.lstrip('-') in ('id', 'pk') for campo in ordering):
+            return ordering
+        return (*ordering, '-id' if ordering[0].startswith('-') else 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        campo = self.get_ordering(request, queryset, view)[0].lstrip('-')
+        if queryset.model._meta.get_field(campo).null:
+            queryset = queryset.exclude(**{f'{campo}__isnull': True})
+        return super().paginate_queryset(queryset, request, view)
+
+
+class CursorOpcionalMixin:
+    """
+    Permite pedir paginación por cursor con ``?paginacion=cursor``.
+
+    Los enlaces ``next``/``previous`` conservan el parámetro, por lo que el
+    cliente solo debe seguirlos. Sin él se mantiene la paginación por página.
+    """
+
+    pagination_cursor_class = PaginacionCursor
+
+    def usa_cursor(self):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return False
+        parametros = request.query_params
+        return parametros.get('paginacion') == 'cursor' or PaginacionCursor.cursor_query_param in parametros
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.usa_cursor():
+                self._paginator = self.pagination_cursor_class()
+            else:
+                return super().paginator
+        return self._paginator
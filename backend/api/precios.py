@@ -0,0 +1,42 @@
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Now
+from .models import Configuracion, Producto, VersionColeccion
+
+
+def factor_clp(valor_dolar, configuracion):
+    """Multiplicador que lleva un precio en USD a CLP con la comisión incluida."""
+    porcentaje_comision = configuracion.porcentaje_comision if configuracion else Decimal('0')
+    return (Decimal('1') + porcentaje_comision / Decimal('100.0')) * Decimal(valor_dolar)
+
+
+def repreciar_productos(productos=None, valor_dolar=None):
+    """
+    Recalcula ``precio_clp_efectivo`` de los productos con un único UPDATE.
+
+    Los productos con ``precio_final_clp`` conservan ese precio; el resto se
+    calcula desde ``precio_usd``. Sin tipo de cambio disponible no se modifica
+    nada. Devuelve la cantidad de filas actualizadas.
+
+    Al no pasar por ``save()`` fija el sello de modificación y la versión del
+    catálogo para invalidar las respuestas condicionales.
+    """
+    if valor_dolar is None:
+        from .utils import obtener_valor_dolar
+        valor_dolar, _ = obtener_valor_dolar()
+    if not valor_dolar:
+        return 0
+
+    factor = factor_clp(valor_dolar, Configuracion.get_solo())
+    campo = DecimalField(max_digits=12, decimal_places=2)
+    precio = Case(
+        When(Q(precio_final_clp__isnull=False) & ~Q(precio_final_clp=0), then=F('precio_final_clp')),
+        default=F('precio_usd') * Value(factor, output_field=campo),
+        output_field=campo,
+    )
+    if productos is None:
+        productos = Producto.objects.all()
+    actualizados = productos.update(precio_clp_efectivo=precio, fecha_modificacion=Now())
+    if actualizados:
+        VersionColeccion.incrementar(VersionColeccion.PRODUCTOS)
+    return actualizados
@@ -0,0 +1,294 @@
+"""
+Resúmenes de ventas por día, estado, marca y producto (``ResumenVentas``).
+
+Cada pedido aporta una fila a su día y a su estado, y una por cada marca y
+producto de sus líneas. Lo ya sumado queda en ``AporteResumen``: al cambiar un
+pedido se recalcula solo su aporte y se aplica la diferencia, así el costo
+depende de los pedidos tocados y no del historial. Los caminos que cambian
+totales o estado llaman a ``programar_sincronizacion``, que sincroniza en
+segundo plano una vez confirmada la transacción.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework import serializers
+from .models import AporteResumen, DetallePedido, Pedido, Producto, ResumenVentas
+from .totales import CENTAVOS
+
+CAMPOS_RESUMEN = ['pedidos', 'unidades', 'total_usd', 'total_clp', 'total_final_clp', 'peso_total_kg']
+TAMANO_LOTE = getattr(settings, 'RESUMENES_TAMANO_LOTE', 2000)
+CERO = [0, 0, Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0')]
+
+
+def _sumar(acumulado, valores, signo=1):
+    return [a + signo * v for a, v in zip(acumulado, valores)]
+
+
+def _a_json(valores):
+    return [valores[0], valores[1], *(str(valor) for valor in valores[2:])]
+
+
+def _desde_json(valores):
+    return [valores[0], valores[1], *(Decimal(valor) for valor in valores[2:])]
+
+
+def aportes(ids):
+    """
+    Aporte actual de cada pedido: ``{pedido_id: {'dimension:clave': valores}}``.
+
+    Los pedidos se bloquean para que dos sincronizaciones del mismo pedido no
+    se crucen. Un pedido que ya no existe no aparece.
+    """
+    pedidos = (
+        Pedido.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+        .annotate(dia=TruncDate('fecha_pedido'))
+        .values_list('pk', 'dia', 'estado', 'total_usd', 'total_clp', 'total_final_clp', 'peso_total_kg')
+    )
+    lineas = {}
+    for linea in (
+        DetallePedido.objects.filter(pedido_id__in=ids).order_by()
+        .values('pedido_id', 'producto_id', 'producto__marca')
+        .annotate(unidades=Sum('cantidad'), usd=Sum('subtotal_usd'), clp=Sum('subtotal_clp'), peso=Sum('peso_kg'))
+    ):
+        lineas.setdefault(linea['pedido_id'], []).append(linea)
+
+    resultado = {}
+    for pk, dia, estado, total_usd, total_clp, total_final_clp, peso_total_kg in pedidos:
+        propias = lineas.get(pk, [])
+        pedido = [1, sum(linea['unidades'] for linea in propias), total_usd, total_clp, total_final_clp, peso_total_kg]
+        aporte = {f'{ResumenVentas.DIA}:{dia.isoformat()}': pedido, f'{ResumenVentas.ESTADO}:{estado}': pedido}
+        productos = []
+        for linea in propias:
+            clp = linea['clp'] or Decimal('0')
+            final = (total_final_clp * clp / total_clp).quantize(CENTAVOS) if total_clp else Decimal('0')
+            productos.append([1, linea['unidades'], linea['usd'] or Decimal('0'), clp, final, linea['peso'] or Decimal('0')])
+        if productos and total_clp:
+            # El redondeo sobrante va a la línea mayor: las partes suman el total final
+            mayor = max(productos, key=lambda valores: valores[3])
+            mayor[4] += total_final_clp - sum(valores[4] for valores in productos)
+        marcas = {}
+        for linea, valores in zip(propias, productos):
+            aporte[f"{ResumenVentas.PRODUCTO}:{linea['producto_id']}"] = valores
+            marca = linea['producto__marca']
+            # Un pedido cuenta una vez por marca aunque tenga varios productos de ella
+            marcas[marca] = _sumar(marcas[marca], valores) if marca in marcas else valores
+        for marca, valores in marcas.items():
+            aporte[f'{ResumenVentas.MARCA}:{marca}'] = [1, *valores[1:]]
+        resultado[pk] = aporte
+    return resultado
+
+
+def _aplicar(diferencias):
+    """Suma ``{(dimension, clave): valores}`` a ResumenVentas, creando los grupos nuevos."""
+    if not diferencias:
+        return
+    ResumenVentas.objects.bulk_create(
+        [ResumenVentas(dimension=dimension, clave=clave) for dimension, clave in diferencias], ignore_conflicts=True)
+    por_dimension = {}
+    for dimension, clave in diferencias:
+        por_dimension.setdefault(dimension, []).append(clave)
+    filtro = Q()
+    for dimension, claves in por_dimension.items():
+        filtro |= Q(dimension=dimension, clave__in=claves)
+    # Orden fijo de bloqueo para que dos sincronizaciones no se bloqueen mutuamente
+    filas = list(ResumenVentas.objects.select_for_update().filter(filtro).order_by('dimension', 'clave'))
+    for fila in filas:
+        valores = _sumar([getattr(fila, campo) for campo in CAMPOS_RESUMEN], diferencias[fila.dimension, fila.clave])
+        for campo, valor in zip(CAMPOS_RESUMEN, valores):
+            setattr(fila, campo, valor)
+    ResumenVentas.objects.bulk_update(filas, CAMPOS_RESUMEN, batch_size=500)
+
+
+@transaction.atomic
+def sincronizar(ids):
+    """
+    Lleva los resúmenes al estado actual de los pedidos ``ids``.
+
+    Resta lo que cada pedido había aportado, suma su aporte actual y guarda
+    este último. Es idempotente: repetirla sin cambios no modifica nada.
+    Devuelve la cantidad de grupos que cambiaron.
+    """
+    ids = sorted(set(ids))
+    actuales = aportes(ids)
+    anteriores = {
+        aporte.pedido: aporte.aportes
+        for aporte in AporteResumen.objects.select_for_update().filter(pedido__in=ids).order_by('pedido')
+    }
+    diferencias = {}
+    for pk in ids:
+        anterior = {clave: _desde_json(valores) for clave, valores in anteriores.get(pk, {}).items()}
+        actual = actuales.get(pk, {})
+        for clave in anterior.keys() | actual.keys():
+            diferencia = _sumar(actual.get(clave, CERO), anterior.get(clave, CERO), -1)
+            if any(diferencia):
+                grupo = tuple(clave.split(':', 1))
+                diferencias[grupo] = _sumar(diferencias.get(grupo, CERO), diferencia)
+    _aplicar({grupo: valores for grupo, valores in diferencias.items() if any(valores)})
+
+    if actuales:
+        AporteResumen.objects.bulk_create(
+            [AporteResumen(pedido=pk, aportes={clave: _a_json(v) for clave, v in aporte.items()})
+             for pk, aporte in actuales.items()],
+            update_conflicts=True, unique_fields=['pedido'], update_fields=['aportes'], batch_size=500)
+    borrados = [pk for pk in anteriores if pk not in actuales]
+    if borrados:
+        AporteResumen.objects.filter(pedido__in=borrados).delete()
+    return len(diferencias)
+
+
+class _Pendientes:
+    """Callback de ``on_commit`` que sincroniza los pedidos acumulados en la transacción."""
+
+    def __init__(self, conexion, ids):
+        self.conexion = conexion
+        self.ids = set(ids)
+        self.ejecutado = False
+
+    def __call__(self):
+        from .tasks import tarea_sincronizar_resumenes
+        from .utils import en_segundo_plano
+        # Puede estar registrado varias veces en la misma transacción: corre una sola
+        if self.ejecutado:
+            return
+        self.ejecutado = True
+        if getattr(self.conexion, 'resumenes_pendientes', None) is self:
+            self.conexion.resumenes_pendientes = None
+        en_segundo_plano(tarea_sincronizar_resumenes, sorted(self.ids))
+
+
+def programar_sincronizacion(ids):
+    """
+    Sincroniza los resúmenes de ``ids`` en segundo plano al confirmar la transacción.
+
+    Las llamadas dentro de una transacción se juntan en una sola tarea (el
+    borrado en cascada de muchos pedidos encola una): los ids se acumulan en
+    un ``_Pendientes`` guardado en la conexión, que cada llamada vuelve a
+    registrar en ``on_commit`` por si el registro anterior se descartó con un
+    savepoint revertido. Los ids de un savepoint o transacción revertidos se
+    sincronizan igual con la siguiente; sincronizar de más no altera el
+    resultado.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        # Sin transacción on_commit corre ya: lo que quedara pendiente era de una revertida
+        pendientes = _Pendientes(conexion, ids)
+    else:
+        pendientes = getattr(conexion, 'resumenes_pendientes', None)
+        if pendientes is None or pendientes.ejecutado:
+            pendientes = _Pendientes(conexion, ids)
+        else:
+            pendientes.ids |= ids
+    conexion.resumenes_pendientes = pendientes
+    transaction.on_commit(pendientes)
+
+
+def sincronizar_producto(producto_id, tamano_lote=TAMANO_LOTE):
+    """
+    Sincroniza, por lotes de ``tamano_lote``, los pedidos con ventas de ``producto_id``.
+
+    Para cambios de marca y borrados del producto. Los pedidos se buscan en
+    los aportes ya sumados, que conservan el producto aunque el borrado en
+    cascada haya eliminado sus líneas. Cada lote es su propia transacción.
+    Devuelve la cantidad de pedidos procesados.
+    """
+    clave = f'{ResumenVentas.PRODUCTO}:{producto_id}'
+    procesados = ultimo = 0
+    while True:
+        ids = list(
+            AporteResumen.objects.filter(aportes__has_key=clave, pedido__gt=ultimo)
+            .order_by('pedido').values_list('pedido', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return procesados
+        sincronizar(ids)
+        procesados += len(ids)
+        ultimo = ids[-1]
+
+
+def reconstruir(tamano_lote=TAMANO_LOTE):
+    """
+    Recalcula todos los resúmenes desde los pedidos, por lotes de ``tamano_lote``.
+
+    Corre en una sola transacción: el panel ve los resúmenes anteriores hasta
+    que termina. Devuelve la cantidad de pedidos procesados.
+    """
+    procesados = 0
+    with transaction.atomic():
+        AporteResumen.objects.all().delete()
+        ResumenVentas.objects.all().delete()
+        ultimo = 0
+        while True:
+            ids = list(Pedido.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:tamano_lote])
+            if not ids:
+                break
+            sincronizar(ids)
+            procesados += len(ids)
+            ultimo = ids[-1]
+    return procesados
+
+
+class FiltrosAnaliticaSerializer(serializers.Serializer):
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    # Filas de los rankings de marcas y productos
+    limite = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+
+    def validate(self, datos):
+        hasta = datos.setdefault('hasta', timezone.localdate())
+        desde = datos.setdefault('desde', hasta - timedelta(days=29))
+        if desde > hasta:
+            raise serializers.ValidationError({'desde': 'Debe ser anterior o igual a hasta.'})
+        return datos
+
+
+class ResumenVentasSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumenVentas
+        fields = CAMPOS_RESUMEN
+
+
+def _filas(queryset, nombre_clave, convertir=str):
+    return [{nombre_clave: convertir(fila.clave), **ResumenVentasSerializer(fila).data} for fila in queryset]
+
+
+def analitica(desde, hasta, limite=10):
+    """
+    Totales y ventas por día entre ``desde`` y ``hasta``; por estado y los ``limite`` primeros por marca y producto.
+
+    Los resúmenes por estado, marca y producto no se dividen por día: esas
+    tres secciones son históricas.
+    """
+    nombres_estado = dict(Pedido.ESTADOS_PEDIDO)
+    por_estado = {fila.clave: fila for fila in ResumenVentas.objects.filter(dimension=ResumenVentas.ESTADO)}
+    por_dia = list(ResumenVentas.objects.filter(
+        dimension=ResumenVentas.DIA, clave__gte=desde.isoformat(), clave__lte=hasta.isoformat(),
+    ).order_by('clave'))
+    # Cada pedido está en un solo día: la suma de los días da los totales del período
+    totales = CERO
+    for fila in por_dia:
+        totales = _sumar(totales, [getattr(fila, campo) for campo in CAMPOS_RESUMEN])
+    ranking = ResumenVentas.objects.filter(pedidos__gt=0).order_by('-total_clp', 'clave')
+    productos = _filas(ranking.filter(dimension=ResumenVentas.PRODUCTO)[:limite], 'producto', int)
+    nombres = dict(Producto.objects.filter(pk__in=[fila['producto'] for fila in productos]).values_list('pk', 'nombre'))
+    for fila in productos:
+        fila['nombre'] = nombres.get(fila['producto'], '')
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'totales': ResumenVentasSerializer(ResumenVentas(**dict(zip(CAMPOS_RESUMEN, totales)))).data,
+        'por_estado': [
+            {'estado': estado, 'nombre': nombre,
+             **ResumenVentasSerializer(por_estado.get(estado, ResumenVentas())).data}
+            for estado, nombre in nombres_estado.items()
+        ],
+        'por_dia': _filas(por_dia, 'fecha'),
+        'por_marca': _filas(ranking.filter(dimension=ResumenVentas.MARCA)[:limite], 'marca'),
+        'por_producto': productos,
+    }
@@ -2,7 +2,19 @@ from rest_framework import serializers
 from .models import Producto, Usuario, Pedido, DetallePedido, Notificacion, Configuracion
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.functions import Substr
+from decimal import Decimal
+from .totales import CENTAVOS
+from .imagenes import srcset, variantes_con_url
+from .campos import CamposDinamicosMixin
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .autenticacion import CLAIM_VERSION
+
+# Columnas que acepta la importación masiva de productos
+CAMPOS_IMPORTACION = [
+    'marca', 'nombre', 'descripcion', 'precio_usd', 'peso_kg', 'fecha_compra', 'disponible', 'precio_final_clp',
+]
 
 class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,9 +57,23 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'username', 'email']
 
 class ProductoSerializer(serializers.ModelSerializer):
+    precio_clp = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    imagen_variantes = serializers.SerializerMethodField()
+    imagen_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Producto
-        fields = '__all__'
+        exclude = ['busqueda', 'fecha_modificacion']
+
+    def _construir_url(self, url):
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_imagen_variantes(self, obj):
+        return variantes_con_url(obj.imagen_variantes, self._construir_url)
+
+    def get_imagen_srcset(self, obj):
+        return srcset(obj.imagen_variantes, self._construir_url)
 
     def validate(self, data):
         precio_usd = data.get('precio_usd')
@@ -56,17 +82,89 @@ class ProductoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Debes ingresar el precio en USD o el precio final en CLP.")
         return data
 
+# Caracteres de la descripción que se envían en las tarjetas del catálogo
+LARGO_DESCRIPCION_CORTA = 120
+
+class ProductoListaSerializer(CamposDinamicosMixin, ProductoSerializer):
+    """Producto en el listado: sin la descripción completa salvo que se pida en ``?fields=``."""
+    descripcion_corta = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Producto
+        fields = [
+            'id', 'nombre', 'marca', 'descripcion_corta', 'descripcion', 'precio_usd', 'precio_clp', 'peso_kg',
+            'fecha_compra', 'disponible', 'imagen', 'imagen_variantes', 'imagen_srcset', 'precio_final_clp',
+            'precio_clp_efectivo',
+        ]
+        campos_por_defecto = [
+            'id', 'nombre', 'marca', 'descripcion_corta', 'precio_usd', 'precio_clp', 'peso_kg', 'disponible',
+            'imagen', 'imagen_srcset',
+        ]
+        columnas = {
+            'precio_clp': ['precio_usd', 'precio_final_clp', 'precio_clp_efectivo'],
+            'imagen_srcset': ['imagen_variantes'],
+        }
+
+    @classmethod
+    def preparar_queryset(cls, queryset, campos, expandir, columnas_extra=()):
+        queryset = super().preparar_queryset(queryset, campos, expandir, columnas_extra)
+        if 'descripcion_corta' in campos:
+            # Se recorta en la base de datos: el texto completo no viaja
+            queryset = queryset.annotate(descripcion_corta=Substr('descripcion', 1, LARGO_DESCRIPCION_CORTA))
+        return queryset
+
+    def get_descripcion_corta(self, obj):
+        corta = getattr(obj, 'descripcion_corta', None)
+        return corta if corta is not None else obj.descripcion[:LARGO_DESCRIPCION_CORTA]
+
+    @classmethod
+    def lectores(cls, construir_url=None):
+        return {
+            'descripcion_corta': lambda fila: fila['descripcion_corta'],
+            'precio_clp': precio_clp_de_fila,
+            'imagen_variantes': lambda fila: variantes_con_url(fila['imagen_variantes'], construir_url),
+            'imagen_srcset': lambda fila: srcset(fila['imagen_variantes'], construir_url),
+        }
+
+def precio_clp_de_fila(fila):
+    """``Producto.precio_clp`` a partir de una fila de ``values()``."""
+    if fila['precio_final_clp']:
+        return fila['precio_final_clp']
+    if fila['precio_clp_efectivo'] is not None:
+        return fila['precio_clp_efectivo']
+    # Sin precio precalculado se usa el cálculo del modelo
+    return Producto(precio_usd=fila['precio_usd'], precio_final_clp=fila['precio_final_clp']).precio_clp
+
+class ProductoImportacionSerializer(ProductoSerializer):
+    """Fila de una importación masiva; el upsert por (marca, nombre) lo hace api.importacion."""
+    precio_clp = None
+    imagen_variantes = None
+    imagen_srcset = None
+
+    class Meta:
+        model = Producto
+        fields = CAMPOS_IMPORTACION
+        # Sin la validación de unicidad: la fila existente se actualiza
+        validators = []
+
 class DetallePedidoSerializer(serializers.ModelSerializer):
     producto = serializers.PrimaryKeyRelatedField(queryset=Producto.objects.all())
 
     class Meta:
         model = DetallePedido
-        fields = ['id', 'producto', 'cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg']
+        fields = ['id', 'pedido', 'producto', 'cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg']
         read_only_fields = ['subtotal_usd', 'subtotal_clp', 'peso_kg']
 
+class DetallePedidoAnidadoSerializer(DetallePedidoSerializer):
+    # Los productos se validan en bloque en PedidoSerializer.validate_detalles
+    producto = serializers.IntegerField(source='producto_id')
+
+    class Meta(DetallePedidoSerializer.Meta):
+        fields = ['id', 'producto', 'cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg']
+
 class PedidoSerializer(serializers.ModelSerializer):
     cliente = UsuarioSerializer(read_only=True)
-    detalles = DetallePedidoSerializer(many=True)
+    detalles = DetallePedidoAnidadoSerializer(many=True)
 
     class Meta:
         model = Pedido
@@ -77,46 +175,150 @@ class PedidoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'fecha_pedido', 'total_usd', 'total_clp',
                             'peso_total_kg', 'valor_dolar', 'total_final_clp']
 
+    def validate_detalles(self, detalles):
+        ids = {detalle['producto_id'] for detalle in detalles}
+        productos = Producto.objects.in_bulk(ids)
+        if len(productos) < len(ids):
+            mensaje = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+            raise serializers.ValidationError([
+                {} if detalle['producto_id'] in productos
+                else {'producto': [mensaje.format(pk_value=detalle['producto_id'])]}
+                for detalle in detalles
+            ])
+        for detalle in detalles:
+            detalle['producto'] = productos[detalle.pop('producto_id')]
+        return detalles
+
+    def crear_detalles(self, pedido, detalles_data):
+        configuracion = Configuracion.get_solo()
+        detalles = [
+            DetallePedido(pedido=pedido, producto=detalle_data['producto'], cantidad=detalle_data.get('cantidad', 1))
+            for detalle_data in detalles_data
+        ]
+        for detalle in detalles:
+            detalle.calcular_subtotales(configuracion)
+        return DetallePedido.objects.bulk_create(detalles)
+
     @transaction.atomic
     def create(self, validated_data):
         detalles_data = validated_data.pop('detalles')
-        pedido = Pedido.objects.create(cliente=self.context['request'].user, **validated_data)
+        validated_data.setdefault('cliente', self.context['request'].user)
+        pedido = Pedido.objects.create(**validated_data)
+        self.crear_detalles(pedido, detalles_data)
+        pedido.recalcular_totales()
+        return pedido
+
+    def reconciliar_detalles(self, pedido, detalles_data):
+        """
+        Ajusta los detalles del pedido a ``detalles_data`` tocando solo lo necesario.
+
+        Las líneas se comparan por producto: las existentes cuyo cálculo cambia
+        se escriben con un ``bulk_update``, las nuevas con un ``bulk_create`` y
+        las que sobran se borran en una sola consulta.
+        """
+        cantidades = {}
+        productos = {}
         for detalle_data in detalles_data:
             producto = detalle_data['producto']
-            cantidad = detalle_data['cantidad']
-            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad)
-        pedido.actualizar_totales()
-        pedido.calcular_impuesto_aduanero()
-        return pedido
+            productos[producto.pk] = producto
+            cantidades[producto.pk] = cantidades.get(producto.pk, 0) + detalle_data.get('cantidad', 1)
+
+        configuracion = Configuracion.get_solo()
+        actualizados = []
+        eliminados = []
+        for detalle in DetallePedido.objects.filter(pedido=pedido).select_related('producto').order_by('id'):
+            cantidad = cantidades.pop(detalle.producto_id, None)
+            if cantidad is None:
+                eliminados.append(detalle.pk)
+                continue
+            anteriores = [detalle.cantidad, detalle.subtotal_usd, detalle.subtotal_clp, detalle.peso_kg]
+            detalle.pedido = pedido
+            detalle.cantidad = cantidad
+            detalle.calcular_subtotales(configuracion)
+            nuevos = [detalle.cantidad] + [
+                Decimal(valor).quantize(CENTAVOS) for valor in (detalle.subtotal_usd, detalle.subtotal_clp, detalle.peso_kg)
+            ]
+            if nuevos != anteriores:
+                actualizados.append(detalle)
+
+        if actualizados:
+            DetallePedido.objects.bulk_update(actualizados, ['cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg'])
+        if eliminados:
+            DetallePedido.objects.filter(pk__in=eliminados).delete()
+        creados = self.crear_detalles(pedido, [
+            {'producto': productos[producto_id], 'cantidad': cantidad} for producto_id, cantidad in cantidades.items()
+        ]) if cantidades else []
+
+        return {'creados': len(creados), 'actualizados': len(actualizados), 'eliminados': len(eliminados)}
 
     @transaction.atomic
     def update(self, instance, validated_data):
         detalles_data = validated_data.pop('detalles', None)
         # Actualizar campos del pedido si es necesario
-        instance.estado = validated_data.get('estado', instance.estado)
-        instance.save()
+        if 'estado' in validated_data:
+            instance.estado = validated_data['estado']
+            instance.save(update_fields=['estado'])
 
+        self.resumen_detalles = None
         if detalles_data is not None:
-            # Opcional: Manejar actualización de detalles (ejemplo simple: eliminar y recrear)
-            instance.detalles.all().delete()
-            for detalle_data in detalles_data:
-                producto = detalle_data['producto']
-                cantidad = detalle_data['cantidad']
-                DetallePedido.objects.create(pedido=instance, producto=producto, cantidad=cantidad)
-            instance.actualizar_totales()
-            instance.calcular_impuesto_aduanero()
+            self.resumen_detalles = self.reconciliar_detalles(instance, detalles_data)
+            instance.recalcular_totales()
 
         return instance
 
+class PedidoListaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """Pedido en el listado: el cliente como id y sin líneas, salvo ``?expand=cliente,detalles``."""
+    cliente = serializers.IntegerField(source='cliente_id', read_only=True)
+    expandibles = {
+        'cliente': lambda: UsuarioSerializer(read_only=True),
+        'detalles': lambda: DetallePedidoAnidadoSerializer(many=True, read_only=True),
+    }
+
+    class Meta:
+        model = Pedido
+        fields = [
+            'id', 'cliente', 'fecha_pedido', 'estado', 'total_usd', 'total_clp',
+            'peso_total_kg', 'valor_dolar', 'total_final_clp', 'detalles'
+        ]
+        campos_por_defecto = fields[:-1]
+
+    @classmethod
+    def expandir_queryset(cls, queryset, relacion):
+        if relacion == 'cliente':
+            return queryset.select_related('cliente'), {f'cliente__{campo}' for campo in UsuarioSerializer.Meta.fields}
+        if relacion == 'detalles':
+            lineas = DetallePedido.objects.only(
+                'id', 'pedido', 'producto', 'cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg')
+            return queryset.prefetch_related(Prefetch('detalles', queryset=lineas)), set()
+        return super().expandir_queryset(queryset, relacion)
+
 class NotificacionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notificacion
         fields = '__all__'
 
+class DifusionNotificacionSerializer(serializers.Serializer):
+    contenido = serializers.CharField()
+    tipo = serializers.ChoiceField(choices=Notificacion.TIPO_NOTIFICACION, default='promocion')
+    # Filtros de destinatarios; sin filtros se notifica a todos los clientes activos
+    usuarios = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    registrados_desde = serializers.DateField(required=False)
+    con_pedidos = serializers.BooleanField(required=False, allow_null=True, default=None)
+    incluir_personal = serializers.BooleanField(default=False)
+
+class CambioEstadoPedidosSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+    estado = serializers.ChoiceField(choices=Pedido.ESTADOS_PEDIDO)
+
+class MarcarLeidasSerializer(serializers.Serializer):
+    # Sin ids se marcan todas las pendientes del usuario
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+
 class ConfiguracionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Configuracion
-        fields = '__all__'
+        exclude = ['fecha_modificacion']
+        read_only_fields = ['dolar_observado', 'fecha_actualizacion_dolar_observado']
 
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True, write_only=True)
@@ -130,5 +332,6 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Agregar campos personalizados al token
         token['is_staff'] = user.is_staff
         token['is_superuser'] = user.is_superuser
+        token[CLAIM_VERSION] = user.version_token
 
         return token
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_init, post_save, post_delete
+from django.dispatch import receiver
+from .autenticacion import invalidar_usuario
+from .models import Configuracion, Notificacion, Pedido, Producto, Usuario, VersionColeccion
+from .resumenes import programar_sincronizacion
+
+
+@receiver(post_save, sender=Configuracion)
+@receiver(post_delete, sender=Configuracion)
+def invalidar_configuracion(sender, **kwargs):
+    VersionColeccion.incrementar(VersionColeccion.CONFIGURACION)
+    Configuracion.limpiar_cache()
+    # Otra petición pudo leer la fila antigua antes del commit
+    transaction.on_commit(Configuracion.limpiar_cache)
+
+
+@receiver(pre_save, sender=Configuracion)
+def detectar_cambio_comision(sender, instance, **kwargs):
+    anterior = None
+    if instance.pk:
+        anterior = Configuracion.objects.filter(pk=instance.pk).values_list('porcentaje_comision', flat=True).first()
+    instance._repreciar = anterior != instance.porcentaje_comision
+
+
+@receiver(post_save, sender=Configuracion)
+def repreciar_por_comision(sender, instance, **kwargs):
+    if getattr(instance, '_repreciar', False):
+        from .tasks import tarea_repreciar_productos
+        transaction.on_commit(tarea_repreciar_productos.delay)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def versionar_productos(sender, **kwargs):
+    VersionColeccion.incrementar(VersionColeccion.PRODUCTOS)
+
+
+@receiver(post_save, sender=Producto)
+def generar_variantes_imagen(sender, instance, raw=False, **kwargs):
+    if raw or (instance.imagen.name or '') == instance.imagen_variantes.get('origen', ''):
+        return
+    from .tasks import tarea_generar_variantes_imagen
+    from .utils import en_segundo_plano
+    producto_id = instance.pk
+    # Pillow trabaja fuera de la petición, una vez confirmada la subida
+    transaction.on_commit(lambda: en_segundo_plano(tarea_generar_variantes_imagen, producto_id))
+
+
+@receiver(post_init, sender=Producto)
+def recordar_marca(sender, instance, **kwargs):
+    instance._marca_original = None if 'marca' in instance.get_deferred_fields() else instance.marca
+
+
+def _sincronizar_producto(producto_id):
+    from .tasks import tarea_sincronizar_producto
+    from .utils import en_segundo_plano
+    # La tarea busca los pedidos por lotes: la petición no los lee
+    transaction.on_commit(lambda: en_segundo_plano(tarea_sincronizar_producto, producto_id))
+
+
+@receiver(post_save, sender=Producto)
+def resumir_cambio_marca(sender, instance, created, raw=False, **kwargs):
+    anterior, instance._marca_original = instance._marca_original, instance.marca
+    if created or raw or anterior is None or anterior == instance.marca:
+        return
+    # Las ventas del producto pasan a la nueva marca en los resúmenes
+    _sincronizar_producto(instance.pk)
+
+
+@receiver(post_delete, sender=Producto)
+def resumir_producto_eliminado(sender, instance, **kwargs):
+    _sincronizar_producto(instance.pk)
+
+
+@receiver(post_save, sender=Notificacion)
+def publicar_notificacion(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    from .eventos import publicar
+    from .serializers import NotificacionSerializer
+    datos = NotificacionSerializer(instance).data
+    transaction.on_commit(lambda: publicar([instance.usuario_id], 'notificacion', datos))
+
+
+@receiver(post_init, sender=Pedido)
+def recordar_estado_pedido(sender, instance, **kwargs):
+    # Con el estado diferido (only/defer) no se consulta para no sumar queries
+    instance._estado_original = None if 'estado' in instance.get_deferred_fields() else instance.estado
+
+
+@receiver(post_save, sender=Pedido)
+def publicar_estado_pedido(sender, instance, created, raw=False, **kwargs):
+    anterior = instance._estado_original
+    instance._estado_original = instance.estado
+    if created or raw or anterior is None or anterior == instance.estado:
+        return
+    from .eventos import publicar
+    datos = {'id': instance.pk, 'estado': instance.estado, 'estado_anterior': anterior}
+    transaction.on_commit(lambda: publicar([instance.cliente_id], 'pedido', datos))
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def resumir_pedido(sender, instance, raw=False, **kwargs):
+    if not raw:
+        programar_sincronizacion([instance.pk])
+
+
+CREDENCIALES = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+
+@receiver(post_init, sender=Usuario)
+def recordar_credenciales(sender, instance, **kwargs):
+    diferidos = instance.get_deferred_fields()
+    instance._credenciales = None if diferidos & set(CREDENCIALES) else tuple(getattr(instance, campo) for campo in CREDENCIALES)
+
+
+@receiver(pre_save, sender=Usuario)
+def revocar_tokens(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    anteriores = instance._credenciales
+    if anteriores is None:
+        # Cargado con credenciales diferidas: no hay con qué comparar y leerlas sería otra consulta
+        return
+    actuales = instance._credenciales = tuple(getattr(instance, campo) for campo in CREDENCIALES)
+    if instance._state.adding or anteriores == actuales:
+        return
+    # Un guardado parcial (p. ej. el rehash de la contraseña al iniciar sesión) no revoca
+    if update_fields is None or 'version_token' in update_fields:
+        instance.version_token += 1
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_usuario_autenticado(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
+    # Otra petición pudo guardar en el caché la fila antigua antes del commit
+    usuario_id = instance.pk
+    transaction.on_commit(lambda: invalidar_usuario(usuario_id))
@@ -1,7 +1,145 @@
+import threading
+import time
+from decimal import Decimal
+from functools import wraps
 from celery import shared_task
+from celery.signals import task_prerun, task_postrun
+from django.core.cache import cache
 from api.models import Configuracion
+from api.precios import repreciar_productos
+
+
+class ErrorFuenteExterna(Exception):
+    """La fuente externa no entregó un valor; la tarea se reintenta."""
+
+
+# Reintentos con espera exponencial (30s, 60s, 120s... hasta 10 minutos)
+REINTENTOS = {
+    'autoretry_for': (ErrorFuenteExterna,),
+    'retry_backoff': 30,
+    'retry_backoff_max': 600,
+    'retry_jitter': True,
+    'max_retries': 5,
+}
+
+
+def sin_duplicados(timeout=300):
+    """
+    Descarta la ejecución si otra igual ya está en curso en cualquier worker.
+
+    El bloqueo vive en el caché de Django, por lo que solo es global entre
+    procesos si el caché es compartido.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = f'tareas:bloqueo:{funcion.__name__}'
+            if not cache.add(clave, True, timeout=timeout):
+                print(f"{funcion.__name__} ya está en ejecución, se omite.")
+                return None
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                cache.delete(clave)
+        return envoltura
+    return decorador
+
+
+@shared_task(bind=True, **REINTENTOS)
+@sin_duplicados()
+def tarea_actualizar_dolar(self):
+    from api.utils import proveedor_dolar
+    try:
+        valor, _ = proveedor_dolar.refrescar()
+    finally:
+        # El proveedor toma este bloqueo al encolar el refresco
+        cache.delete(proveedor_dolar.clave_bloqueo)
+    if not valor:
+        raise ErrorFuenteExterna('No se pudo obtener el valor del dólar.')
+    return str(valor)
+
+
+@shared_task(bind=True, **REINTENTOS)
+@sin_duplicados()
+def tarea_actualizar_dolar_aduanero(self):
+    configuracion = Configuracion.get_solo() or Configuracion.objects.create()
+    valor = configuracion.actualizar_dolar_aduanero()
+    if not valor:
+        raise ErrorFuenteExterna('No se pudo obtener el valor del dólar aduanero.')
+    return str(valor)
+
+
+@shared_task
+def tarea_repreciar_productos(valor_dolar=None):
+    if valor_dolar is not None:
+        valor_dolar = Decimal(valor_dolar)
+    return repreciar_productos(valor_dolar=valor_dolar)
+
+
+@shared_task
+def tarea_generar_variantes_imagen(producto_id):
+    from api.imagenes import generar_variantes
+    return generar_variantes(producto_id)
+
 
 @shared_task
-def tarea_actualizar_dolar_aduanero():
-    configuracion, created = Configuracion.objects.get_or_create(id=1)
-    configuracion.actualizar_dolar_aduanero()
+def tarea_sincronizar_resumenes(pedido_ids):
+    from api.resumenes import sincronizar
+    return sincronizar(pedido_ids)
+
+
+@shared_task
+def tarea_sincronizar_producto(producto_id):
+    from api.resumenes import sincronizar_producto
+    return sincronizar_producto(producto_id)
+
+
+@shared_task
+def tarea_difundir_notificacion(contenido, tipo='promocion', filtros=None):
+    from api.notificaciones import difundir
+    return difundir(contenido, tipo=tipo, **(filtros or {}))
+
+
+_inicios = {}
+_bloqueo_metricas = threading.Lock()
+
+
+def clave_metricas(nombre):
+    return f'tareas:metricas:{nombre}'
+
+
+def metricas_tarea(nombre):
+    return cache.get(clave_metricas(nombre)) or {
+        'ejecuciones': 0,
+        'errores': 0,
+        'reintentos': 0,
+        'duracion_ultima_ms': None,
+        'duracion_total_ms': 0.0,
+        'duracion_maxima_ms': 0.0,
+    }
+
+
+def _registrar(nombre, duracion_ms, estado):
+    with _bloqueo_metricas:
+        metricas = metricas_tarea(nombre)
+        metricas['ejecuciones'] += 1
+        if estado == 'RETRY':
+            metricas['reintentos'] += 1
+        elif estado != 'SUCCESS':
+            metricas['errores'] += 1
+        metricas['duracion_ultima_ms'] = duracion_ms
+        metricas['duracion_total_ms'] += duracion_ms
+        metricas['duracion_maxima_ms'] = max(metricas['duracion_maxima_ms'], duracion_ms)
+        cache.set(clave_metricas(nombre), metricas, timeout=None)
+
+
+@task_prerun.connect
+def iniciar_medicion(task_id=None, **kwargs):
+    _inicios[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def terminar_medicion(task_id=None, task=None, state=None, **kwargs):
+    inicio = _inicios.pop(task_id, None)
+    if inicio is not None and task is not None:
+        _registrar(task.name, (time.perf_counter() - inicio) * 1000, state)
@@ -1,3 +1,1939 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import requests
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import (
+    AporteResumen, Configuracion, Producto, Usuario, Pedido, DetallePedido, Notificacion, ResumenVentas, TipoCambio,
+    VersionColeccion, CLAVE_VERSION_CONFIGURACION,
+    iniciar_memoria_peticion, terminar_memoria_peticion,
+)
+from .benchmarks import ENDPOINTS, ConexionAsgi, medir, preparar_endpoints
+from .cache_respuestas import CacheRespuestas, cache_catalogo
+from .carga import comparar_carga, medir_carga
+from .eventos import backend as backend_eventos, canjear_ticket, emitir_ticket, formatear, publicar
+from .imagenes import generar_variantes
+from .lectura import Lector, a_json
+from .importacion import importar_productos
+from .notificaciones import difundir
+from .transiciones import cambiar_estado
+from .middleware import brotli
+from . import tipos_cambio
+from .precios import repreciar_productos
+from .resumenes import CAMPOS_RESUMEN, _Pendientes, reconstruir, sincronizar, sincronizar_producto
+from .tasks import (
+    ErrorFuenteExterna, metricas_tarea, tarea_actualizar_dolar, tarea_actualizar_dolar_aduanero,
+    tarea_difundir_notificacion, tarea_generar_variantes_imagen,
+)
+from .totales import calcular_totales, recalcular_totales
+from .utils import URL_DOLAR_ADUANERO, ProveedorTipoCambio, parsear_tabla_dolar_aduanero
+
+
+class RespuestaFalsa:
+    def __init__(self, datos=None, error=None, contenido=b'', status_code=200, headers=None):
+        self.datos = datos
+        self.error = error
+        self.content = contenido
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.error:
+            raise self.error
+
+    def json(self):
+        return self.datos
+
+
+class HttpFalso:
+    """Reemplazo de ``requests`` que responde según la URL consultada."""
+
+    def __init__(self, respuestas=None):
+        self.respuestas = respuestas or {}
+        self.llamadas = []
+
+    def get(self, url, timeout=None, headers=None):
+        self.llamadas.append(url)
+        self.cabeceras = headers
+        respuesta = self.respuestas.get(url)
+        if respuesta is None:
+            raise requests.exceptions.ConnectionError(url)
+        return respuesta
+
+
+URL_MINDICADOR = 'https://mindicador.cl/api/dolar'
+URL_GAEL = 'https://api.gael.cloud/general/public/monedas/USD'
+
+
+def respuesta_mindicador(valor, fecha='2024-11-21T03:00:00.000Z'):
+    return RespuestaFalsa({'serie': [{'valor': valor, 'fecha': fecha}]})
+
+
+def ejecutar_inmediato(funcion):
+    funcion()
+
+
+class ProveedorTipoCambioTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.configuracion = Configuracion.objects.create()
+        self.http = HttpFalso({URL_MINDICADOR: respuesta_mindicador(950.5)})
+        self.proveedor = ProveedorTipoCambio(http=self.http, ejecutor=ejecutar_inmediato, ttl=60)
+
+    def test_primera_consulta_va_a_la_red_y_luego_usa_memoria(self):
+        self.assertEqual(self.proveedor.obtener(), (Decimal('950.5'), '2024-11-21T03:00:00.000Z'))
+        self.assertEqual(self.proveedor.obtener()[0], Decimal('950.5'))
+        self.assertEqual(len(self.http.llamadas), 1)
+        metricas = self.proveedor.metricas()
+        self.assertEqual(metricas['fallos'], 1)
+        self.assertEqual(metricas['aciertos_memoria'], 1)
+        self.assertEqual(metricas['refrescos'], 1)
+        self.assertIsNotNone(metricas['latencia_ultimo_refresco_ms'])
+
+    def test_comparte_el_valor_entre_procesos_via_cache(self):
+        self.proveedor.obtener()
+        otro = ProveedorTipoCambio(http=HttpFalso(), ejecutor=ejecutar_inmediato, ttl=60)
+        self.assertEqual(otro.obtener()[0], Decimal('950.5'))
+        self.assertEqual(otro.metricas()['aciertos_cache'], 1)
+
+    def test_persiste_el_ultimo_valor_bueno(self):
+        self.proveedor.obtener()
+        self.configuracion.refresh_from_db()
+        self.assertEqual(self.configuracion.dolar_observado, Decimal('950.50'))
+
+        cache.clear()
+        sin_red = ProveedorTipoCambio(http=HttpFalso(), ejecutor=lambda funcion: None, ttl=60)
+        self.assertEqual(sin_red.obtener()[0], Decimal('950.50'))
+        self.assertEqual(sin_red.metricas()['aciertos_bd'], 1)
+
+    def envejecer(self, segundos):
+        valor, fecha, obtenido_en = self.proveedor._local
+        self.proveedor._local = (valor, fecha, obtenido_en - segundos)
+        cache.set(self.proveedor.clave_cache, self.proveedor._local)
+
+    def test_valor_vencido_se_entrega_y_se_refresca(self):
+        self.proveedor.obtener()
+        self.envejecer(120)
+        self.http.respuestas[URL_MINDICADOR] = respuesta_mindicador(960.0)
+
+        self.assertEqual(self.proveedor.obtener()[0], Decimal('950.5'))
+        self.assertEqual(self.proveedor.metricas()['obsoletos_servidos'], 1)
+        self.assertEqual(self.proveedor.obtener()[0], Decimal('960.0'))
+
+        pendientes = []
+        diferido = ProveedorTipoCambio(http=self.http, ejecutor=pendientes.append, ttl=0)
+        self.assertEqual(diferido.obtener()[0], Decimal('960.0'))
+        self.assertEqual(len(pendientes), 1)
+
+    def test_memoria_vencida_relee_el_cache_compartido(self):
+        self.proveedor.obtener()
+        self.envejecer(120)
+        # Otro proceso refrescó el valor
+        otro = ProveedorTipoCambio(http=HttpFalso({URL_MINDICADOR: respuesta_mindicador(970.0)}), ttl=60, al_cambiar=None)
+        otro.refrescar()
+        self.assertEqual(self.proveedor.obtener()[0], Decimal('970.0'))
+        self.assertEqual(self.proveedor.metricas()['obsoletos_servidos'], 0)
+        self.assertEqual(len(self.http.llamadas), 1)
+
+    def test_mas_viejo_que_max_obsoleto_consulta_en_linea(self):
+        proveedor = ProveedorTipoCambio(http=self.http, ejecutor=lambda funcion: None, ttl=60, max_obsoleto=60)
+        proveedor.obtener()
+        proveedor._local = (Decimal('900'), '2024-11-20', time.time() - 90)
+        cache.set(proveedor.clave_cache, proveedor._local)
+        # Dentro del margen se entrega el vencido
+        self.assertEqual(proveedor.obtener()[0], Decimal('900'))
+        proveedor._local = (Decimal('900'), '2024-11-20', time.time() - 150)
+        cache.set(proveedor.clave_cache, proveedor._local)
+        self.assertEqual(proveedor.obtener()[0], Decimal('950.5'))
+        self.assertEqual(len(self.http.llamadas), 2)
+
+    def test_usa_la_api_de_respaldo(self):
+        http = HttpFalso({URL_GAEL: RespuestaFalsa({'Valor': '941,25', 'Fecha': '2024-11-21'})})
+        proveedor = ProveedorTipoCambio(http=http, ejecutor=ejecutar_inmediato)
+        self.assertEqual(proveedor.obtener(), (Decimal('941.25'), '2024-11-21'))
+
+    def test_sin_red_ni_respaldo_devuelve_none(self):
+        proveedor = ProveedorTipoCambio(http=HttpFalso(), ejecutor=ejecutar_inmediato)
+        self.assertEqual(proveedor.obtener(), (None, None))
+        self.assertEqual(proveedor.metricas()['refrescos_fallidos'], 1)
+
+
+class TareasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Configuracion.objects.create()
+        self.http = HttpFalso({URL_MINDICADOR: respuesta_mindicador(950.5)})
+        self.proveedor = ProveedorTipoCambio(http=self.http, ejecutor=ejecutar_inmediato, al_cambiar=None)
+        parche = mock.patch('api.utils.proveedor_dolar', self.proveedor)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_refresco_del_dolar_registra_metricas(self):
+        self.assertEqual(tarea_actualizar_dolar.delay().get(), '950.5')
+        self.assertEqual(Configuracion.objects.get().dolar_observado, Decimal('950.50'))
+        metricas = metricas_tarea(tarea_actualizar_dolar.name)
+        self.assertEqual(metricas['ejecuciones'], 1)
+        self.assertEqual(metricas['errores'], 0)
+        self.assertIsNotNone(metricas['duracion_ultima_ms'])
+
+    def test_fuente_caida_se_reintenta_con_espera(self):
+        self.http.respuestas.clear()
+        with self.assertRaises(Retry) as reintento:
+            tarea_actualizar_dolar.delay()
+        self.assertIsInstance(reintento.exception.exc, ErrorFuenteExterna)
+        # Primer reintento: espera aleatoria de hasta retry_backoff segundos
+        self.assertLessEqual(reintento.exception.when, tarea_actualizar_dolar.retry_backoff)
+        # El bloqueo se libera para que el reintento pueda correr
+        self.assertIsNone(cache.get('tareas:bloqueo:tarea_actualizar_dolar'))
+
+    def test_refresco_en_curso_no_se_duplica(self):
+        cache.add('tareas:bloqueo:tarea_actualizar_dolar', True)
+        self.assertIsNone(tarea_actualizar_dolar.delay().get())
+        self.assertEqual(self.http.llamadas, [])
+
+    def test_dolar_aduanero_se_obtiene_en_la_tarea(self):
+        with mock.patch('api.tipos_cambio.actualizar_dolar_aduanero', return_value=Decimal('940.00')):
+            self.assertEqual(tarea_actualizar_dolar_aduanero.delay().get(), '940.00')
+        self.assertEqual(Configuracion.objects.get().dolar_aduanero, Decimal('940.00'))
+
+    def test_dolar_aduanero_usa_la_configuracion_existente(self):
+        # En PostgreSQL la secuencia no vuelve a 1 entre pruebas
+        Configuracion.objects.all().delete()
+        Configuracion.objects.create(pk=7)
+        with mock.patch('api.tipos_cambio.actualizar_dolar_aduanero', return_value=Decimal('945.00')):
+            tarea_actualizar_dolar_aduanero.delay().get()
+        self.assertEqual(list(Configuracion.objects.values_list('pk', 'dolar_aduanero')), [(7, Decimal('945.00'))])
+
+    def test_con_worker_el_refresco_vencido_se_encola(self):
+        proveedor = ProveedorTipoCambio(http=self.http, ttl=0)
+        proveedor._local = (Decimal('900'), '2024-11-20', time.time() - 10)
+        with mock.patch('api.utils._celery_asincrono', return_value=True), \
+                mock.patch('api.tasks.tarea_actualizar_dolar.delay') as delay:
+            self.assertEqual(proveedor.obtener()[0], Decimal('900'))
+        delay.assert_called_once_with()
+        self.assertEqual(self.http.llamadas, [])
+        self.assertFalse(proveedor._refrescando)
+
+
+class DolarFijoMixin:
+    """Fija el tipo de cambio para que las pruebas no consulten la red."""
+
+    valor_dolar = Decimal('950.00')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        cache_catalogo.limpiar()
+        Configuracion.limpiar_cache()
+        tipos_cambio.limpiar_cache()
+        parche = mock.patch('api.utils.obtener_valor_dolar', return_value=(self.valor_dolar, '2024-11-21'))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+
+def consultas_a(contexto, tabla):
+    return [q['sql'] for q in contexto.captured_queries if f'"{tabla}"' in q['sql']]
+
+
+def escrituras_a(contexto, tabla):
+    return sum(1 for sql in consultas_a(contexto, tabla) if sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')))
+
+
+class ConfiguracionGetSoloTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.configuracion = Configuracion.objects.create(dolar_aduanero=Decimal('940.00'))
+        self.cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        self.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('10.00'), peso_kg=Decimal('0.50'))
+            for i in range(20)
+        ]
+
+    def test_reutiliza_la_misma_consulta(self):
+        Configuracion.limpiar_cache()
+        with self.assertNumQueries(1):
+            self.assertEqual(Configuracion.get_solo(), self.configuracion)
+            Configuracion.get_solo()
+
+    def test_se_invalida_al_guardar_y_borrar(self):
+        Configuracion.get_solo()
+        self.configuracion.porcentaje_comision = Decimal('20.00')
+        self.configuracion.save()
+        self.assertEqual(Configuracion.get_solo().porcentaje_comision, Decimal('20.00'))
+        self.configuracion.delete()
+        self.assertIsNone(Configuracion.get_solo())
+
+    def test_se_invalida_desde_el_viewset(self):
+        Configuracion.get_solo()
+        admin = Usuario.objects.create_user(username='admin', password='clave-segura-123', is_staff=True)
+        api = APIClient()
+        api.force_authenticate(admin)
+        respuesta = api.patch(f'/api/v1/configuracion/{self.configuracion.pk}/', {'tasa_iva': '10.00'}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Configuracion.get_solo().tasa_iva, Decimal('10.00'))
+
+    def test_otro_proceso_invalida_con_la_version_compartida(self):
+        Configuracion.get_solo()
+        # Otro worker guarda: cambia la fila y la versión del caché, no la memoria de este proceso
+        Configuracion.objects.filter(pk=self.configuracion.pk).update(porcentaje_comision=Decimal('30.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(Configuracion.get_solo().porcentaje_comision, Decimal('15.00'))
+        cache.set(CLAVE_VERSION_CONFIGURACION, 'otra')
+        self.assertEqual(Configuracion.get_solo().porcentaje_comision, Decimal('30.00'))
+
+    def test_memoria_por_peticion_ignora_el_cache_de_proceso(self):
+        token = iniciar_memoria_peticion()
+        try:
+            Configuracion.get_solo()
+            Configuracion.limpiar_cache()
+            with self.assertNumQueries(1):
+                Configuracion.get_solo()
+                Configuracion.get_solo()
+        finally:
+            terminar_memoria_peticion(token)
+
+    def test_pedido_de_20_lineas_consulta_la_configuracion_una_vez(self):
+        api = APIClient()
+        api.force_authenticate(self.cliente)
+        Configuracion.limpiar_cache()
+        detalles = [{'producto': p.pk, 'cantidad': 2} for p in self.productos]
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(len(consultas_a(contexto, 'api_configuracion')), 1)
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.total_usd, Decimal('400.00'))
+        self.assertEqual(DetallePedido.objects.filter(pedido=pedido).count(), 20)
+
+
+class RecalcularTotalesTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create(dolar_aduanero=Decimal('940.00'))
+        cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        self.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('12.35') + i, peso_kg=Decimal('0.75'))
+            for i in range(5)
+        ]
+        self.pedido = Pedido.objects.create(cliente=cliente)
+        for i, producto in enumerate(self.productos):
+            DetallePedido.objects.create(pedido=self.pedido, producto=producto, cantidad=i + 1)
+        self.otro = Pedido.objects.create(cliente=cliente)
+        DetallePedido.objects.create(pedido=self.otro, producto=self.productos[0], cantidad=3)
+        # El historial del dólar aduanero queda cargado en el proceso
+        tipos_cambio.serie(TipoCambio.ADUANERO)
+
+    def totales_esperados(self, pedido):
+        detalles = list(pedido.detalles.all())
+        total_usd = sum(d.subtotal_usd for d in detalles)
+        total_clp = sum(d.subtotal_clp for d in detalles)
+        peso = sum(d.peso_kg for d in detalles)
+        configuracion = Configuracion.objects.get()
+        valor_cif_clp = (total_usd + total_usd * configuracion.tasa_seguro / Decimal('100.0') + peso * configuracion.costo_por_kg) * configuracion.dolar_aduanero
+        arancel = valor_cif_clp * configuracion.tasa_arancel / Decimal('100.0')
+        iva = (valor_cif_clp + arancel) * configuracion.tasa_iva / Decimal('100.0')
+        return [round(v, 2) for v in (total_usd, total_clp, peso, total_clp + arancel + iva)]
+
+    def valores(self, pedido):
+        pedido.refresh_from_db()
+        return [pedido.total_usd, pedido.total_clp, pedido.peso_total_kg, pedido.total_final_clp]
+
+    def test_un_pedido_usa_una_agregacion_y_un_update(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(recalcular_totales(self.pedido), 1)
+        self.assertEqual(self.valores(self.pedido), self.totales_esperados(self.pedido))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.pedido.recalcular_totales(), 0)
+
+    def test_solo_actualiza_columnas_modificadas(self):
+        self.pedido.recalcular_totales()
+        Configuracion.objects.update(tasa_iva=Decimal('10.00'))
+        Configuracion.limpiar_cache()
+        with CaptureQueriesContext(connection) as contexto:
+            self.pedido.recalcular_totales()
+        update = contexto.captured_queries[-1]['sql']
+        self.assertIn('"total_final_clp"', update)
+        self.assertNotIn('"total_usd"', update)
+
+    def test_queryset_de_pedidos(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(recalcular_totales(Pedido.objects.all()), 2)
+        for pedido in (self.pedido, self.otro):
+            self.assertEqual(self.valores(pedido), self.totales_esperados(pedido))
+
+    def test_sin_dolar_aduanero_mantiene_total_final(self):
+        Configuracion.objects.update(dolar_aduanero=None)
+        Configuracion.limpiar_cache()
+        self.pedido.recalcular_totales()
+        self.assertEqual(self.valores(self.pedido)[3], Decimal('0'))
+
+    def test_pedido_sin_detalles(self):
+        self.otro.detalles.all().delete()
+        Pedido.objects.filter(pk=self.otro.pk).update(total_usd=Decimal('5.00'))
+        recalcular_totales(Pedido.objects.filter(pk=self.otro.pk))
+        self.assertEqual(self.valores(self.otro)[:3], [Decimal('0')] * 3)
+
+
+class CrearPedidoEnBloqueTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create(dolar_aduanero=Decimal('940.00'), porcentaje_comision=Decimal('12.50'))
+        self.cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('9.99') + i, peso_kg=Decimal('0.35'),
+                precio_final_clp=Decimal('15990.00') if i % 3 == 0 else None,
+            )
+            for i in range(30)
+        ]
+        self.api = APIClient()
+        self.api.force_authenticate(self.cliente)
+
+    def test_resultados_identicos_al_calculo_por_linea(self):
+        detalles = [{'producto': p.pk, 'cantidad': i % 4 + 1} for i, p in enumerate(self.productos)]
+        respuesta = self.api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+
+        pedido = Pedido.objects.get(pk=respuesta.data['id'])
+        referencia = Pedido.objects.create(cliente=self.cliente)
+        for detalle in detalles:
+            DetallePedido.objects.create(pedido=referencia, producto_id=detalle['producto'], cantidad=detalle['cantidad'])
+        referencia.recalcular_totales()
+
+        campos = ['producto_id', 'cantidad', 'subtotal_usd', 'subtotal_clp', 'peso_kg']
+        self.assertEqual(
+            list(pedido.detalles.order_by('producto_id').values_list(*campos)),
+            list(referencia.detalles.order_by('producto_id').values_list(*campos)),
+        )
+        campos = ['total_usd', 'total_clp', 'peso_total_kg', 'total_final_clp']
+        self.assertEqual(
+            Pedido.objects.filter(pk=pedido.pk).values(*campos).get(),
+            Pedido.objects.filter(pk=referencia.pk).values(*campos).get(),
+        )
+        self.assertEqual([d['producto'] for d in respuesta.data['detalles']], [p.pk for p in self.productos])
+
+    def test_cantidad_de_consultas_no_depende_de_las_lineas(self):
+        detalles = [{'producto': p.pk, 'cantidad': 1} for p in self.productos]
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertLessEqual(len(contexto.captured_queries), 10)
+        self.assertEqual(len(consultas_a(contexto, 'api_producto')), 1)
+
+    def test_producto_inexistente(self):
+        detalles = [{'producto': self.productos[0].pk, 'cantidad': 1}, {'producto': 999999, 'cantidad': 1}]
+        respuesta = self.api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['detalles'][0], {})
+        self.assertIn('producto', respuesta.data['detalles'][1])
+        self.assertFalse(Pedido.objects.exists())
+
+
+class ReconciliarDetallesTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create(dolar_aduanero=Decimal('940.00'))
+        self.cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        self.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('20.00') + i, peso_kg=Decimal('1.00'))
+            for i in range(4)
+        ]
+        self.api = APIClient()
+        self.api.force_authenticate(self.cliente)
+        detalles = [{'producto': p.pk, 'cantidad': 1} for p in self.productos[:3]]
+        self.pedido_id = self.api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json').data['id']
+        self.ids = dict(DetallePedido.objects.values_list('producto_id', 'id'))
+
+    def test_actualiza_crea_y_elimina_solo_lo_necesario(self):
+        detalles = [
+            {'producto': self.productos[0].pk, 'cantidad': 1},
+            {'producto': self.productos[1].pk, 'cantidad': 5},
+            {'producto': self.productos[3].pk, 'cantidad': 2},
+        ]
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.api.patch(f'/api/v1/pedidos/{self.pedido_id}/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['detalles_modificados'], {'creados': 1, 'actualizados': 1, 'eliminados': 1})
+        escrituras_detalle = [sql for sql in consultas_a(contexto, 'api_detallepedido') if not sql.startswith('SELECT')]
+        self.assertEqual(len(escrituras_detalle), 3)
+
+        actuales = dict(DetallePedido.objects.values_list('producto_id', 'id'))
+        self.assertEqual(actuales[self.productos[0].pk], self.ids[self.productos[0].pk])
+        self.assertEqual(actuales[self.productos[1].pk], self.ids[self.productos[1].pk])
+        self.assertNotIn(self.productos[2].pk, actuales)
+
+        pedido = Pedido.objects.get(pk=self.pedido_id)
+        self.assertEqual(pedido.total_usd, Decimal('20.00') + Decimal('21.00') * 5 + Decimal('23.00') * 2)
+        self.assertEqual(pedido.peso_total_kg, Decimal('8.00'))
+
+    def test_sin_cambios_no_escribe_detalles(self):
+        detalles = [{'producto': p.pk, 'cantidad': 1} for p in self.productos[:3]]
+        respuesta = self.api.patch(f'/api/v1/pedidos/{self.pedido_id}/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.data['detalles_modificados'], {'creados': 0, 'actualizados': 0, 'eliminados': 0})
+
+    def test_reprecia_lineas_con_precio_cambiado(self):
+        Producto.objects.filter(pk=self.productos[0].pk).update(precio_usd=Decimal('30.00'))
+        detalles = [{'producto': p.pk, 'cantidad': 1} for p in self.productos[:3]]
+        respuesta = self.api.patch(f'/api/v1/pedidos/{self.pedido_id}/', {'detalles': detalles}, format='json')
+        self.assertEqual(respuesta.data['detalles_modificados']['actualizados'], 1)
+        self.assertEqual(DetallePedido.objects.get(producto=self.productos[0]).subtotal_usd, Decimal('30.00'))
+
+    def test_productos_repetidos_suman_cantidades(self):
+        detalles = [{'producto': self.productos[0].pk, 'cantidad': 1}, {'producto': self.productos[0].pk, 'cantidad': 2}]
+        self.api.patch(f'/api/v1/pedidos/{self.pedido_id}/', {'detalles': detalles}, format='json')
+        self.assertEqual(list(DetallePedido.objects.values_list('cantidad', flat=True)), [3])
+
+    def test_cambio_de_estado_sin_detalles(self):
+        respuesta = self.api.patch(f'/api/v1/pedidos/{self.pedido_id}/', {'estado': 'en_proceso'}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('detalles_modificados', respuesta.data)
+        self.assertEqual(DetallePedido.objects.count(), 3)
+
+
+TABLA_ADUANERO = """
+<table cellpadding="2" cellspacing="2" border="1" align="left">
+<tr><td>Año</td><td>Mes</td><td>Valor</td><td>Variación</td></tr>
+<tr><td>2024</td><td>Octubre</td><td>912,45</td><td>-</td></tr>
+<tr><td>2024</td><td>Noviembre</td><td>950,10</td><td>-</td></tr>
+<tr><td>2024</td><td>Diciembre</td><td>1.001,50</td><td>-</td></tr>
+</table>
+""".encode()
+
+
+class HistorialTipoCambioTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.configuracion = Configuracion.objects.create()
+        self.http = HttpFalso({URL_DOLAR_ADUANERO: RespuestaFalsa(contenido=TABLA_ADUANERO, headers={'ETag': '"v1"'})})
+
+    def test_parsea_todos_los_meses(self):
+        self.assertEqual(parsear_tabla_dolar_aduanero(TABLA_ADUANERO), [
+            (date(2024, 10, 1), Decimal('912.45')),
+            (date(2024, 11, 1), Decimal('950.10')),
+            (date(2024, 12, 1), Decimal('1001.50')),
+        ])
+        sin_anio = TABLA_ADUANERO.replace(b'<td>2024</td>', b'<td>1</td>')
+        fechas = [fecha for fecha, _ in parsear_tabla_dolar_aduanero(sin_anio, hoy=date(2025, 1, 15))]
+        self.assertEqual(fechas, [date(2024, 10, 1), date(2024, 11, 1), date(2024, 12, 1)])
+
+    def test_registra_en_bloque_sin_duplicar(self):
+        filas = parsear_tabla_dolar_aduanero(TABLA_ADUANERO)
+        with self.assertNumQueries(1):
+            self.assertEqual(tipos_cambio.registrar(TipoCambio.ADUANERO, filas), 3)
+        tipos_cambio.registrar(TipoCambio.ADUANERO, [(date(2024, 12, 1), Decimal('1002.00'))])
+        self.assertEqual(TipoCambio.objects.filter(tipo=TipoCambio.ADUANERO).count(), 3)
+        self.assertEqual(tipos_cambio.valor_en(TipoCambio.ADUANERO, date(2024, 12, 31)), Decimal('1002.00'))
+
+    def test_busqueda_por_fecha(self):
+        tipos_cambio.registrar(TipoCambio.ADUANERO, parsear_tabla_dolar_aduanero(TABLA_ADUANERO))
+        tipos_cambio.serie(TipoCambio.ADUANERO)
+        with self.assertNumQueries(0):
+            self.assertIsNone(tipos_cambio.valor_en(TipoCambio.ADUANERO, date(2024, 9, 30)))
+            self.assertEqual(tipos_cambio.valor_en(TipoCambio.ADUANERO, date(2024, 11, 20)), Decimal('950.10'))
+            self.assertEqual(tipos_cambio.valor_en(TipoCambio.ADUANERO, date(2025, 3, 1)), Decimal('1001.50'))
+
+    def test_pagina_sin_cambios_no_se_vuelve_a_parsear(self):
+        with mock.patch('api.tipos_cambio.timezone.localdate', return_value=date(2024, 11, 5)):
+            self.assertEqual(tipos_cambio.actualizar_dolar_aduanero(self.http), Decimal('950.10'))
+            self.http.respuestas[URL_DOLAR_ADUANERO] = RespuestaFalsa(status_code=304)
+            with mock.patch('api.utils.parsear_tabla_dolar_aduanero') as parsear:
+                self.assertEqual(tipos_cambio.actualizar_dolar_aduanero(self.http), Decimal('950.10'))
+        parsear.assert_not_called()
+        self.assertEqual(self.http.cabeceras, {'If-None-Match': '"v1"'})
+
+    def test_mes_sin_publicar_no_cuenta_como_exito(self):
+        with mock.patch('api.tipos_cambio.timezone.localdate', return_value=date(2025, 1, 5)):
+            self.assertIsNone(tipos_cambio.actualizar_dolar_aduanero(self.http))
+            self.http.respuestas[URL_DOLAR_ADUANERO] = RespuestaFalsa(status_code=304)
+            self.assertIsNone(tipos_cambio.actualizar_dolar_aduanero(self.http))
+        # Los meses publicados igual quedan en el historial
+        self.assertEqual(TipoCambio.objects.filter(tipo=TipoCambio.ADUANERO).count(), 3)
+
+    def test_pagina_sin_tabla_no_es_un_304(self):
+        self.http.respuestas[URL_DOLAR_ADUANERO] = RespuestaFalsa(contenido=b'<html></html>', headers={'ETag': '"v2"'})
+        self.assertIsNone(tipos_cambio.actualizar_dolar_aduanero(self.http))
+        self.assertIsNone(cache.get(tipos_cambio.CLAVE_VALIDADORES_ADUANERO))
+
+    def test_recalculo_historico_usa_el_aduanero_del_mes(self):
+        tipos_cambio.registrar(TipoCambio.ADUANERO, parsear_tabla_dolar_aduanero(TABLA_ADUANERO))
+        cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        producto = Producto.objects.create(nombre='Zapatilla', marca='Nike', precio_usd=Decimal('100.00'))
+        pedidos = [Pedido.objects.create(cliente=cliente) for _ in range(2)]
+        for pedido in pedidos:
+            DetallePedido.objects.create(pedido=pedido, producto=producto)
+        Pedido.objects.filter(pk=pedidos[0].pk).update(fecha_pedido='2024-10-15T12:00:00Z')
+        Pedido.objects.filter(pk=pedidos[1].pk).update(fecha_pedido='2024-12-15T12:00:00Z')
+
+        with mock.patch('api.utils.consultar_valor_dolar') as consultar:
+            recalcular_totales(Pedido.objects.all())
+        consultar.assert_not_called()
+        for pedido, dolar_aduanero in zip(Pedido.objects.order_by('fecha_pedido'), ['912.45', '1001.50']):
+            esperado = calcular_totales(
+                pedido.total_usd, pedido.total_clp, pedido.peso_total_kg, 0, self.configuracion,
+                dolar_aduanero=Decimal(dolar_aduanero))
+            self.assertEqual(pedido.total_final_clp, esperado['total_final_clp'])
+
+    def test_pedido_toma_el_dolar_observado_del_historial(self):
+        tipos_cambio.registrar(TipoCambio.OBSERVADO, [(date(2024, 1, 2), Decimal('890.00'))])
+        cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        with mock.patch('api.utils.obtener_valor_dolar') as obtener:
+            pedido = Pedido.objects.create(cliente=cliente)
+        obtener.assert_not_called()
+        self.assertEqual(pedido.valor_dolar, Decimal('890.00'))
+
+
+class PrecioClpPrecalculadoTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.configuracion = Configuracion.objects.create(porcentaje_comision=Decimal('10.00'))
+        self.usd = Producto.objects.create(nombre='Zapatilla', marca='Nike', precio_usd=Decimal('100.00'))
+        self.fijo = Producto.objects.create(
+            nombre='Polera', marca='Adidas', precio_usd=Decimal('20.00'), precio_final_clp=Decimal('25000.00'))
+
+    def precios(self):
+        return dict(Producto.objects.values_list('nombre', 'precio_clp_efectivo'))
+
+    def test_se_calcula_al_guardar(self):
+        self.assertEqual(self.precios(), {'Zapatilla': Decimal('104500.00'), 'Polera': Decimal('25000.00')})
+
+    def test_repreciar_usa_un_solo_update(self):
+        # Más el incremento de la versión del catálogo
+        with self.assertNumQueries(2):
+            self.assertEqual(repreciar_productos(valor_dolar=Decimal('1000.00')), 2)
+        self.assertEqual(self.precios(), {'Zapatilla': Decimal('110000.00'), 'Polera': Decimal('25000.00')})
+
+    def test_cambio_de_comision_reprecia(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.configuracion.porcentaje_comision = Decimal('20.00')
+            self.configuracion.save()
+        self.assertEqual(self.precios()['Zapatilla'], Decimal('114000.00'))
+
+    def test_cambio_del_dolar_reprecia(self):
+        proveedor = ProveedorTipoCambio(
+            http=HttpFalso({URL_MINDICADOR: respuesta_mindicador(1000.0)}), ejecutor=ejecutar_inmediato)
+        proveedor.refrescar()
+        self.assertEqual(self.precios()['Zapatilla'], Decimal('110000.00'))
+
+    def test_precio_clp_no_consulta_la_red(self):
+        producto = Producto.objects.get(pk=self.usd.pk)
+        with mock.patch('api.utils.obtener_valor_dolar') as obtener, self.assertNumQueries(0):
+            self.assertEqual(producto.precio_clp, Decimal('104500.00'))
+        obtener.assert_not_called()
+
+    def test_listado_ordena_y_filtra_por_precio_clp(self):
+        respuesta = APIClient().get('/api/v1/productos/', {'ordering': '-precio_clp_efectivo'})
+        self.assertEqual([p['nombre'] for p in respuesta.data['results']], ['Zapatilla', 'Polera'])
+        self.assertEqual(respuesta.data['results'][0]['precio_clp'], '104500.00')
+        respuesta = APIClient().get('/api/v1/productos/', {'precio_clp_efectivo__lte': '50000'})
+        self.assertEqual([p['nombre'] for p in respuesta.data['results']], ['Polera'])
+
+
+class PaginacionCursorTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal(10 + i % 7), peso_kg=None if i % 5 == 0 else Decimal('1.00'))
+            for i in range(35)
+        )
+        self.api = APIClient()
+
+    def recorrer(self, parametros):
+        nombres = []
+        respuesta = self.api.get('/api/v1/productos/', parametros)
+        while True:
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('count', respuesta.data)
+            nombres += [p['nombre'] for p in respuesta.data['results']]
+            if not respuesta.data['next']:
+                return nombres
+            respuesta = self.api.get(respuesta.data['next'])
+
+    def test_recorre_todo_sin_repetir(self):
+        nombres = self.recorrer({'paginacion': 'cursor'})
+        self.assertEqual(nombres, list(Producto.objects.order_by('id').values_list('nombre', flat=True)))
+
+    def test_respeta_el_ordenamiento_con_empates(self):
+        nombres = self.recorrer({'paginacion': 'cursor', 'ordering': '-precio_usd', 'page_size': 4})
+        # Los empates de precio se desempatan por id en el mismo sentido
+        esperados = list(Producto.objects.order_by('-precio_usd', '-id').values_list('nombre', flat=True))
+        self.assertEqual(nombres, esperados)
+        self.assertEqual(len(set(nombres)), 35)
+
+    def test_ordenar_por_campo_nulo_omite_nulos(self):
+        nombres = self.recorrer({'paginacion': 'cursor', 'ordering': 'peso_kg'})
+        self.assertEqual(len(nombres), 28)
+
+    def test_no_ejecuta_count(self):
+        with CaptureQueriesContext(connection) as contexto:
+            self.api.get('/api/v1/productos/', {'paginacion': 'cursor'})
+        self.assertFalse([sql for sql in consultas_a(contexto, 'api_producto') if 'COUNT(' in sql])
+
+    def test_tamano_de_pagina_con_limite(self):
+        respuesta = self.api.get('/api/v1/productos/', {'page_size': 5})
+        self.assertEqual(len(respuesta.data['results']), 5)
+        self.assertEqual(respuesta.data['count'], 35)
+        with mock.patch('api.pagination.PaginacionCursor.max_page_size', 20):
+            respuesta = self.api.get('/api/v1/productos/', {'paginacion': 'cursor', 'page_size': 1000})
+        self.assertEqual(len(respuesta.data['results']), 20)
+
+    def test_pedidos_por_cursor(self):
+        cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123')
+        for _ in range(12):
+            Pedido.objects.create(cliente=cliente)
+        self.api.force_authenticate(cliente)
+        respuesta = self.api.get('/api/v1/pedidos/', {'paginacion': 'cursor'})
+        self.assertEqual(len(respuesta.data['results']), 10)
+        respuesta = self.api.get(respuesta.data['next'])
+        self.assertEqual(len(respuesta.data['results']), 2)
+
+
+class BusquedaProductoTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for nombre, descripcion in [
+            ('Zapatillas de running', 'Calzado liviano para correr'),
+            ('Polera deportiva', 'Tela respirable, ideal para zapatillas blancas'),
+            ('Mochila urbana', 'Compartimiento para notebook'),
+        ]:
+            Producto.objects.create(nombre=nombre, descripcion=descripcion, marca='Marca', precio_usd=Decimal('10.00'))
+        self.api = APIClient()
+
+    def buscar(self, termino, **parametros):
+        respuesta = self.api.get('/api/v1/productos/', {'search': termino, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        return [p['nombre'] for p in respuesta.data['results']]
+
+    def test_mantiene_el_parametro_search(self):
+        self.assertEqual(set(self.buscar('zapatillas')), {'Zapatillas de running', 'Polera deportiva'})
+        self.assertEqual(self.buscar('notebook'), ['Mochila urbana'])
+        self.assertNotIn('busqueda', self.api.get('/api/v1/productos/').data['results'][0])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_ordena_por_relevancia_prefijo_y_errores(self):
+        self.assertEqual(self.buscar('zapatillas'), ['Zapatillas de running', 'Polera deportiva'])
+        self.assertEqual(self.buscar('mochi'), ['Mochila urbana'])
+        self.assertEqual(self.buscar('mochla'), ['Mochila urbana'])
+        self.assertEqual(self.buscar('zapatillas', ordering='-id'), ['Polera deportiva', 'Zapatillas de running'])
+        with override_settings(BUSQUEDA_SIMILITUD_MINIMA=0.9):
+            self.assertEqual(self.buscar('mochla'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_trigger_mantiene_la_columna(self):
+        Producto.objects.filter(nombre='Mochila urbana').update(nombre='Bolso urbano')
+        self.assertEqual(self.buscar('bolso'), ['Bolso urbano'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+class PlanConsultasTests(TestCase):
+    """Falla si una consulta de un endpoint frecuente recorre una tabla grande completa."""
+
+    tablas_vigiladas = {'api_producto', 'api_pedido', 'api_detallepedido', 'api_notificacion'}
+
+    @classmethod
+    def setUpTestData(cls):
+        Configuracion.objects.create()
+        usuarios = Usuario.objects.bulk_create(Usuario(username=f'usuario{i}') for i in range(2000))
+        cls.usuario = usuarios[0]
+        productos = Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca=f'Marca {i % 200}', precio_usd=Decimal(i % 500 + 1),
+                     peso_kg=Decimal('1.00'), disponible=i % 10 != 0)
+            for i in range(50000)
+        )
+        pedidos = Pedido.objects.bulk_create(Pedido(cliente=usuarios[i % 2000]) for i in range(20000))
+        DetallePedido.objects.bulk_create(
+            DetallePedido(pedido=pedidos[i % 20000], producto=productos[i % 50000], cantidad=1) for i in range(60000)
+        )
+        Notificacion.objects.bulk_create(
+            Notificacion(usuario=usuarios[i % 2000], tipo='otro', contenido='Aviso', leida=i % 4 != 0) for i in range(40000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        Configuracion.limpiar_cache()
+        self.api = APIClient()
+        self.api.force_authenticate(self.usuario)
+
+    def recorridos_secuenciales(self, plan):
+        encontrados = []
+        if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in self.tablas_vigiladas:
+            encontrados.append(plan['Relation Name'])
+        for hijo in plan.get('Plans', []):
+            encontrados += self.recorridos_secuenciales(hijo)
+        return encontrados
+
+    def assertSinRecorridoSecuencial(self, url, parametros=None):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.api.get(url, parametros or {})
+        self.assertEqual(respuesta.status_code, 200)
+        for consulta in contexto.captured_queries:
+            if not consulta['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + consulta['sql'])
+                plan = cursor.fetchone()[0][0]['Plan']
+            self.assertEqual(self.recorridos_secuenciales(plan), [], f"{url} {parametros}: {consulta['sql']}")
+
+    def test_productos(self):
+        self.assertSinRecorridoSecuencial('/api/v1/productos/', {'paginacion': 'cursor'})
+        self.assertSinRecorridoSecuencial('/api/v1/productos/', {'marca': 'Marca 7'})
+        self.assertSinRecorridoSecuencial('/api/v1/productos/', {'marca': 'Marca 7', 'disponible': 'true'})
+        self.assertSinRecorridoSecuencial('/api/v1/productos/', {'paginacion': 'cursor', 'ordering': 'precio_usd'})
+        self.assertSinRecorridoSecuencial('/api/v1/productos/', {'paginacion': 'cursor', 'ordering': '-peso_kg'})
+
+    def test_pedidos_y_detalles(self):
+        self.assertSinRecorridoSecuencial('/api/v1/pedidos/')
+        self.assertSinRecorridoSecuencial('/api/v1/detalles/')
+
+    def test_notificaciones(self):
+        self.assertSinRecorridoSecuencial('/api/v1/notificaciones/')
+        self.assertSinRecorridoSecuencial('/api/v1/notificaciones/', {'leida': 'false'})
+
+
+class RespuestasCondicionalesTests(DolarFijoMixin, TestCase):
+    url = '/api/v1/productos/?page_size=100'
+
+    def setUp(self):
+        super().setUp()
+        self.configuracion = Configuracion.objects.create()
+        self.productos = Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca=f'Marca {i % 5}', precio_usd=Decimal('10.00') + i,
+                     descripcion='Descripción de prueba para el catálogo')
+            for i in range(100)
+        )
+        repreciar_productos()
+        self.api = APIClient()
+
+    def test_listado_sin_cambios_responde_304(self):
+        # Autenticado para no pasar por el caché de listados anónimos
+        self.api.force_authenticate(Usuario.objects.create_user(username='cliente', password='clave-segura-123'))
+        completa = self.api.get(self.url)
+        self.assertEqual(completa.status_code, 200)
+        self.assertIn('no-cache', completa['Cache-Control'])
+
+        _, consultas_completa, tiempo_completa = medir(lambda: self.api.get(self.url), repeticiones=5)
+        no_modificada, consultas_304, tiempo_304 = medir(
+            lambda: self.api.get(self.url, HTTP_IF_NONE_MATCH=completa['ETag']), repeticiones=5)
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(no_modificada['ETag'], completa['ETag'])
+        # Se ahorra el cuerpo completo y solo se lee la versión del catálogo
+        self.assertEqual(no_modificada.content, b'')
+        self.assertGreater(len(completa.content), 10000)
+        self.assertEqual(len(consultas_304), 1)
+        self.assertLess(len(consultas_304), len(consultas_completa))
+        self.assertLess(tiempo_304['p50_ms'], tiempo_completa['p50_ms'])
+
+    def test_escrituras_cambian_el_etag(self):
+        etag = self.api.get(self.url)['ETag']
+        producto = Producto.objects.get(pk=self.productos[0].pk)
+        producto.nombre = 'Renombrado'
+        producto.save()
+        respuesta = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+        etag = respuesta['ETag']
+        repreciar_productos(valor_dolar=Decimal('1000.00'))
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_el_etag_depende_de_la_consulta(self):
+        etag = self.api.get(self.url)['ETag']
+        respuesta = self.api.get('/api/v1/productos/?page_size=100&marca=Marca 1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_detalle_condicional(self):
+        url = f'/api/v1/productos/{self.productos[0].pk}/'
+        completa = self.api.get(url)
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=completa['ETag']).status_code, 304)
+        self.assertEqual(self.api.get(url, HTTP_IF_MODIFIED_SINCE=completa['Last-Modified']).status_code, 304)
+        # Otro producto modificado no invalida este detalle
+        Producto.objects.get(pk=self.productos[1].pk).save()
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=completa['ETag']).status_code, 304)
+        Producto.objects.get(pk=self.productos[0].pk).save()
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=completa['ETag']).status_code, 200)
+
+    def test_configuracion_condicional(self):
+        admin = Usuario.objects.create_user(username='admin', password='clave-segura-123', is_staff=True)
+        self.api.force_authenticate(admin)
+        etag = self.api.get('/api/v1/configuracion/')['ETag']
+        self.assertEqual(self.api.get('/api/v1/configuracion/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.api.patch(f'/api/v1/configuracion/{self.configuracion.pk}/', {'tasa_iva': '10.00'}, format='json')
+        self.assertEqual(self.api.get('/api/v1/configuracion/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_compresion_gzip(self):
+        completa = self.api.get(self.url)
+        comprimida = self.api.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', comprimida['Vary'])
+        self.assertLess(len(comprimida.content), len(completa.content) * 0.3)
+        self.assertEqual(gzip.decompress(comprimida.content), completa.content)
+
+    @skipUnless(brotli, 'Requiere el paquete brotli')
+    def test_compresion_brotli(self):
+        completa = self.api.get(self.url)
+        comprimida = self.api.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(comprimida['Content-Encoding'], 'br')
+        self.assertLess(len(comprimida.content), len(completa.content) * 0.3)
+        self.assertEqual(brotli.decompress(comprimida.content), completa.content)
+
+    def test_respuestas_pequenas_no_se_comprimen(self):
+        respuesta = self.api.get(f'/api/v1/productos/{self.productos[0].pk}/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+
+
+class CacheCatalogoTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create()
+        Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca=f'Marca {i % 3}', precio_usd=Decimal('10.00') + i) for i in range(30)
+        )
+        repreciar_productos()
+        cache_catalogo.limpiar()
+        cache_catalogo.reiniciar_metricas()
+        self.api = APIClient()
+
+    def test_listado_anonimo_se_sirve_desde_memoria(self):
+        primera = self.api.get('/api/v1/productos/?marca=Marca 1&ordering=-precio_usd')
+        with self.assertNumQueries(1):
+            segunda = self.api.get('/api/v1/productos/?ordering=-precio_usd&marca=Marca 1&search=')
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(segunda['Content-Type'], primera['Content-Type'])
+        self.assertEqual(segunda.data['count'], 10)
+        metricas = cache_catalogo.metricas()
+        self.assertEqual((metricas['aciertos'], metricas['fallos']), (1, 1))
+        self.assertEqual(metricas['proporcion_aciertos'], 0.5)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'interno'])
+    def test_cada_host_y_esquema_tiene_su_entrada(self):
+        publica = self.api.get('/api/v1/productos/?page_size=5')
+        interna = self.api.get('/api/v1/productos/?page_size=5', HTTP_HOST='interno')
+        segura = self.api.get('/api/v1/productos/?page_size=5', secure=True)
+        self.assertTrue(publica.data['next'].startswith('http://testserver/'))
+        self.assertTrue(interna.data['next'].startswith('http://interno/'))
+        self.assertTrue(segura.data['next'].startswith('https://testserver/'))
+        self.assertEqual(cache_catalogo.metricas()['fallos'], 3)
+
+    def test_escrituras_y_repreciado_invalidan(self):
+        admin = Usuario.objects.create_user(username='admin', password='clave-segura-123', is_staff=True)
+        self.assertEqual(self.api.get('/api/v1/productos/').data['count'], 30)
+
+        staff = APIClient()
+        staff.force_authenticate(admin)
+        creado = staff.post('/api/v1/productos/', {'nombre': 'Nuevo', 'marca': 'Marca 1', 'precio_usd': '5.00'})
+        self.assertEqual(self.api.get('/api/v1/productos/').data['count'], 31)
+
+        staff.put(f"/api/v1/productos/{creado.data['id']}/", {'nombre': 'Editado', 'marca': 'Marca 1', 'precio_usd': '5.00'})
+        self.assertIn('Editado', [p['nombre'] for p in self.api.get('/api/v1/productos/?marca=Marca 1&page_size=50').data['results']])
+
+        staff.delete(f"/api/v1/productos/{creado.data['id']}/")
+        self.assertEqual(self.api.get('/api/v1/productos/').data['count'], 30)
+
+        antes = self.api.get('/api/v1/productos/').data['results'][0]['precio_clp']
+        repreciar_productos(valor_dolar=Decimal('1000.00'))
+        self.assertNotEqual(self.api.get('/api/v1/productos/').data['results'][0]['precio_clp'], antes)
+
+    def test_sin_version_no_usa_el_cache(self):
+        VersionColeccion.objects.filter(nombre=VersionColeccion.PRODUCTOS).delete()
+        self.api.get('/api/v1/productos/')
+        self.api.get('/api/v1/productos/')
+        self.assertEqual(cache_catalogo.metricas()['fallos'], 0)
+
+    def test_autenticados_no_usan_el_cache(self):
+        self.api.force_authenticate(Usuario.objects.create_user(username='cliente', password='clave-segura-123'))
+        self.api.get('/api/v1/productos/')
+        self.api.get('/api/v1/productos/')
+        self.assertEqual(cache_catalogo.metricas()['fallos'], 0)
+
+    def test_presupuesto_con_desalojo_lru(self):
+        cache = CacheRespuestas(max_bytes=100)
+        for clave in 'abc':
+            cache.obtener(1, clave, lambda: (b'x' * 40, 'application/json'))
+        cache.obtener(1, 'b', lambda: self.fail('debería estar en memoria'))
+        cache.obtener(1, 'd', lambda: (b'x' * 40, 'application/json'))
+        metricas = cache.metricas()
+        self.assertEqual((metricas['entradas'], metricas['bytes'], metricas['desalojos']), (2, 80, 2))
+        self.assertEqual(cache.obtener(1, 'b', lambda: None)[0], b'x' * 40)
+        # Una nueva generación descarta todo lo anterior
+        self.assertIsNone(cache.obtener(2, 'b', lambda: None))
+
+    def test_calculo_unico_con_peticiones_simultaneas(self):
+        cache = CacheRespuestas()
+        liberar = threading.Event()
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            liberar.wait(5)
+            return b'{}', 'application/json'
+
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener(1, 'lista', calcular))) for _ in range(5)]
+        for hilo in hilos:
+            hilo.start()
+        while cache.metricas()['esperas'] < 4:
+            time.sleep(0.01)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(calculos), 1)
+        self.assertEqual(resultados, [(b'{}', 'application/json')] * 5)
+
+
+def imagen_png(ancho, alto, modo='RGBA'):
+    salida = io.BytesIO()
+    Image.new(modo, (ancho, alto), (200, 30, 30, 128) if modo == 'RGBA' else (200, 30, 30)).save(salida, format='PNG')
+    return ContentFile(salida.getvalue())
+
+
+@override_settings(IMAGEN_ANCHOS=[160, 320, 640], IMAGEN_FORMATOS=['webp', 'jpeg'])
+class VariantesImagenTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        medios = override_settings(MEDIA_ROOT=directorio)
+        medios.enable()
+        self.addCleanup(medios.disable)
+        self.producto = Producto.objects.create(nombre='Mochila', marca='Norte', precio_usd=Decimal('20.00'))
+
+    def subir(self, producto, ancho=1000, alto=500, nombre='mochila.png'):
+        producto.imagen.save(nombre, imagen_png(ancho, alto), save=False)
+        Producto.objects.filter(pk=producto.pk).update(imagen=producto.imagen.name)
+
+    def test_genera_variantes_sin_ampliar(self):
+        self.subir(self.producto)
+        self.assertTrue(generar_variantes(self.producto.pk))
+
+        variantes = Producto.objects.get(pk=self.producto.pk).imagen_variantes
+        self.assertEqual(variantes['origen'], 'productos/mochila.png')
+        for formato, esperado in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            lista = variantes['variantes'][formato]
+            self.assertEqual([(v['ancho'], v['alto']) for v in lista], [(160, 80), (320, 160), (640, 320)])
+            for variante in lista:
+                with default_storage.open(variante['nombre']) as archivo, Image.open(archivo) as imagen:
+                    self.assertEqual((imagen.format, imagen.size), (esperado, (variante['ancho'], variante['alto'])))
+        # Sin cambios en la imagen no se vuelve a procesar
+        self.assertFalse(generar_variantes(self.producto.pk))
+
+    def test_imagen_angosta_se_conserva_a_su_tamano(self):
+        for (ancho, alto), esperado in (((100, 120), [(100, 120)]), ((500, 250), [(160, 80), (320, 160), (500, 250)])):
+            with self.subTest(ancho=ancho):
+                self.subir(self.producto, ancho=ancho, alto=alto, nombre=f'angosta-{ancho}.png')
+                generar_variantes(self.producto.pk)
+                lista = Producto.objects.get(pk=self.producto.pk).imagen_variantes['variantes']['webp']
+                self.assertEqual([(v['ancho'], v['alto']) for v in lista], esperado)
+
+    def test_reemplazo_borra_las_variantes_anteriores(self):
+        self.subir(self.producto)
+        generar_variantes(self.producto.pk)
+        anteriores = Producto.objects.get(pk=self.producto.pk).imagen_variantes['variantes']['jpeg']
+
+        self.subir(self.producto, ancho=400, alto=400, nombre='otra.png')
+        generar_variantes(self.producto.pk)
+        self.assertFalse(any(default_storage.exists(v['nombre']) for v in anteriores))
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).imagen_variantes['origen'], 'productos/otra.png')
+
+        Producto.objects.filter(pk=self.producto.pk).update(imagen='')
+        generar_variantes(self.producto.pk)
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).imagen_variantes, {})
+
+    def test_descarta_si_la_imagen_cambio_durante_el_proceso(self):
+        self.subir(self.producto)
+        from .imagenes import crear_variantes as crear_original
+        creadas = []
+
+        def crear_y_reemplazar(contenido, prefijo):
+            creadas.append(crear_original(contenido, prefijo))
+            Producto.objects.filter(pk=self.producto.pk).update(imagen='productos/nueva.png')
+            return creadas[0]
+
+        with mock.patch('api.imagenes.crear_variantes', side_effect=crear_y_reemplazar):
+            self.assertFalse(generar_variantes(self.producto.pk))
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).imagen_variantes, {})
+        self.assertFalse(any(default_storage.exists(v['nombre']) for v in creadas[0]['webp']))
+
+    def test_subida_encola_la_generacion_tras_el_commit(self):
+        with mock.patch('api.utils.en_segundo_plano') as encolar:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.producto.imagen.save('mochila.png', imagen_png(800, 600))
+            encolar.assert_called_once_with(tarea_generar_variantes_imagen, self.producto.pk)
+
+            generar_variantes(self.producto.pk)
+            producto = Producto.objects.get(pk=self.producto.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                producto.nombre = 'Mochila 30L'
+                producto.save()
+            self.assertEqual(encolar.call_count, 1)
+
+    def test_serializer_expone_variantes_y_srcset(self):
+        self.subir(self.producto)
+        generar_variantes(self.producto.pk)
+        datos = APIClient().get(f'/api/v1/productos/{self.producto.pk}/').data
+
+        self.assertEqual([v['ancho'] for v in datos['imagen_variantes']['webp']], [160, 320, 640])
+        self.assertTrue(datos['imagen_variantes']['webp'][0]['url'].startswith('http://testserver/media/productos/variantes/'))
+        self.assertEqual(datos['imagen_srcset']['jpeg'].count('w, '), 2)
+        self.assertTrue(datos['imagen_srcset']['webp'].endswith(' 640w'))
+
+    def test_comando_procesa_solo_pendientes(self):
+        self.subir(self.producto)
+        otro = Producto.objects.create(nombre='Gorro', marca='Norte', precio_usd=Decimal('5.00'))
+        self.subir(otro, ancho=300, alto=300, nombre='gorro.png')
+        Producto.objects.create(nombre='Sin foto', marca='Norte', precio_usd=Decimal('5.00'))
+        generar_variantes(otro.pk)
+
+        salida = io.StringIO()
+        call_command('generar_variantes_imagen', procesos=1, stdout=salida)
+        self.assertIn('1 productos con variantes generadas, 0 errores', salida.getvalue())
+        self.assertTrue(Producto.objects.get(pk=self.producto.pk).imagen_variantes)
+
+        call_command('generar_variantes_imagen', procesos=1, todas=True, stdout=salida)
+        self.assertIn('2 productos con variantes generadas', salida.getvalue())
+
+
+class ImportacionProductosTests(DolarFijoMixin, TestCase):
+    CSV = (
+        'marca,nombre,precio_usd,peso_kg,descripcion\n'
+        'Norte,Mochila,20.00,1.10,\n'
+        'Norte,Gorro,abc,0.20,Lana\n'
+        'Sur,Parka,100.00,,Impermeable\n'
+        'Norte,Mochila,25.00,1.20,\n'
+        ',Sin marca,5.00,,\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create(porcentaje_comision=Decimal('10.00'))
+        self.existente = Producto.objects.create(
+            nombre='Mochila', marca='Norte', precio_usd=Decimal('15.00'), descripcion='Conservar')
+
+    def test_upsert_por_marca_y_nombre_con_errores_por_fila(self):
+        version, _ = VersionColeccion.obtener(VersionColeccion.PRODUCTOS)
+        with CaptureQueriesContext(connection) as contexto:
+            resultado = importar_productos(io.BytesIO(self.CSV.encode()), 'csv', tamano_lote=2)
+
+        self.assertEqual((resultado.filas, resultado.guardadas, resultado.con_error), (5, 3, 2))
+        self.assertEqual([error['fila'] for error in resultado.errores], [3, 6])
+        self.assertIn('precio_usd', resultado.errores[0]['errores'])
+        self.assertIn('marca', resultado.errores[1]['errores'])
+
+        mochila = Producto.objects.get(pk=self.existente.pk)
+        # Las columnas vacías no pisan lo que ya tenía el producto
+        self.assertEqual((mochila.precio_usd, mochila.peso_kg, mochila.descripcion),
+                         (Decimal('25.00'), Decimal('1.20'), 'Conservar'))
+        self.assertEqual(mochila.precio_clp_efectivo, Decimal('25.00') * Decimal('1.1') * self.valor_dolar)
+        self.assertEqual(Producto.objects.get(marca='Sur', nombre='Parka').descripcion, 'Impermeable')
+        self.assertEqual(Producto.objects.count(), 2)
+        self.assertGreater(VersionColeccion.obtener(VersionColeccion.PRODUCTOS)[0], version)
+        # Un upsert por lote y conjunto de columnas informadas más el precio fijo por lote, sin consultas por fila
+        self.assertEqual(len(consultas_a(contexto, 'api_producto')), 5)
+
+    def test_sin_columna_de_precio_fijo_conserva_el_del_producto(self):
+        Producto.objects.filter(pk=self.existente.pk).update(
+            precio_final_clp=Decimal('9990.00'), precio_clp_efectivo=Decimal('9990.00'))
+        importar_productos(io.BytesIO(b'marca,nombre,precio_usd\nNorte,Mochila,30.00\nSur,Parka,10.00\n'), 'csv')
+        mochila = Producto.objects.get(pk=self.existente.pk)
+        self.assertEqual((mochila.precio_usd, mochila.precio_clp_efectivo), (Decimal('30.00'), Decimal('9990.00')))
+        parka = Producto.objects.get(nombre='Parka')
+        self.assertEqual(parka.precio_clp_efectivo, Decimal('10.00') * Decimal('1.1') * self.valor_dolar)
+
+    def test_ndjson_y_limite_de_errores(self):
+        lineas = ['{"marca": "Este", "nombre": "Reloj", "precio_usd": "50.00", "disponible": false}', 'no es json',
+                  '[1, 2]', '{"marca": "Este", "nombre": "Reloj 2", "precio_usd": "5", "color": "rojo"}']
+        resultado = importar_productos(io.BytesIO('\n'.join(lineas).encode()), 'ndjson', max_errores=2)
+        datos = resultado.como_dict()
+        self.assertEqual((datos['guardadas'], datos['con_error'], datos['errores_omitidos']), (1, 3, 1))
+        self.assertFalse(Producto.objects.get(nombre='Reloj').disponible)
+
+    def test_endpoint_solo_para_personal(self):
+        api = APIClient()
+        api.force_authenticate(Usuario.objects.create_user(username='cliente', password='clave-segura-123'))
+        self.assertEqual(api.post('/api/v1/productos/importar/', self.CSV, content_type='text/csv').status_code, 403)
+
+        api.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123', is_staff=True))
+        archivo = ContentFile(self.CSV.encode(), name='proveedor.csv')
+        respuesta = api.post('/api/v1/productos/importar/', {'archivo': archivo}, format='multipart')
+        self.assertEqual((respuesta.status_code, respuesta.data['guardadas']), (200, 3))
+
+        respuesta = api.post('/api/v1/productos/importar/', '{"marca": "Este", "nombre": "Reloj", "precio_usd": "9"}\n',
+                             content_type='application/x-ndjson')
+        self.assertEqual((respuesta.status_code, respuesta.data['guardadas']), (200, 1))
+
+        respuesta = api.post('/api/v1/productos/importar/', 'nombre,color\nA,rojo\n', content_type='text/csv')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_comando(self):
+        ruta = os.path.join(tempfile.mkdtemp(), 'proveedor.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(ruta))
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write(self.CSV)
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command('importar_productos', ruta, stdout=salida, stderr=errores)
+        self.assertIn('5 filas leídas, 3 productos guardados, 2 con error', salida.getvalue())
+        self.assertIn('Fila 3:', errores.getvalue())
+
+
+class ExportacionPedidosTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente = Usuario.objects.create_user(username='cliente', password='clave-segura-123', email='c@x.cl')
+        self.producto = Producto.objects.create(nombre='Mochila, 30L', marca='Norte', precio_usd=Decimal('20.00'))
+        self.antiguo = Pedido.objects.create(cliente=self.cliente, estado='entregado')
+        Pedido.objects.filter(pk=self.antiguo.pk).update(fecha_pedido=timezone.make_aware(datetime(2024, 1, 15, 12)))
+        DetallePedido.objects.bulk_create(
+            DetallePedido(pedido=self.antiguo, producto=self.producto, cantidad=cantidad, subtotal_usd=Decimal('20.00'))
+            for cantidad in (1, 2)
+        )
+        self.vacio = Pedido.objects.create(cliente=self.cliente)
+
+    def exportar(self, **parametros):
+        api = APIClient()
+        api.force_authenticate(Usuario.objects.get_or_create(username='admin', is_staff=True)[0])
+        return api.get('/api/v1/pedidos/exportar/', parametros, HTTP_ACCEPT='text/csv')
+
+    def test_csv_con_una_fila_por_linea(self):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.exportar()
+            filas = list(csv.reader(io.StringIO(b''.join(respuesta.streaming_content).decode())))
+        self.assertEqual(respuesta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="pedidos.csv"', respuesta['Content-Disposition'])
+        self.assertEqual(filas[0][:3], ['pedido_id', 'fecha_pedido', 'estado'])
+        self.assertEqual([(fila[0], fila[14], fila[15]) for fila in filas[1:]], [
+            (str(self.antiguo.pk), 'Mochila, 30L', '1'), (str(self.antiguo.pk), 'Mochila, 30L', '2'),
+            (str(self.vacio.pk), '', ''),
+        ])
+        self.assertEqual(filas[1][5], 'c@x.cl')
+        # Un solo SELECT con los joins, además de la sesión del usuario
+        self.assertEqual(len(consultas_a(contexto, 'api_pedido')), 1)
+
+    def test_ndjson_con_filtros(self):
+        respuesta = self.exportar(formato='ndjson', desde='2024-01-01', hasta='2024-01-15', estado='entregado,enviado')
+        filas = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).decode().splitlines()]
+        self.assertEqual([fila['detalle_id'] is not None for fila in filas], [True, True])
+        self.assertEqual((filas[0]['subtotal_usd'], filas[0]['cliente_username']), ('20.00', 'cliente'))
+        self.assertIn('pedidos-2024-01-01-2024-01-15.ndjson', respuesta['Content-Disposition'])
+
+        vacia = self.exportar(formato='ndjson', hasta='2024-01-14')
+        self.assertEqual(b''.join(vacia.streaming_content), b'')
+
+    def test_validacion_y_permisos(self):
+        self.assertEqual(self.exportar(estado='perdido').status_code, 400)
+        self.assertEqual(self.exportar(desde='2024-02-01', hasta='2024-01-01').status_code, 400)
+        api = APIClient()
+        api.force_authenticate(self.cliente)
+        self.assertEqual(api.get('/api/v1/pedidos/exportar/').status_code, 403)
+
+    def test_comando(self):
+        salida = io.StringIO()
+        call_command('exportar_pedidos', formato='csv', estado='recibido', stdout=salida)
+        self.assertEqual(len(salida.getvalue().splitlines()), 2)
+
+
+class NotificacionesMasivasTests(TestCase):
+    def setUp(self):
+        self.clientes = [Usuario.objects.create_user(username=f'cliente{i}') for i in range(5)]
+        self.admin = Usuario.objects.create_user(username='admin', is_staff=True)
+        Usuario.objects.create_user(username='inactivo', is_active=False)
+        Pedido.objects.bulk_create(Pedido(cliente=cliente) for cliente in self.clientes[:2])
+
+    def test_difusion_en_lotes(self):
+        with CaptureQueriesContext(connection) as contexto:
+            creadas = difundir('Envío gratis', tamano_lote=2)
+        self.assertEqual(creadas, 5)
+        self.assertEqual(len(consultas_a(contexto, 'api_notificacion')), 3)
+        self.assertEqual(
+            set(Notificacion.objects.filter(tipo='promocion').values_list('usuario__username', flat=True)),
+            {cliente.username for cliente in self.clientes},
+        )
+
+    def test_difusion_filtrada(self):
+        self.assertEqual(difundir('Vuelve pronto', con_pedidos=False), 3)
+        self.assertEqual(difundir('Gracias', con_pedidos=True, incluir_personal=True), 2)
+        self.assertEqual(difundir('Hola', usuarios=[self.clientes[0].pk, self.admin.pk]), 1)
+
+    def test_endpoint_de_difusion(self):
+        api = APIClient()
+        api.force_authenticate(self.clientes[0])
+        self.assertEqual(api.post('/api/v1/notificaciones/difundir/', {'contenido': 'x'}).status_code, 403)
+
+        api.force_authenticate(self.admin)
+        with mock.patch('api.utils.en_segundo_plano') as encolar, self.captureOnCommitCallbacks(execute=True):
+            respuesta = api.post('/api/v1/notificaciones/difundir/',
+                                 {'contenido': 'Cyber', 'registrados_desde': '2024-01-01'}, format='json')
+        self.assertEqual(respuesta.status_code, 202)
+        encolar.assert_called_once_with(
+            tarea_difundir_notificacion, 'Cyber', 'promocion', {'registrados_desde': '2024-01-01', 'con_pedidos': None,
+                                                                 'incluir_personal': False})
+        self.assertEqual(tarea_difundir_notificacion.apply(args=encolar.call_args.args[1:]).get(), 5)
+
+    def test_marcar_leidas_con_un_update(self):
+        cliente, otro = self.clientes[:2]
+        notificaciones = Notificacion.objects.bulk_create(
+            Notificacion(usuario=usuario, tipo='otro', contenido=str(i)) for i in range(3) for usuario in (cliente, otro)
+        )
+        ajena = next(n for n in notificaciones if n.usuario_id == otro.pk)
+        propia = next(n for n in notificaciones if n.usuario_id == cliente.pk)
+        api = APIClient()
+        api.force_authenticate(cliente)
+
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = api.post('/api/v1/notificaciones/marcar-leidas/', {'ids': [propia.pk, ajena.pk]}, format='json')
+        self.assertEqual(respuesta.data, {'marcadas': 1})
+        self.assertEqual(len(consultas_a(contexto, 'api_notificacion')), 1)
+        self.assertFalse(Notificacion.objects.get(pk=ajena.pk).leida)
+
+        self.assertEqual(api.post('/api/v1/notificaciones/marcar-leidas/').data, {'marcadas': 2})
+        self.assertEqual(Notificacion.objects.filter(usuario=otro, leida=False).count(), 3)
+
+
+@override_settings(EVENTOS_INTERVALO=0.01, ALLOWED_HOSTS=['testserver'])
+class EventosTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente = Usuario.objects.create_user(username='cliente')
+        self.otro = Usuario.objects.create_user(username='otro')
+        self.cursor = backend_eventos.ultimo()
+
+    def eventos(self):
+        eventos, _ = backend_eventos.leer_desde(self.cursor)
+        return [(usuarios, evento['tipo'], evento['datos']) for _, usuarios, evento in eventos]
+
+    def test_requiere_ticket_o_cabecera(self):
+        from django.test import RequestFactory
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .eventos import vista_eventos
+        acceso = str(AccessToken.for_user(self.cliente))
+
+        def estado(url):
+            # Sin el cliente de pruebas: su async_to_sync deja el ejecutor del hilo en el contexto
+            return asyncio.run(vista_eventos(RequestFactory().get(url))).status_code
+
+        self.assertEqual(estado('/api/v1/eventos/?ticket=invalido'), 401)
+        # El JWT en la URL quedaría en los registros de acceso: no se acepta
+        self.assertEqual(estado(f'/api/v1/eventos/?token={acceso}'), 401)
+
+    def test_ticket_de_un_solo_uso(self):
+        api = APIClient()
+        self.assertEqual(api.post('/api/v1/eventos/ticket/').status_code, 401)
+        api.force_authenticate(self.cliente)
+        respuesta = api.post('/api/v1/eventos/ticket/')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(canjear_ticket(respuesta.data['ticket']), self.cliente.pk)
+        self.assertIsNone(canjear_ticket(respuesta.data['ticket']))
+
+    def test_senales_publican_al_confirmar(self):
+        pedido = Pedido.objects.create(cliente=self.cliente)
+        with mock.patch('api.utils.en_segundo_plano'), self.captureOnCommitCallbacks(execute=True):
+            Notificacion.objects.create(usuario=self.cliente, tipo='otro', contenido='Hola')
+            pedido.estado = 'enviado'
+            pedido.save()
+            pedido.save()
+            Pedido.objects.only('id').get(pk=pedido.pk).save()
+        tipos = [(usuarios, tipo) for usuarios, tipo, _ in self.eventos()]
+        self.assertEqual(tipos, [([self.cliente.pk], 'notificacion'), ([self.cliente.pk], 'pedido')])
+        self.assertEqual(self.eventos()[1][2], {'id': pedido.pk, 'estado': 'enviado', 'estado_anterior': 'recibido'})
+
+    def test_difusion_publica_por_lote(self):
+        difundir('Envío gratis', tamano_lote=1)
+        self.assertEqual(self.eventos(), [
+            ([usuario.pk], 'notificacion', {'tipo': 'promocion', 'contenido': 'Envío gratis'})
+            for usuario in (self.cliente, self.otro)
+        ])
+
+
+@override_settings(EVENTOS_INTERVALO=0.01, ALLOWED_HOSTS=['testserver'])
+class FlujoEventosTests(DolarFijoMixin, TransactionTestCase):
+    """El distribuidor lee los eventos desde otros hilos: necesitan estar confirmados."""
+
+    def setUp(self):
+        super().setUp()
+        self.cliente = Usuario.objects.create_user(username='cliente')
+        self.otro = Usuario.objects.create_user(username='otro')
+
+    def conectar(self, usuario, consulta='', cabeceras=()):
+        from backend.asgi import application
+        return ConexionAsgi(application, '/api/v1/eventos/', f'ticket={emitir_ticket(usuario.pk)}{consulta}', cabeceras)
+
+    def test_entrega_solo_al_destinatario(self):
+        async def escenario():
+            propia = self.conectar(self.cliente, cabeceras=[(b'accept-encoding', b'gzip, br')])
+            ajena = self.conectar(self.otro)
+            self.assertTrue((await propia.siguiente()).startswith(b'retry:'))
+            await ajena.siguiente()
+            await asyncio.to_thread(publicar, [self.cliente.pk], 'pedido', {'id': 7, 'estado': 'enviado'})
+            recibido = await propia.siguiente()
+            with self.assertRaises(asyncio.TimeoutError):
+                await ajena.siguiente(timeout=0.2)
+            await propia.cerrar()
+            await ajena.cerrar()
+            return propia, recibido
+
+        conexion, recibido = asyncio.run(escenario())
+        self.assertEqual(conexion.estado, 200)
+        self.assertEqual(conexion.cabeceras['content-type'], 'text/event-stream')
+        self.assertNotIn('content-encoding', conexion.cabeceras)
+        lineas = recibido.decode().strip().split('\n')
+        self.assertEqual(lineas[1:], ['event: pedido', 'data: {"id": 7, "estado": "enviado"}'])
+
+    def test_no_pierde_lo_publicado_mientras_el_lector_arranca(self):
+        ultimo = backend_eventos.ultimo
+
+        def ultimo_lento():
+            time.sleep(0.3)
+            return ultimo()
+
+        async def escenario():
+            conexion = self.conectar(self.cliente)
+            await conexion.siguiente()
+            await asyncio.to_thread(publicar, [self.cliente.pk], 'pedido', {'id': 7, 'estado': 'enviado'})
+            recibido = await conexion.siguiente()
+            await conexion.cerrar()
+            return recibido
+
+        with mock.patch.object(backend_eventos, 'ultimo', ultimo_lento):
+            self.assertIn(b'event: pedido', asyncio.run(escenario()))
+
+    def test_recupera_desde_last_event_id(self):
+        anterior = publicar([self.cliente.pk], 'notificacion', {'contenido': 'perdida'})
+        publicar([self.otro.pk], 'notificacion', {'contenido': 'ajena'})
+
+        async def escenario():
+            conexion = self.conectar(self.cliente, cabeceras=[(b'last-event-id', str(anterior - 1).encode())])
+            await conexion.siguiente()
+            recibido = await conexion.siguiente()
+            await conexion.cerrar()
+            return recibido
+
+        self.assertIn(f'id: {anterior}\n'.encode(), asyncio.run(escenario()))
+
+    def test_cliente_anterior_a_un_reinicio_de_la_secuencia(self):
+        numero = publicar([self.cliente.pk], 'notificacion', {'contenido': 'nueva'})
+
+        async def escenario():
+            # Last-Event-ID mayor que el último número: la tabla se vació desde entonces
+            conexion = self.conectar(self.cliente, cabeceras=[(b'last-event-id', str(numero + 100).encode())])
+            await conexion.siguiente()
+            recibido = await conexion.siguiente()
+            await conexion.cerrar()
+            return recibido
+
+        self.assertIn(f'id: {numero}\n'.encode(), asyncio.run(escenario()))
+
+
+class CambioEstadoPedidosTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clientes = [Usuario.objects.create_user(username=f'cliente{i}') for i in range(2)]
+        self.admin = Usuario.objects.create_user(username='admin', is_staff=True, is_superuser=True)
+        estados = ['en_proceso', 'en_proceso', 'en_proceso', 'recibido', 'enviado']
+        self.pedidos = Pedido.objects.bulk_create(
+            Pedido(cliente=self.clientes[i % 2], estado=estado) for i, estado in enumerate(estados))
+        self.cursor = backend_eventos.ultimo()
+
+    def estados(self):
+        return list(Pedido.objects.order_by('pk').values_list('estado', flat=True))
+
+    def test_un_update_y_un_insert(self):
+        ids = [pedido.pk for pedido in self.pedidos]
+        with mock.patch('api.utils.en_segundo_plano'), CaptureQueriesContext(connection) as contexto, \
+                self.captureOnCommitCallbacks(execute=True):
+            resultado = cambiar_estado(ids + [999999], 'enviado')
+        self.assertEqual(resultado['actualizados'], ids[:3])
+        self.assertEqual([(r['id'], r['estado']) for r in resultado['rechazados']],
+                         [(ids[3], 'recibido'), (ids[4], 'enviado'), (999999, None)])
+        self.assertEqual(self.estados(), ['enviado', 'enviado', 'enviado', 'recibido', 'enviado'])
+        self.assertEqual(escrituras_a(contexto, 'api_pedido'), 1)
+        self.assertEqual(escrituras_a(contexto, 'api_notificacion'), 1)
+
+        notificaciones = Notificacion.objects.filter(tipo='estado_pedido').order_by('pk')
+        self.assertEqual([(n.usuario_id, n.contenido) for n in notificaciones], [
+            (self.clientes[i % 2].pk, f'Tu pedido #{ids[i]} ahora está enviado.') for i in range(3)])
+        # Un solo evento para todo el cambio, con los de cada cliente
+        eventos, _ = backend_eventos.leer_desde(self.cursor)
+        self.assertEqual(len(eventos), 1)
+        _, usuarios, lote = eventos[0]
+        self.assertEqual(usuarios, sorted(cliente.pk for cliente in self.clientes))
+        self.assertEqual(lote['tipo'], 'lote')
+        propios = lote['datos'][str(self.clientes[0].pk)]
+        self.assertEqual([(evento['tipo'], evento['datos']['id']) for evento in propios], [
+            ('pedido', ids[0]), ('notificacion', notificaciones[0].pk), ('pedido', ids[2]), ('notificacion', notificaciones[2].pk)])
+        self.assertEqual(propios[1]['datos']['contenido'], f'Tu pedido #{ids[0]} ahora está enviado.')
+
+        mensajes = formatear(eventos[0][0], lote, self.clientes[1].pk)
+        self.assertEqual(mensajes.count(f'id: {eventos[0][0]}\n'), 2)
+        self.assertIn(f'"id": {ids[1]}', mensajes)
+        self.assertNotIn(f'"id": {ids[0]}', mensajes)
+
+    def test_sin_commit_no_publica(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            cambiar_estado([self.pedidos[0].pk], 'enviado')
+        # Los eventos y la sincronización de los resúmenes de ventas
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(backend_eventos.leer_desde(self.cursor)[0], [])
+
+    def test_endpoint_solo_personal(self):
+        api = APIClient()
+        datos = {'ids': [self.pedidos[3].pk], 'estado': 'en_proceso'}
+        api.force_authenticate(self.clientes[0])
+        self.assertEqual(api.post('/api/v1/pedidos/cambiar-estado/', datos, format='json').status_code, 403)
+
+        api.force_authenticate(self.admin)
+        respuesta = api.post('/api/v1/pedidos/cambiar-estado/', datos, format='json')
+        self.assertEqual(respuesta.data, {'actualizados': [self.pedidos[3].pk], 'rechazados': []})
+        respuesta = api.post('/api/v1/pedidos/cambiar-estado/', {'ids': [], 'estado': 'perdido'}, format='json')
+        self.assertEqual(set(respuesta.data), {'ids', 'estado'})
+
+    def test_accion_del_admin(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.post('/admin/api/pedido/', {
+            'action': 'pasar_a_entregado', '_selected_action': [pedido.pk for pedido in self.pedidos]}, follow=True)
+        self.assertContains(respuesta, '1 pedidos actualizados; 4 no admiten la transición.')
+        self.assertEqual(self.estados(), ['en_proceso', 'en_proceso', 'en_proceso', 'recibido', 'entregado'])
+
+
+class CamposDinamicosTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente = Usuario.objects.create_user(username='cliente')
+        self.productos = Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('10.00'), peso_kg=Decimal('0.50'),
+                     descripcion='Texto largo. ' * 100)
+            for i in range(3)
+        )
+        self.pedido = Pedido.objects.create(cliente=self.cliente)
+        DetallePedido.objects.bulk_create(
+            DetallePedido(pedido=self.pedido, producto=producto, cantidad=1) for producto in self.productos)
+        self.api = APIClient()
+        self.api.force_authenticate(self.cliente)
+
+    def test_listado_de_productos_compacto(self):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.api.get('/api/v1/productos/')
+        fila = respuesta.data['results'][0]
+        self.assertEqual(list(fila), [
+            'id', 'nombre', 'marca', 'descripcion_corta', 'precio_usd', 'precio_clp', 'peso_kg', 'disponible',
+            'imagen', 'imagen_srcset'])
+        self.assertEqual(fila['descripcion_corta'], ('Texto largo. ' * 100)[:120])
+        # La descripción completa no se lee de la base de datos (Substr es SUBSTR en SQLite, SUBSTRING en PostgreSQL)
+        sql = consultas_a(contexto, 'api_producto')[-1]
+        self.assertRegex(sql, r'SUBSTR(ING)?\("api_producto"\."descripcion"')
+        self.assertIsNone(re.search(r'(?<!SUBSTR\()(?<!SUBSTRING\()"api_producto"\."descripcion"', sql))
+
+    def test_fields_elige_columnas(self):
+        respuesta = self.api.get('/api/v1/productos/?fields=nombre,descripcion,id')
+        self.assertEqual(respuesta.data['results'][0], {
+            'id': self.productos[0].pk, 'nombre': 'Producto 0', 'descripcion': 'Texto largo. ' * 100})
+        respuesta = self.api.get('/api/v1/productos/?fields=id,precio_secreto')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('precio_secreto', respuesta.data['fields'])
+        # El detalle sigue entregando el producto completo
+        self.assertIn('descripcion', self.api.get(f'/api/v1/productos/{self.productos[0].pk}/').data)
+
+    def test_pedidos_sin_detalles_salvo_expand(self):
+        with CaptureQueriesContext(connection) as contexto:
+            fila = self.api.get('/api/v1/pedidos/').data['results'][0]
+        self.assertNotIn('detalles', fila)
+        self.assertEqual(fila['cliente'], self.cliente.pk)
+        self.assertEqual(consultas_a(contexto, 'api_detallepedido'), [])
+
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.api.get('/api/v1/pedidos/?fields=id,total_clp&expand=cliente,detalles')
+        fila = respuesta.data['results'][0]
+        self.assertEqual(list(fila), ['id', 'cliente', 'total_clp', 'detalles'])
+        self.assertEqual(fila['cliente']['username'], 'cliente')
+        self.assertEqual([detalle['producto'] for detalle in fila['detalles']], [p.pk for p in self.productos])
+        self.assertEqual(len(consultas_a(contexto, 'api_detallepedido')), 1)
+        self.assertEqual(self.api.get('/api/v1/pedidos/?expand=productos').status_code, 400)
+
+
+class LecturaRapidaTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cliente = Usuario.objects.create_user(username='cliente')
+        self.productos = Producto.objects.bulk_create(
+            Producto(nombre=f'Producto {i}', marca='Marca', precio_usd=Decimal('10.00') + i, peso_kg=Decimal('0.50'))
+            for i in range(5)
+        )
+        Producto.objects.filter(pk=self.productos[0].pk).update(
+            descripcion='Año\u2028"nuevo"\x01', fecha_compra=date(2024, 1, 2), peso_kg=None,
+            imagen='productos/a.jpg', imagen_variantes={'variantes': {'webp': [{'nombre': 'v/a.webp', 'ancho': 160, 'alto': 90}]}})
+        Producto.objects.filter(pk=self.productos[1].pk).update(precio_final_clp=Decimal('1234.5'))
+        repreciar_productos()
+        for _ in range(3):
+            pedido = Pedido.objects.create(cliente=self.cliente)
+            DetallePedido.objects.bulk_create(
+                DetallePedido(pedido=pedido, producto=producto, cantidad=2) for producto in self.productos[:3])
+        self.api = APIClient()
+        self.api.force_authenticate(self.cliente)
+
+    def comparar(self, url, **cabeceras):
+        with override_settings(LECTURA_RAPIDA=True), mock.patch('api.lectura.Lector.convertir',
+                                                               autospec=True, side_effect=Lector.convertir) as lector:
+            rapida = self.api.get(url, **cabeceras)
+        with override_settings(LECTURA_RAPIDA=False):
+            normal = self.api.get(url, **cabeceras)
+        self.assertEqual(rapida.status_code, 200)
+        self.assertEqual(rapida.content, normal.content)
+        self.assertEqual(rapida['Content-Type'], normal['Content-Type'])
+        return lector.called
+
+    def test_mismos_bytes_que_el_serializador(self):
+        for url in [
+            '/api/v1/productos/',
+            '/api/v1/productos/?fields=id,descripcion,fecha_compra,imagen,imagen_variantes,precio_clp,peso_kg',
+            '/api/v1/productos/?paginacion=cursor&ordering=-precio_usd&page_size=2',
+            '/api/v1/pedidos/',
+            '/api/v1/pedidos/?expand=cliente,detalles',
+            '/api/v1/pedidos/?paginacion=cursor&expand=detalles&page_size=2',
+        ]:
+            with self.subTest(url=url):
+                self.assertTrue(self.comparar(url))
+
+    def test_otros_formatos_usan_el_serializador(self):
+        self.assertFalse(self.comparar('/api/v1/productos/', HTTP_ACCEPT='application/json; indent=2'))
+        with mock.patch('api.lectura.Lector.convertir') as lector:
+            self.assertEqual(self.api.get('/api/v1/pedidos/?format=api').status_code, 200)
+        self.assertFalse(lector.called)
+
+    def test_sin_instancias_del_modelo(self):
+        with mock.patch.object(Pedido, 'from_db', side_effect=AssertionError) as from_db:
+            respuesta = self.api.get('/api/v1/pedidos/?expand=detalles')
+        self.assertEqual(len(respuesta.data['results']), 3)
+        self.assertFalse(from_db.called)
+
+    def test_a_json_igual_a_jsonrenderer(self):
+        datos = {'texto': 'ñ\u2028\u2029\x00\n"\\', 'lista': [1, None, True, 2 ** 70], 'vacio': {}}
+        self.assertEqual(a_json(datos), JSONRenderer().render(datos))
+
+
+class ResumenesVentasTests(DolarFijoMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Configuracion.objects.create(dolar_aduanero=Decimal('940.00'))
+        self.cliente = Usuario.objects.create_user(username='cliente')
+        self.admin = Usuario.objects.create_user(username='admin', is_staff=True)
+        self.productos = [
+            Producto.objects.create(nombre=f'Producto {i}', marca=f'Marca {i % 2}', precio_usd=Decimal('20.00') + i,
+                                    peso_kg=Decimal('1.00'))
+            for i in range(4)
+        ]
+        # La sincronización corre en línea en vez de en un hilo
+        parche = mock.patch('api.utils.en_segundo_plano', side_effect=lambda tarea, *args: tarea(*args))
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.api = APIClient()
+        self.api.force_authenticate(self.cliente)
+
+    def crear_pedido(self, cantidades):
+        detalles = [{'producto': self.productos[i].pk, 'cantidad': cantidad} for i, cantidad in cantidades.items()]
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.api.post('/api/v1/pedidos/', {'detalles': detalles}, format='json').data['id']
+
+    def resumenes(self):
+        return {
+            (fila.dimension, fila.clave): tuple(getattr(fila, campo) for campo in CAMPOS_RESUMEN)
+            for fila in ResumenVentas.objects.all() if fila.pedidos or fila.total_clp
+        }
+
+    def assertIgualAReconstruir(self):
+        incrementales = self.resumenes()
+        reconstruir(tamano_lote=1)
+        self.assertEqual(incrementales, self.resumenes())
+        return incrementales
+
+    def test_checkout_cambios_y_borrado(self):
+        pedido_id = self.crear_pedido({0: 1, 1: 2, 2: 3})
+        pedido = Pedido.objects.get(pk=pedido_id)
+        resumenes = self.assertIgualAReconstruir()
+        dia = timezone.localtime(pedido.fecha_pedido).date().isoformat()
+        fila = (1, 6, pedido.total_usd, pedido.total_clp, pedido.total_final_clp, pedido.peso_total_kg)
+        self.assertEqual(resumenes['dia', dia], fila)
+        self.assertEqual(resumenes['estado', 'recibido'], fila)
+        # Los productos 0 y 2 son de la misma marca: el pedido cuenta una vez
+        self.assertEqual(resumenes['marca', 'Marca 0'][:2], (1, 4))
+        self.assertEqual(resumenes['producto', str(self.productos[1].pk)][:2], (1, 2))
+        self.assertEqual(sum(resumenes['marca', marca][4] for marca in ('Marca 0', 'Marca 1')), pedido.total_final_clp)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            detalles = [{'producto': self.productos[3].pk, 'cantidad': 1}]
+            self.api.patch(f'/api/v1/pedidos/{pedido_id}/', {'detalles': detalles}, format='json')
+        resumenes = self.assertIgualAReconstruir()
+        self.assertNotIn(('producto', str(self.productos[0].pk)), resumenes)
+        self.assertEqual(resumenes['marca', 'Marca 1'][:2], (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado([pedido_id], 'en_proceso')
+        resumenes = self.assertIgualAReconstruir()
+        self.assertIn(('estado', 'en_proceso'), resumenes)
+        self.assertNotIn(('estado', 'recibido'), resumenes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Pedido.objects.filter(pk=pedido_id).delete()
+        self.assertEqual(self.assertIgualAReconstruir(), {})
+        self.assertFalse(AporteResumen.objects.exists())
+
+    def test_cambio_y_borrado_de_producto(self):
+        self.crear_pedido({0: 1, 1: 1})
+        self.crear_pedido({0: 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[0].marca = 'Marca 1'
+            self.productos[0].save()
+        resumenes = self.assertIgualAReconstruir()
+        self.assertEqual(resumenes['marca', 'Marca 1'][:2], (2, 4))
+        self.assertNotIn(('marca', 'Marca 0'), resumenes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.productos[1].delete()
+        self.assertNotIn(('producto', str(self.productos[1].pk)), self.assertIgualAReconstruir())
+
+    def test_producto_por_lotes(self):
+        ids = [self.crear_pedido({0: 1}) for _ in range(3)]
+        self.crear_pedido({1: 1})
+        Producto.objects.filter(pk=self.productos[0].pk).update(marca='Marca 1')
+        with mock.patch('api.resumenes.sincronizar', wraps=sincronizar) as espia:
+            self.assertEqual(sincronizar_producto(self.productos[0].pk, tamano_lote=2), 3)
+        self.assertEqual([llamada.args[0] for llamada in espia.call_args_list], [ids[:2], ids[2:]])
+        self.assertEqual(self.assertIgualAReconstruir()['marca', 'Marca 1'][:2], (4, 4))
+
+    def test_una_sincronizacion_por_transaccion(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            pedidos = [Pedido.objects.create(cliente=self.cliente) for _ in range(3)]
+            cambiar_estado([pedido.pk for pedido in pedidos], 'en_proceso')
+        pendientes = {callback for callback in callbacks if isinstance(callback, _Pendientes)}
+        self.assertEqual(len(pendientes), 1)
+        pendientes = pendientes.pop()
+        self.assertLessEqual({pedido.pk for pedido in pedidos}, pendientes.ids)
+        with mock.patch('api.utils.en_segundo_plano') as en_segundo_plano:
+            for callback in callbacks:
+                callback()
+        en_segundo_plano.assert_called_once()
+
+    def test_savepoint_revertido_no_pierde_la_sincronizacion(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            try:
+                with transaction.atomic():
+                    revertido = Pedido.objects.create(cliente=self.cliente)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            pedido = Pedido.objects.create(cliente=self.cliente)
+        # El registro hecho dentro del savepoint se descartó; el posterior queda
+        pendientes = [callback for callback in callbacks if isinstance(callback, _Pendientes)]
+        self.assertEqual(len(pendientes), 1)
+        self.assertLessEqual({revertido.pk, pedido.pk}, pendientes[0].ids)
+
+    def test_sincronizar_es_idempotente(self):
+        pedido_id = self.crear_pedido({0: 1})
+        antes = self.resumenes()
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(sincronizar([pedido_id]), 0)
+        self.assertEqual(escrituras_a(contexto, 'api_resumenventas'), 0)
+        self.assertEqual(self.resumenes(), antes)
+
+    def test_endpoint_solo_personal(self):
+        for i in range(3):
+            self.crear_pedido({i: i + 1})
+        url = '/api/v1/analitica/ventas/?limite=2'
+        self.assertEqual(self.api.get(url).status_code, 403)
+
+        self.api.force_authenticate(self.admin)
+        with self.assertNumQueries(5):
+            respuesta = self.api.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.data
+        self.assertEqual(datos['totales']['pedidos'], 3)
+        self.assertEqual(datos['totales']['total_final_clp'],
+                         str(sum(Pedido.objects.values_list('total_final_clp', flat=True))))
+        self.assertEqual([fila['estado'] for fila in datos['por_estado']], [estado for estado, _ in Pedido.ESTADOS_PEDIDO])
+        self.assertEqual(sum(fila['pedidos'] for fila in datos['por_dia']), 3)
+        self.assertEqual(len(datos['por_producto']), 2)
+        self.assertEqual(datos['por_producto'][0]['nombre'], 'Producto 2')
+        self.assertEqual([fila['marca'] for fila in datos['por_marca']], ['Marca 0', 'Marca 1'])
+        self.assertEqual(self.api.get('/api/v1/analitica/ventas/?desde=2024-02-01&hasta=2024-01-01').status_code, 400)
+
+        # Los totales son del período; por estado es histórico
+        datos = self.api.get('/api/v1/analitica/ventas/?desde=2024-01-01&hasta=2024-01-31').data
+        self.assertEqual((datos['totales']['pedidos'], datos['por_dia']), (0, []))
+        self.assertEqual(sum(fila['pedidos'] for fila in datos['por_estado']), 3)
+
+    def test_comando_reconstruir(self):
+        self.crear_pedido({0: 1})
+        ResumenVentas.objects.all().delete()
+        salida = io.StringIO()
+        call_command('reconstruir_resumenes', '--tamano-lote', '1', stdout=salida)
+        self.assertIn('1 pedidos', salida.getvalue())
+        self.assertEqual(ResumenVentas.objects.get(dimension='estado', clave='recibido').pedidos, 1)
+
+
+class PruebaCargaTests(TestCase):
+    def test_medir_carga_descuenta_calentamiento_y_errores(self):
+        llamadas = []
+
+        def peticion(sesion):
+            llamadas.append(sesion)
+            time.sleep(0.005)
+            if len(llamadas) % 5 == 0:
+                raise requests.ConnectionError('caída')
+            return len(llamadas) % 7 != 0
+
+        resultado = medir_carga(peticion, concurrencia=2, duracion=0.3, calentamiento=0.1)
+        self.assertEqual(len({id(sesion) for sesion in llamadas}), 2)
+        self.assertGreater(resultado['errores'], 0)
+        self.assertLess(resultado['peticiones'] + resultado['errores'], len(llamadas))
+        self.assertLessEqual(resultado['p50_ms'], resultado['p99_ms'])
+
+    def test_comparar_carga(self):
+        base = {'configuracion': {}, 'productos': {'peticiones_por_segundo': 100.0, 'p99_ms': 80.0}}
+        actual = {'configuracion': {}, 'productos': {'peticiones_por_segundo': 250.0, 'p99_ms': 30.0}}
+        self.assertEqual(comparar_carga(base, actual), ['productos: 100.0 -> 250.0 pet/s, p99 80.0 -> 30.0 ms'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AutenticacionCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(username='cliente', password='Clave-segura-123')
+
+    def api(self, usuario=None, acceso=None):
+        from .serializers import CustomTokenObtainPairSerializer
+        acceso = acceso or str(CustomTokenObtainPairSerializer.get_token(usuario or self.usuario).access_token)
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {acceso}')
+        return api
+
+    def test_usuario_desde_cache(self):
+        from .autenticacion import clave_usuario
+        api = self.api()
+        self.assertEqual(api.get('/api/v1/notificaciones/').status_code, 200)
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(api.get('/api/v1/notificaciones/').status_code, 200)
+        self.assertEqual(consultas_a(contexto, 'api_usuario'), [])
+        # Sin el hash de la contraseña ni datos personales
+        self.assertEqual(cache.get(clave_usuario(self.usuario.pk)), {
+            'id': self.usuario.pk, 'is_active': True, 'is_staff': False, 'is_superuser': False, 'version_token': 0})
+
+    def test_consultas_al_usuario_por_endpoint(self):
+        Configuracion.objects.create()
+        producto = Producto.objects.create(nombre='Producto', marca='Marca', precio_usd=Decimal('10.00'))
+        api = self.api()
+        api.get('/api/v1/notificaciones/')
+
+        def consultas(metodo, url, datos=None):
+            with CaptureQueriesContext(connection) as contexto:
+                respuesta = getattr(api, metodo)(url, datos, format='json')
+            self.assertLess(respuesta.status_code, 300, respuesta.data)
+            return respuesta, consultas_a(contexto, 'api_usuario')
+
+        # Cada vista lee de una vez solo los campos diferidos que usa; nunca la contraseña salvo al cambiarla
+        respuesta, sql = consultas('get', '/api/v1/users/profile/')
+        self.assertEqual(respuesta.data['username'], 'cliente')
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn('"password"', sql[0])
+
+        _, sql = consultas('put', '/api/v1/users/profile/', {'telefono': '+56911111111', 'direccion': 'Calle 123'})
+        self.assertEqual([consulta.split()[0] for consulta in sql], ['SELECT', 'UPDATE'])
+        self.assertNotIn('"password"', ' '.join(sql))
+
+        with mock.patch('api.utils.en_segundo_plano'):
+            respuesta, sql = consultas('post', '/api/v1/pedidos/', {'detalles': [{'producto': producto.pk, 'cantidad': 1}]})
+        self.assertEqual(respuesta.data['cliente']['telefono'], '+56911111111')
+        self.assertEqual(len(sql), 1)
+
+        _, sql = consultas('post', '/api/v1/users/change-password/',
+                           {'old_password': 'Clave-segura-123', 'new_password': 'Otra-clave-456'})
+        self.assertEqual([consulta.split()[0] for consulta in sql], ['SELECT', 'UPDATE'])
+        self.assertEqual(Usuario.objects.get(pk=self.usuario.pk).version_token, 1)
+
+    def test_actualizar_perfil_invalida_cache(self):
+        api = self.api()
+        api.get('/api/v1/users/profile/')
+        respuesta = api.put('/api/v1/users/profile/', {
+            'telefono': '+56911111111', 'direccion': 'Calle 123', 'first_name': 'Ana', 'last_name': 'Pérez'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(api.get('/api/v1/users/profile/').data['first_name'], 'Ana')
+        # Datos de perfil: los tokens siguen vigentes
+        self.assertEqual(Usuario.objects.get(pk=self.usuario.pk).version_token, 0)
+
+    def test_cambiar_clave_revoca_tokens_sin_consultar(self):
+        api = self.api()
+        api.get('/api/v1/users/profile/')
+        respuesta = api.post('/api/v1/users/change-password/',
+                             {'old_password': 'Clave-segura-123', 'new_password': 'Otra-clave-456'})
+        self.assertEqual(respuesta.status_code, 200)
+
+        api.get('/api/v1/users/profile/')
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(api.get('/api/v1/users/profile/').status_code, 401)
+        self.assertEqual(len(contexto.captured_queries), 0)
+        nuevo = self.api(acceso=respuesta.data['access'])
+        self.assertEqual(nuevo.get('/api/v1/users/profile/').status_code, 200)
+
+    def test_edicion_de_permisos_revoca_y_guardado_parcial_no(self):
+        api = self.api()
+        api.get('/api/v1/users/profile/')
+        self.usuario.last_login = timezone.now()
+        self.usuario.save(update_fields=['last_login'])
+        self.assertEqual(api.get('/api/v1/users/profile/').status_code, 200)
+
+        usuario = Usuario.objects.get(pk=self.usuario.pk)
+        usuario.is_staff = True
+        usuario.save()
+        self.assertEqual(usuario.version_token, 1)
+        self.assertEqual(api.get('/api/v1/users/profile/').status_code, 401)
+
+    def test_cuenta_eliminada(self):
+        api = self.api()
+        api.get('/api/v1/users/profile/')
+        self.assertEqual(api.delete('/api/v1/users/delete/').status_code, 204)
+        self.assertEqual(api.get('/api/v1/users/profile/').status_code, 401)
+
+    def test_eventos_rechazan_token_revocado(self):
+        from django.test import RequestFactory
+        from .eventos import usuario_del_token
+        from .serializers import CustomTokenObtainPairSerializer
+        acceso = str(CustomTokenObtainPairSerializer.get_token(self.usuario).access_token)
+        peticion = RequestFactory().get('/api/v1/eventos/', HTTP_AUTHORIZATION=f'Bearer {acceso}')
+        self.assertEqual(usuario_del_token(peticion), self.usuario.pk)
+
+        self.usuario.set_password('Otra-clave-456')
+        self.usuario.save()
+        self.api(acceso=acceso).get('/api/v1/users/profile/')
+        self.assertIsNone(usuario_del_token(peticion))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ConsultasPorEndpointTests(DolarFijoMixin, TestCase):
+    """Cada endpoint debe mantenerse bajo su máximo de consultas (ver api.benchmarks.ENDPOINTS)."""
+
+    def test_maximo_de_consultas(self):
+        clientes, contexto = preparar_endpoints(productos=60, pedidos=5, lineas=30, notificaciones=40)
+        for endpoint in ENDPOINTS:
+            with self.subTest(endpoint.nombre):
+                _, consultas, _ = medir(lambda: endpoint.ejecutar(clientes, contexto), repeticiones=2)
+                self.assertLessEqual(
+                    len(consultas), endpoint.max_consultas, '\n'.join(q['sql'] for q in consultas))
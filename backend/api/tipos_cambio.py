@@ -0,0 +1,132 @@
+import time
+import requests
+from bisect import bisect_right
+from datetime import date, datetime
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .models import TipoCambio
+
+CLAVE_VALIDADORES_ADUANERO = 'tipo_cambio:aduanero:validadores'
+
+# Series cargadas por proceso: tipo -> (SerieTipoCambio, expira_en)
+_series = {}
+
+
+class SerieTipoCambio:
+    """Valores de un tipo de cambio ordenados por fecha, con búsqueda binaria."""
+
+    def __init__(self, filas):
+        self.fechas = [fecha for fecha, _ in filas]
+        self.valores = [valor for _, valor in filas]
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def valor_en(self, fecha):
+        """Valor vigente en ``fecha``: el último registrado en o antes de ese día."""
+        posicion = bisect_right(self.fechas, fecha)
+        return self.valores[posicion - 1] if posicion else None
+
+
+def serie(tipo):
+    """
+    Devuelve la serie completa de ``tipo`` con una consulta por proceso.
+
+    Se reutiliza por ``CONFIGURACION_CACHE_TTL`` segundos; ``registrar`` la
+    invalida en el proceso que escribe.
+    """
+    en_proceso = _series.get(tipo)
+    if en_proceso is not None and en_proceso[1] > time.monotonic():
+        return en_proceso[0]
+    filas = TipoCambio.objects.filter(tipo=tipo).order_by('fecha').values_list('fecha', 'valor')
+    resultado = SerieTipoCambio(list(filas))
+    _series[tipo] = (resultado, time.monotonic() + getattr(settings, 'CONFIGURACION_CACHE_TTL', 60))
+    return resultado
+
+
+def limpiar_cache():
+    _series.clear()
+
+
+def a_fecha(valor=None):
+    """Lleva un datetime (o None, que es hoy) a la fecha local."""
+    if valor is None:
+        return timezone.localdate()
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).date() if timezone.is_aware(valor) else valor.date()
+    return valor
+
+
+def valor_en(tipo, fecha=None):
+    return serie(tipo).valor_en(a_fecha(fecha))
+
+
+def registrar(tipo, valores, fuente=''):
+    """
+    Inserta o actualiza en bloque los valores ``[(fecha, valor), ...]``.
+
+    Usa un único INSERT ... ON CONFLICT sobre (tipo, fecha). Devuelve la
+    cantidad de filas enviadas.
+    """
+    filas = [
+        TipoCambio(tipo=tipo, fecha=fecha, valor=Decimal(valor), fuente=fuente)
+        for fecha, valor in valores
+    ]
+    if not filas:
+        return 0
+    TipoCambio.objects.bulk_create(
+        filas,
+        update_conflicts=True,
+        unique_fields=['tipo', 'fecha'],
+        update_fields=['valor', 'fuente', 'fecha_actualizacion'],
+    )
+    _series.pop(tipo, None)
+    return len(filas)
+
+
+def fecha_desde_texto(texto):
+    """Fecha de las APIs del dólar ('2024-11-21T03:00:00.000Z' o '2024-11-21')."""
+    try:
+        return date.fromisoformat(str(texto)[:10])
+    except ValueError:
+        return timezone.localdate()
+
+
+def dolar_observado_vigente(fecha=None):
+    """
+    Dólar observado vigente en ``fecha`` según el historial.
+
+    Solo para el día de hoy, y si el historial aún está vacío, recurre al
+    proveedor del tipo de cambio; las fechas pasadas nunca consultan la red.
+    """
+    valor = valor_en(TipoCambio.OBSERVADO, fecha)
+    if valor is None and a_fecha(fecha) == timezone.localdate():
+        from .utils import obtener_valor_dolar
+        actual, _ = obtener_valor_dolar()
+        valor = Decimal(actual) if actual else None
+    return valor
+
+
+def actualizar_dolar_aduanero(http=requests):
+    """
+    Descarga la tabla del dólar aduanero y guarda todos sus meses.
+
+    Si la página no cambió (304) no se vuelve a parsear. Devuelve el valor
+    del mes en curso, o None si la descarga falló o ese mes aún no está
+    publicado (el de un mes anterior no cuenta: la tarea debe reintentar).
+    """
+    from .utils import descargar_tabla_dolar_aduanero
+    validadores = cache.get(CLAVE_VALIDADORES_ADUANERO)
+    filas, nuevos = descargar_tabla_dolar_aduanero(http, validadores)
+    if filas is None:
+        return None
+    if filas:
+        registrar(TipoCambio.ADUANERO, filas, fuente='pollmann.cl')
+        cache.set(CLAVE_VALIDADORES_ADUANERO, nuevos, timeout=None)
+    mes = timezone.localdate().replace(day=1)
+    valor = TipoCambio.objects.filter(tipo=TipoCambio.ADUANERO, fecha=mes).values_list('valor', flat=True).first()
+    if valor is None:
+        print(f"El dólar aduanero de {mes:%m/%Y} aún no está publicado.")
+    return valor
@@ -0,0 +1,102 @@
+from decimal import Decimal
+from django.db.models import Sum
+from .models import Configuracion, DetallePedido, Pedido, TipoCambio
+from .tipos_cambio import a_fecha, serie
+
+CAMPOS_TOTALES = ['total_usd', 'total_clp', 'peso_total_kg', 'total_final_clp']
+CENTAVOS = Decimal('0.01')
+
+
+def calcular_totales(suma_usd, suma_clp, suma_peso, total_final_clp_actual, configuracion, dolar_aduanero=None):
+    """
+    Calcula los totales de un pedido a partir de las sumas de sus detalles.
+
+    Reproduce el cálculo de seguro, flete, CIF, arancel e IVA de importación.
+    ``dolar_aduanero`` es el vigente a la fecha del pedido; sin él se usa el de
+    la configuración y, si tampoco hay, ``total_final_clp`` se mantiene.
+    """
+    if dolar_aduanero is None and configuracion:
+        dolar_aduanero = configuracion.dolar_aduanero
+    total_usd = suma_usd or Decimal('0')
+    total_clp = suma_clp or Decimal('0')
+    peso_total_kg = suma_peso or Decimal('0')
+    total_final_clp = total_final_clp_actual
+
+    if configuracion and dolar_aduanero:
+        seguro = (total_usd * configuracion.tasa_seguro) / Decimal('100.0')
+        flete = peso_total_kg * configuracion.costo_por_kg
+        valor_cif_clp = (total_usd + seguro + flete) * dolar_aduanero
+
+        arancel = (valor_cif_clp * configuracion.tasa_arancel) / Decimal('100.0')
+        iva_importacion = ((valor_cif_clp + arancel) * configuracion.tasa_iva) / Decimal('100.0')
+        total_final_clp = total_clp + arancel + iva_importacion
+
+    # Se redondea igual que al guardar para detectar solo cambios reales
+    return {
+        'total_usd': Decimal(total_usd).quantize(CENTAVOS),
+        'total_clp': Decimal(total_clp).quantize(CENTAVOS),
+        'peso_total_kg': Decimal(peso_total_kg).quantize(CENTAVOS),
+        'total_final_clp': Decimal(total_final_clp).quantize(CENTAVOS),
+    }
+
+
+def _sumas_detalles(prefijo=''):
+    return {
+        'suma_usd': Sum(f'{prefijo}subtotal_usd'),
+        'suma_clp': Sum(f'{prefijo}subtotal_clp'),
+        'suma_peso': Sum(f'{prefijo}peso_kg'),
+    }
+
+
+def recalcular_totales(pedidos, batch_size=500):
+    """
+    Recalcula y guarda los totales de un pedido o de un queryset de pedidos.
+
+    Para un pedido usa un único ``aggregate()`` y un ``update()`` con solo las
+    columnas que cambiaron, actualizando también la instancia. Para un queryset
+    agrupa las sumas en una consulta y escribe los pedidos modificados con
+    ``bulk_update``. Devuelve la cantidad de pedidos escritos.
+    """
+    configuracion = Configuracion.get_solo()
+    # Cada pedido usa el dólar aduanero del mes en que se hizo
+    aduanero = serie(TipoCambio.ADUANERO)
+    from .resumenes import programar_sincronizacion
+
+    if isinstance(pedidos, Pedido):
+        pedido = pedidos
+        # Las líneas pudieron cambiar aunque los totales no
+        programar_sincronizacion([pedido.pk])
+        sumas = DetallePedido.objects.filter(pedido_id=pedido.pk).aggregate(**_sumas_detalles())
+        totales = calcular_totales(
+            configuracion=configuracion, total_final_clp_actual=pedido.total_final_clp,
+            dolar_aduanero=aduanero.valor_en(a_fecha(pedido.fecha_pedido)), **sumas)
+        cambios = {campo: valor for campo, valor in totales.items() if getattr(pedido, campo) != valor}
+        if not cambios:
+            return 0
+        Pedido.objects.filter(pk=pedido.pk).update(**cambios)
+        for campo, valor in cambios.items():
+            setattr(pedido, campo, valor)
+        return 1
+
+    filas = (
+        Pedido.objects.filter(pk__in=pedidos.values('pk'))
+        .annotate(**_sumas_detalles('detalles__'))
+        .values_list('pk', 'fecha_pedido', *CAMPOS_TOTALES, 'suma_usd', 'suma_clp', 'suma_peso')
+    )
+    modificados = []
+    campos_modificados = set()
+    for pk, fecha_pedido, *actuales, suma_usd, suma_clp, suma_peso in filas:
+        actuales = dict(zip(CAMPOS_TOTALES, actuales))
+        totales = calcular_totales(
+            suma_usd, suma_clp, suma_peso, actuales['total_final_clp'], configuracion,
+            dolar_aduanero=aduanero.valor_en(a_fecha(fecha_pedido)))
+        cambios = {campo: valor for campo, valor in totales.items() if actuales[campo] != valor}
+        if cambios:
+            modificados.append(Pedido(pk=pk, **totales))
+            campos_modificados.update(cambios)
+
+    if modificados:
+        campos = [campo for campo in CAMPOS_TOTALES if campo in campos_modificados]
+        Pedido.objects.bulk_update(modificados, campos, batch_size=batch_size)
+        programar_sincronizacion([pedido.pk for pedido in modificados])
+    return len(modificados)
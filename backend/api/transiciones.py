@@ -0,0 +1,71 @@
+from django.db import transaction
+from .eventos import publicar_varios
+from .models import Notificacion, Pedido
+from .resumenes import programar_sincronizacion
+from .serializers import NotificacionSerializer
+
+# Estados a los que puede pasar un pedido desde cada estado
+TRANSICIONES = {
+    'recibido': {'en_proceso'},
+    'en_proceso': {'enviado'},
+    'enviado': {'entregado'},
+    'entregado': set(),
+}
+
+NOMBRES_ESTADO = dict(Pedido.ESTADOS_PEDIDO)
+
+
+def origenes(estado):
+    return [origen for origen, destinos in TRANSICIONES.items() if estado in destinos]
+
+
+def _motivo(anterior, estado):
+    if anterior is None:
+        return 'El pedido no existe.'
+    if anterior == estado:
+        return f'El pedido ya está {NOMBRES_ESTADO[estado].lower()}.'
+    return f'No se puede pasar de {NOMBRES_ESTADO[anterior].lower()} a {NOMBRES_ESTADO[estado].lower()}.'
+
+
+def cambiar_estado(ids, estado):
+    """
+    Lleva los pedidos ``ids`` a ``estado`` con un único UPDATE.
+
+    Solo se mueven los pedidos cuyo estado actual permite la transición; los
+    demás se informan en ``rechazados``. En la misma transacción se crean con
+    un ``bulk_create`` las notificaciones ``estado_pedido`` de los clientes,
+    y sus eventos en tiempo real (``pedido`` y ``notificacion``, que
+    ``bulk_create`` no emite) se publican en un solo lote una vez confirmada.
+    Devuelve ``{'actualizados': [ids], 'rechazados': [{'id', 'estado', 'motivo'}]}``.
+    """
+    ids = sorted(set(ids))
+    permitidos = origenes(estado)
+    with transaction.atomic():
+        # El bloqueo impide que otra transición cambie el estado leído antes del UPDATE
+        actuales = {
+            pk: (anterior, cliente_id) for pk, anterior, cliente_id in
+            Pedido.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', 'estado', 'cliente_id')
+        }
+        validos, rechazados = [], []
+        for pk in ids:
+            anterior = actuales.get(pk, (None, None))[0]
+            if anterior in permitidos:
+                validos.append(pk)
+            else:
+                rechazados.append({'id': pk, 'estado': anterior, 'motivo': _motivo(anterior, estado)})
+        if validos:
+            Pedido.objects.filter(pk__in=validos, estado__in=permitidos).update(estado=estado)
+            programar_sincronizacion(validos)
+            notificaciones = Notificacion.objects.bulk_create(
+                Notificacion(usuario_id=actuales[pk][1], tipo='estado_pedido',
+                             contenido=f'Tu pedido #{pk} ahora está {NOMBRES_ESTADO[estado].lower()}.')
+                for pk in validos
+            )
+            # Los eventos salen solo si las notificaciones quedaron guardadas
+            eventos = []
+            for pk, notificacion in zip(validos, NotificacionSerializer(notificaciones, many=True).data):
+                cliente = [actuales[pk][1]]
+                eventos.append((cliente, 'pedido', {'id': pk, 'estado': estado, 'estado_anterior': actuales[pk][0]}))
+                eventos.append((cliente, 'notificacion', notificacion))
+            transaction.on_commit(lambda: publicar_varios(eventos))
+    return {'actualizados': validos, 'rechazados': rechazados}
@@ -9,8 +9,11 @@ from .views import (
     ConfiguracionViewSet, 
     ChangePasswordView, 
     DeleteAccountView, 
-    DetallePedidoViewSet
+    DetallePedidoViewSet,
+    AnaliticaVentasView,
+    TicketEventosView
 )
+from .eventos import vista_eventos
 
 router = DefaultRouter()
 router.register(r'productos', ProductoViewSet, basename='producto')
@@ -25,4 +28,7 @@ urlpatterns = [
     path('users/profile/', UserProfileView.as_view(), name='user-profile'),
     path('users/change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('users/delete/', DeleteAccountView.as_view(), name='delete-account'),
+    path('eventos/', vista_eventos, name='eventos'),
+    path('eventos/ticket/', TicketEventosView.as_view(), name='eventos-ticket'),
+    path('analitica/ventas/', AnaliticaVentasView.as_view(), name='analitica-ventas'),
 ]
@@ -1,14 +1,19 @@
+import threading
+import time
 import requests
 from bs4 import BeautifulSoup
-from datetime import datetime
-from decimal import Decimal
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 
-def obtener_valor_dolar():
+def consultar_valor_dolar(http=requests):
     url_primaria = 'https://mindicador.cl/api/dolar'
     url_respaldo = 'https://api.gael.cloud/general/public/monedas/USD'
     
     try:
-        respuesta = requests.get(url_primaria, timeout=10)
+        respuesta = http.get(url_primaria, timeout=10)
         respuesta.raise_for_status()
         datos = respuesta.json()
         valor_dolar = datos['serie'][0]['valor']
@@ -17,7 +22,7 @@ def obtener_valor_dolar():
     except (requests.exceptions.RequestException, KeyError) as e:
         print(f"Error al obtener el valor del dólar de la API primaria: {e}")
         try:
-            respuesta = requests.get(url_respaldo, timeout=10)
+            respuesta = http.get(url_respaldo, timeout=10)
             respuesta.raise_for_status()
             datos = respuesta.json()
             valor_dolar = float(datos['Valor'].replace(',', '.'))
@@ -27,56 +32,317 @@ def obtener_valor_dolar():
             print(f"Error al obtener el valor del dólar de la API de respaldo: {e}")
             return None, None
 
-def obtener_dolar_aduanero():
-    url = 'https://www.pollmann.cl/parametros.php?tipo=5'
-    try:
-        respuesta = requests.get(url, timeout=10)
-        respuesta.raise_for_status()  # Verifica que la solicitud fue exitosa
-        soup = BeautifulSoup(respuesta.content, 'html.parser')
+def _ejecutar_en_hilo(funcion):
+    hilo = threading.Thread(target=funcion, daemon=True)
+    hilo.start()
+    return hilo
 
-        # Encuentra la tabla que contiene los datos
-        tabla = soup.find('table', {'cellpadding': '2', 'cellspacing': '2', 'border': '1', 'align': 'left'})
-        if not tabla:
-            print("No se pudo encontrar la tabla en la página.")
-            return None
+def _en_segundo_plano(funcion):
+    def envoltura():
+        try:
+            funcion()
+        finally:
+            # Los hilos propios no deben dejar conexiones abiertas
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+    return envoltura
+
+def _celery_asincrono():
+    from celery import current_app
+    return not current_app.conf.task_always_eager
+
+def en_segundo_plano(tarea, *args):
+    """Encola la tarea en el worker; sin worker la ejecuta en un hilo aparte."""
+    if _celery_asincrono():
+        return tarea.delay(*args)
+    return _ejecutar_en_hilo(_en_segundo_plano(lambda: tarea.apply(args=args)))
+
+def _repreciar_catalogo(valor_dolar):
+    from .tasks import tarea_repreciar_productos
+    tarea_repreciar_productos.delay(str(valor_dolar))
+
+class ProveedorTipoCambio:
+    """
+    Entrega el valor del dólar sin esperar a la red en el camino crítico.
+
+    Busca primero en memoria del proceso, luego en el caché de Django y por
+    último en el último valor bueno guardado en Configuracion; la memoria
+    vencida se compara con el caché, que otro proceso pudo haber refrescado.
+    Un valor vencido (``ttl``) se entrega igual y se refresca en segundo plano
+    hasta ``max_obsoleto`` segundos más; solo se consulta la red de forma
+    síncrona cuando no hay ningún valor conocido o el conocido es más viejo.
+
+    Sin ``ejecutor`` explícito el refresco se encola como tarea de Celery cuando
+    hay un worker, o corre en un hilo cuando las tareas son en línea.
+    """
+
+    clave_cache = 'tipo_cambio:dolar'
+    clave_bloqueo = 'tipo_cambio:dolar:refrescando'
 
-        # Obtener el mes actual en español
-        meses_espanol = {
-            1: 'Enero',
-            2: 'Febrero',
-            3: 'Marzo',
-            4: 'Abril',
-            5: 'Mayo',
-            6: 'Junio',
-            7: 'Julio',
-            8: 'Agosto',
-            9: 'Septiembre',
-            10: 'Octubre',
-            11: 'Noviembre',
-            12: 'Diciembre'
+    def __init__(self, http=requests, ejecutor=None, ttl=None, max_obsoleto=None, al_cambiar=_repreciar_catalogo):
+        self.http = http
+        self.ejecutor = ejecutor
+        self.al_cambiar = al_cambiar
+        self._ttl = ttl
+        self._max_obsoleto = max_obsoleto
+        self._bloqueo = threading.Lock()
+        self._refrescando = False
+        self._local = None
+        self.reiniciar_metricas()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'TIPO_CAMBIO_TTL', 60 * 60)
+
+    @property
+    def max_obsoleto(self):
+        if self._max_obsoleto is not None:
+            return self._max_obsoleto
+        return getattr(settings, 'TIPO_CAMBIO_MAX_OBSOLETO', 24 * 60 * 60)
+
+    def reiniciar_metricas(self):
+        self._metricas = {
+            'aciertos_memoria': 0,
+            'aciertos_cache': 0,
+            'aciertos_bd': 0,
+            'fallos': 0,
+            'obsoletos_servidos': 0,
+            'refrescos': 0,
+            'refrescos_fallidos': 0,
+            'latencia_ultimo_refresco_ms': None,
+            'latencia_total_refresco_ms': 0.0,
         }
-        mes_actual = meses_espanol[datetime.now().month]
-
-        # Buscar la fila que corresponde al mes actual
-        filas = tabla.find_all('tr')
-        for fila in filas:
-            celdas = fila.find_all('td')
-            if len(celdas) >= 4:
-                mes = celdas[1].get_text(strip=True)
-                valor_texto = celdas[2].get_text(strip=True)
-                if mes == mes_actual:
-                    # Convierte el valor a Decimal, eliminando cualquier separador de miles o símbolo
-                    valor_dolar_aduanero = Decimal(valor_texto.replace('.', '').replace(',', '.'))
-                    return valor_dolar_aduanero
-        print(f"No se encontró el valor del dólar aduanero para el mes de {mes_actual}.")
-        return None
 
+    def metricas(self):
+        with self._bloqueo:
+            return dict(self._metricas)
+
+    def limpiar(self):
+        with self._bloqueo:
+            self._local = None
+        cache.delete(self.clave_cache)
+
+    def _contar(self, nombre, cantidad=1):
+        with self._bloqueo:
+            self._metricas[nombre] += cantidad
+
+    def obtener(self):
+        ahora = time.time()
+        entrada = self._local
+        if entrada is not None and ahora - entrada[2] < self.ttl:
+            self._contar('aciertos_memoria')
+            return entrada[0], entrada[1]
+
+        # La copia en memoria venció o no existe: otro proceso pudo haber refrescado el caché compartido
+        compartida = cache.get(self.clave_cache)
+        if compartida is not None:
+            self._contar('aciertos_cache')
+        else:
+            compartida = self._leer_ultimo_valor_bueno()
+            if compartida is not None:
+                self._contar('aciertos_bd')
+        if compartida is not None and (entrada is None or compartida[2] > entrada[2]):
+            entrada = self._local = compartida
+
+        if entrada is None or ahora - entrada[2] >= self.ttl + self.max_obsoleto:
+            # Sin valor o demasiado viejo para entregarlo: se consulta la red en línea
+            self._contar('fallos')
+            return self.refrescar()
+
+        if ahora - entrada[2] >= self.ttl:
+            self._contar('obsoletos_servidos')
+            self._refrescar_en_segundo_plano()
+        return entrada[0], entrada[1]
+
+    def refrescar(self):
+        inicio = time.perf_counter()
+        valor, fecha = consultar_valor_dolar(self.http)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        with self._bloqueo:
+            self._metricas['latencia_ultimo_refresco_ms'] = latencia_ms
+            self._metricas['latencia_total_refresco_ms'] += latencia_ms
+            self._metricas['refrescos' if valor else 'refrescos_fallidos'] += 1
+        if not valor:
+            return None, None
+
+        valor = Decimal(str(valor))
+        anterior = self._local[0] if self._local else None
+        self._guardar((valor, fecha, time.time()))
+        if self.al_cambiar and valor != anterior:
+            self._ejecutar(lambda: self.al_cambiar(valor))
+        return valor, fecha
+
+    def _ejecutar(self, funcion):
+        (self.ejecutor or _ejecutar_en_hilo)(_en_segundo_plano(funcion))
+
+    def _refrescar_en_segundo_plano(self):
+        with self._bloqueo:
+            if self._refrescando:
+                return
+            self._refrescando = True
+        # Evita que varios procesos refresquen al mismo tiempo
+        if not cache.add(self.clave_bloqueo, True, timeout=60):
+            with self._bloqueo:
+                self._refrescando = False
+            return
+
+        if self.ejecutor is None and _celery_asincrono():
+            self._encolar_refresco()
+            return
+
+        def tarea():
+            try:
+                self.refrescar()
+            finally:
+                cache.delete(self.clave_bloqueo)
+                with self._bloqueo:
+                    self._refrescando = False
+
+        self._ejecutar(tarea)
+
+    def _encolar_refresco(self):
+        from .tasks import tarea_actualizar_dolar
+        try:
+            # La tarea libera clave_bloqueo al terminar
+            tarea_actualizar_dolar.delay()
+        except Exception as e:
+            print(f"No se pudo encolar el refresco del dólar: {e}")
+            cache.delete(self.clave_bloqueo)
+        finally:
+            with self._bloqueo:
+                self._refrescando = False
+
+    def _guardar(self, entrada):
+        self._local = entrada
+        cache.set(self.clave_cache, entrada, timeout=self.ttl + self.max_obsoleto)
+        valor, fecha, obtenido_en = entrada
+        from .models import Configuracion, TipoCambio, VersionColeccion
+        from .tipos_cambio import fecha_desde_texto, registrar
+        registrar(TipoCambio.OBSERVADO, [(fecha_desde_texto(fecha), valor)])
+        obtenido = datetime.fromtimestamp(obtenido_en, tz=dt_timezone.utc)
+        Configuracion.objects.filter(pk__in=Configuracion.objects.order_by('pk').values('pk')[:1]).update(
+            dolar_observado=valor,
+            fecha_actualizacion_dolar_observado=obtenido,
+            fecha_modificacion=obtenido,
+        )
+        VersionColeccion.incrementar(VersionColeccion.CONFIGURACION)
+
+    def _leer_ultimo_valor_bueno(self):
+        from .models import Configuracion
+        configuracion = Configuracion.objects.order_by('pk').values(
+            'dolar_observado', 'fecha_actualizacion_dolar_observado'
+        ).first()
+        if not configuracion or not configuracion['dolar_observado']:
+            return None
+        fecha = configuracion['fecha_actualizacion_dolar_observado']
+        return configuracion['dolar_observado'], fecha.isoformat(), fecha.timestamp()
+
+proveedor_dolar = ProveedorTipoCambio()
+
+def obtener_valor_dolar():
+    return proveedor_dolar.obtener()
+
+URL_DOLAR_ADUANERO = 'https://www.pollmann.cl/parametros.php?tipo=5'
+
+MESES = {
+    'Enero': 1,
+    'Febrero': 2,
+    'Marzo': 3,
+    'Abril': 4,
+    'Mayo': 5,
+    'Junio': 6,
+    'Julio': 7,
+    'Agosto': 8,
+    'Septiembre': 9,
+    'Octubre': 10,
+    'Noviembre': 11,
+    'Diciembre': 12,
+}
+
+def parsear_tabla_dolar_aduanero(contenido, hoy=None):
+    """
+    Devuelve todos los meses de la tabla como ``[(fecha, valor), ...]``.
+
+    La fecha es el primer día del mes. Si la fila no trae el año, los meses
+    posteriores al actual se asumen del año anterior.
+    """
+    hoy = hoy or date.today()
+    soup = BeautifulSoup(contenido, 'html.parser')
+
+    # Encuentra la tabla que contiene los datos
+    tabla = soup.find('table', {'cellpadding': '2', 'cellspacing': '2', 'border': '1', 'align': 'left'})
+    if not tabla:
+        print("No se pudo encontrar la tabla en la página.")
+        return []
+
+    valores = {}
+    for fila in tabla.find_all('tr'):
+        celdas = fila.find_all('td')
+        if len(celdas) < 4:
+            continue
+        mes = MESES.get(celdas[1].get_text(strip=True))
+        if not mes:
+            continue
+        texto_anio = celdas[0].get_text(strip=True)
+        if texto_anio.isdigit() and len(texto_anio) == 4:
+            anio = int(texto_anio)
+        else:
+            anio = hoy.year if mes <= hoy.month else hoy.year - 1
+        try:
+            # Convierte el valor a Decimal, eliminando cualquier separador de miles o símbolo
+            valor_texto = celdas[2].get_text(strip=True)
+            valores[date(anio, mes, 1)] = Decimal(valor_texto.replace('.', '').replace(',', '.'))
+        except InvalidOperation:
+            continue
+    return sorted(valores.items())
+
+def descargar_tabla_dolar_aduanero(http=requests, validadores=None):
+    """
+    Descarga la tabla del dólar aduanero con una petición condicional.
+
+    Devuelve ``(filas, validadores)``; ``filas`` es ``[]`` solo si la página
+    no cambió desde ``validadores`` (304) y ``None`` si la descarga falló o la
+    página no trae ningún mes.
+    """
+    cabeceras = {}
+    if validadores:
+        if validadores.get('etag'):
+            cabeceras['If-None-Match'] = validadores['etag']
+        if validadores.get('last_modified'):
+            cabeceras['If-Modified-Since'] = validadores['last_modified']
+    try:
+        respuesta = http.get(URL_DOLAR_ADUANERO, timeout=10, headers=cabeceras)
+        if respuesta.status_code == 304:
+            return [], validadores
+        respuesta.raise_for_status()  # Verifica que la solicitud fue exitosa
     except requests.exceptions.RequestException as e:
         print(f"Error al hacer la solicitud: {e}")
-        return None
+        return None, validadores
+
+    nuevos = {
+        'etag': respuesta.headers.get('ETag'),
+        'last_modified': respuesta.headers.get('Last-Modified'),
+    }
+    filas = parsear_tabla_dolar_aduanero(respuesta.content)
+    if not filas:
+        # No se confunde con un 304: los validadores anteriores se conservan
+        print("La tabla del dólar aduanero no trae ningún mes.")
+        return None, validadores
+    return filas, nuevos
+
+def obtener_dolar_aduanero():
+    filas, _ = descargar_tabla_dolar_aduanero()
+    hoy = date.today()
+    for fecha, valor in filas or []:
+        if (fecha.year, fecha.month) == (hoy.year, hoy.month):
+            return valor
+    print(f"No se encontró el valor del dólar aduanero para el mes {hoy.month}.")
+    return None
     
 if __name__ == '__main__':
-    valor_dolar, fecha = obtener_valor_dolar()
+    valor_dolar, fecha = consultar_valor_dolar()
     if valor_dolar:
         print(f"El valor del dólar es {valor_dolar} CLP al {fecha}")
     valor_dolar_aduanero = obtener_dolar_aduanero()
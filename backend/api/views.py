@@ -1,24 +1,50 @@
 from rest_framework import viewsets, permissions, generics, filters
 from rest_framework.views import APIView
-from .models import Producto, Pedido, DetallePedido, Notificacion, Configuracion
+from .models import Producto, Pedido, DetallePedido, Notificacion, Configuracion, VersionColeccion
 from .serializers import (
-    ProductoSerializer, PedidoSerializer, NotificacionSerializer, UserRegistrationSerializer, 
-    UserProfileSerializer, ConfiguracionSerializer, ChangePasswordSerializer, DetallePedidoSerializer
+    ProductoSerializer, ProductoListaSerializer, PedidoSerializer, PedidoListaSerializer, NotificacionSerializer, UserRegistrationSerializer, 
+    UserProfileSerializer, ConfiguracionSerializer, ChangePasswordSerializer, DetallePedidoSerializer,
+    DifusionNotificacionSerializer, MarcarLeidasSerializer, CustomTokenObtainPairSerializer,
+    CambioEstadoPedidosSerializer, UsuarioSerializer,
 )
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import PermissionDenied
+from .autenticacion import cargar_campos
+from .cache_respuestas import cache_catalogo
+from .condicional import RespuestaCondicionalMixin
+from .eventos import emitir_ticket
+from .filters import BusquedaProductoFilter
+from .exportacion import FORMATOS, FiltrosExportacionSerializer, RenderizadorArchivo, exportar, filas_pedidos, nombre_archivo
+from .importacion import ErrorImportacion, detectar_formato, importar_productos
+from .lectura import LecturaRapidaViewMixin
+from .notificaciones import marcar_leidas
+from .pagination import CursorOpcionalMixin
+from .resumenes import FiltrosAnaliticaSerializer, analitica
+from .transiciones import cambiar_estado
 
-class ProductoViewSet(viewsets.ModelViewSet):
+class ProductoViewSet(RespuestaCondicionalMixin, LecturaRapidaViewMixin, CursorOpcionalMixin, viewsets.ModelViewSet):
     queryset = Producto.objects.all()
+    coleccion = VersionColeccion.PRODUCTOS
+    cache_respuestas = cache_catalogo
     serializer_class = ProductoSerializer
+    serializer_lista_class = ProductoListaSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['marca', 'disponible']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BusquedaProductoFilter]
+    filterset_fields = {
+        'marca': ['exact'],
+        'disponible': ['exact'],
+        'precio_clp_efectivo': ['gte', 'lte'],
+    }
     search_fields = ['nombre', 'descripcion']
-    ordering_fields = ['precio_usd', 'peso_kg']
+    ordering_fields = ['precio_usd', 'peso_kg', 'precio_clp_efectivo']
     ordering = ['id']
 
     def perform_create(self, serializer):
@@ -41,30 +67,123 @@ class ProductoViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionDenied("No tiene permiso para eliminar productos.")
 
-class PedidoViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def importar(self, request):
+        """
+        Crea o actualiza productos por (marca, nombre) desde CSV o NDJSON.
+
+        Acepta el archivo en el campo ``archivo`` de un multipart o como cuerpo
+        con Content-Type text/csv o application/x-ndjson; se procesa en lotes
+        sin cargarlo completo en memoria.
+        """
+        if not request.user.is_staff:
+            raise PermissionDenied("No tiene permiso para importar productos.")
+        if request.content_type.startswith('multipart/'):
+            archivo = request.FILES.get('archivo')
+            if archivo is None:
+                return Response({'detail': 'Falta el archivo a importar.'}, status=status.HTTP_400_BAD_REQUEST)
+            nombre, content_type = archivo.name, archivo.content_type
+        else:
+            archivo, nombre, content_type = request.stream, '', request.content_type
+        formato = request.query_params.get('formato') or detectar_formato(nombre, content_type)
+        try:
+            resultado = importar_productos(archivo or [], formato)
+        except ErrorImportacion as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultado.como_dict())
+
+class PedidoViewSet(LecturaRapidaViewMixin, CursorOpcionalMixin, viewsets.ModelViewSet):
     serializer_class = PedidoSerializer
+    serializer_lista_class = PedidoListaSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Pedido.objects.none()
-        return Pedido.objects.filter(cliente=self.request.user).select_related('cliente').prefetch_related('detalles__producto').order_by('id')
+        return Pedido.objects.filter(cliente=self.request.user).select_related('cliente').prefetch_related('detalles').order_by('id')
 
     def perform_create(self, serializer):
-        serializer.save(cliente=self.request.user)
+        # La respuesta incluye los datos del cliente, que el usuario del caché trae diferidos
+        serializer.save(cliente=cargar_campos(self.request.user, UsuarioSerializer.Meta.fields))
 
     def perform_update(self, serializer):
         serializer.save()
+        self.resumen_detalles = serializer.resumen_detalles
+
+    def update(self, request, *args, **kwargs):
+        respuesta = super().update(request, *args, **kwargs)
+        # Informa cuántas líneas se crearon, modificaron o eliminaron
+        if self.resumen_detalles is not None:
+            respuesta.data['detalles_modificados'] = self.resumen_detalles
+        return respuesta
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONRenderer, RenderizadorArchivo])
+    def exportar(self, request):
+        """
+        Descarga todos los pedidos con sus líneas en CSV o NDJSON (solo personal).
+
+        Filtros: ``formato``, ``desde`` y ``hasta`` (fechas inclusivas) y
+        ``estado`` (uno o varios separados por coma). El archivo se genera
+        mientras se envía, sin paginar ni cargar la tabla en memoria.
+        """
+        if not request.user.is_staff:
+            raise PermissionDenied("No tiene permiso para exportar pedidos.")
+        filtros = FiltrosExportacionSerializer(data=request.query_params.dict())
+        filtros.is_valid(raise_exception=True)
+        datos = dict(filtros.validated_data)
+        formato = datos.pop('formato')
+        respuesta = StreamingHttpResponse(exportar(filas_pedidos(**datos), formato), content_type=FORMATOS[formato])
+        respuesta['Content-Disposition'] = (
+            f'attachment; filename="{nombre_archivo(formato, datos.get("desde"), datos.get("hasta"))}"')
+        return respuesta
+
+    @action(detail=False, methods=['post'], url_path='cambiar-estado')
+    def cambiar_estado(self, request):
+        """
+        Cambia el estado de muchos pedidos a la vez (solo personal).
 
-class NotificacionViewSet(viewsets.ReadOnlyModelViewSet):
+        Solo se aplican las transiciones permitidas (recibido → en proceso →
+        enviado → entregado); los pedidos rechazados se informan con el motivo.
+        """
+        if not request.user.is_staff:
+            raise PermissionDenied("No tiene permiso para cambiar el estado de los pedidos.")
+        serializer = CambioEstadoPedidosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(cambiar_estado(**serializer.validated_data))
+
+class NotificacionViewSet(CursorOpcionalMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificacionSerializer
     permission_classes = [IsAuthenticated]
+    filterset_fields = ['leida']
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Notificacion.objects.none()
         return Notificacion.objects.filter(usuario=self.request.user).order_by('id')
-    
+
+    @action(detail=False, methods=['post'], url_path='marcar-leidas')
+    def marcar_leidas(self, request):
+        serializer = MarcarLeidasSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marcadas = marcar_leidas(request.user, serializer.validated_data.get('ids'))
+        return Response({'marcadas': marcadas})
+
+    @action(detail=False, methods=['post'])
+    def difundir(self, request):
+        """Envía una notificación a todos los clientes o a un subconjunto (solo personal)."""
+        if not request.user.is_staff:
+            raise PermissionDenied("No tiene permiso para difundir notificaciones.")
+        serializer = DifusionNotificacionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        filtros = dict(serializer.validated_data)
+        contenido, tipo = filtros.pop('contenido'), filtros.pop('tipo')
+        if 'registrados_desde' in filtros:
+            filtros['registrados_desde'] = filtros['registrados_desde'].isoformat()
+        from .tasks import tarea_difundir_notificacion
+        from .utils import en_segundo_plano
+        transaction.on_commit(lambda: en_segundo_plano(tarea_difundir_notificacion, contenido, tipo, filtros))
+        return Response({'detail': 'Difusión encolada.'}, status=status.HTTP_202_ACCEPTED)
+
 class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.AllowAny]
@@ -84,13 +203,36 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return cargar_campos(self.request.user, UserProfileSerializer.Meta.fields)
     
-class ConfiguracionViewSet(viewsets.ModelViewSet):
+class ConfiguracionViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
     queryset = Configuracion.objects.all().order_by('id')
+    coleccion = VersionColeccion.CONFIGURACION
     serializer_class = ConfiguracionSerializer
     permission_classes = [permissions.IsAdminUser]
 
+class AnaliticaVentasView(APIView):
+    """
+    Ventas para el panel de administración, leídas de los resúmenes (api.resumenes).
+
+    Filtros: ``desde`` y ``hasta`` (fechas inclusivas de ``totales`` y
+    ``por_dia``, por defecto los últimos 30 días; por estado, marca y
+    producto son históricos) y ``limite`` (filas de los rankings).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        filtros = FiltrosAnaliticaSerializer(data=request.query_params.dict())
+        filtros.is_valid(raise_exception=True)
+        return Response(analitica(**filtros.validated_data))
+
+class TicketEventosView(APIView):
+    """Ticket de un solo uso para abrir el flujo de eventos (EventSource no envía la cabecera Authorization)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return Response({'ticket': emitir_ticket(request.user.pk)}, status=status.HTTP_201_CREATED)
+
 class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -98,13 +240,19 @@ class ChangePasswordView(APIView):
         serializer = ChangePasswordSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = request.user
+        user = cargar_campos(request.user, ['password'])
         if not user.check_password(serializer.validated_data['old_password']):
             return Response({"old_password": "La contraseña actual no es correcta."}, status=status.HTTP_400_BAD_REQUEST)
 
         user.set_password(serializer.validated_data['new_password'])
         user.save()
-        return Response({"message": "Contraseña actualizada correctamente."}, status=status.HTTP_200_OK)
+        # El cambio revoca los tokens anteriores (version_token): se entregan unos nuevos
+        refresh = CustomTokenObtainPairSerializer.get_token(user)
+        return Response({
+            "message": "Contraseña actualizada correctamente.",
+            "access": str(refresh.access_token),
+            "refresh": str(refresh),
+        }, status=status.HTTP_200_OK)
 
 class DeleteAccountView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
@@ -124,28 +272,28 @@ class DetallePedidoViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated:
             return DetallePedido.objects.none()
         
-        return DetallePedido.objects.filter(pedido__cliente=user)
+        return DetallePedido.objects.filter(pedido__cliente=user).select_related('pedido').order_by('id')
 
     def perform_create(self, serializer):
         pedido = serializer.validated_data['pedido']
-        if pedido.cliente != self.request.user:
+        if pedido.cliente_id != self.request.user.id:
             raise PermissionDenied("No tienes permiso para agregar detalles a este pedido.")
         serializer.save()
-        pedido.actualizar_totales()
-        pedido.calcular_impuesto_aduanero()
+        pedido.recalcular_totales()
 
     def perform_update(self, serializer):
-        pedido = serializer.validated_data.get('pedido', serializer.instance.pedido)
-        if pedido.cliente != self.request.user:
+        anterior = serializer.instance.pedido
+        pedido = serializer.validated_data.get('pedido', anterior)
+        if pedido.cliente_id != self.request.user.id:
             raise PermissionDenied("No tienes permiso para actualizar detalles de este pedido.")
         serializer.save()
-        pedido.actualizar_totales()
-        pedido.calcular_impuesto_aduanero()
+        pedido.recalcular_totales()
+        if anterior.pk != pedido.pk:
+            anterior.recalcular_totales()
 
     def perform_destroy(self, instance):
         pedido = instance.pedido
-        if pedido.cliente != self.request.user:
+        if pedido.cliente_id != self.request.user.id:
             raise PermissionDenied("No tienes permiso para eliminar detalles de este pedido.")
         instance.delete()
-        pedido.actualizar_totales()
-        pedido.calcular_impuesto_aduanero()
+        pedido.recalcular_totales()
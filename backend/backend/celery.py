@@ -0,0 +1,16 @@
+import os
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@app.on_after_configure.connect
+def crear_carpetas_broker(sender, **kwargs):
+    # El transporte filesystem:// necesita que existan sus carpetas
+    if sender.conf.broker_url.startswith('filesystem://'):
+        for carpeta in sender.conf.broker_transport_options.values():
+            os.makedirs(carpeta, exist_ok=True)
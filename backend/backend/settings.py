@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'api',
     'corsheaders',
@@ -53,6 +54,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.MemoriaPeticionMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -94,9 +97,41 @@ DATABASES = {
         'PASSWORD': os.environ.get('DATABASE_PASSWORD'),
         'HOST': os.environ.get('DATABASE_HOST', 'db'),
         'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        # Verifica la conexión reutilizada antes de la primera consulta de cada petición
+        'CONN_HEALTH_CHECKS': True,
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 0)),
     }
 }
 
+# Pool de conexiones por proceso (psycopg 3). Lo usan los hilos de gthread y,
+# en el servicio de eventos (ASGI), los hilos de corta vida del lector, a los
+# que no conviene atar conexiones persistentes: CONN_MAX_AGE queda en 0.
+# DATABASE_POOL_MAX es el presupuesto de cada worker y gunicorn.conf.py usa
+# la misma cantidad de hilos y limita los workers para no superar
+# DATABASE_MAX_CONEXIONES.
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'True') == 'True'
+DATABASE_POOL_MIN = int(os.environ.get('DATABASE_POOL_MIN', 2))
+DATABASE_POOL_MAX = int(os.environ.get('DATABASE_POOL_MAX', 4))
+try:
+    import psycopg_pool
+except ImportError:
+    psycopg_pool = None
+
+# Django verifica cada conexión al prestarla (ConnectionPool.check_connection):
+# las caídas por un reinicio de PostgreSQL o un failover se descartan solas
+if DATABASE_POOL and psycopg_pool is not None:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': DATABASE_POOL_MIN,
+            'max_size': DATABASE_POOL_MAX,
+            # Segundos que una petición espera una conexión libre antes de fallar
+            'timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+            'max_idle': 5 * 60,
+            'max_lifetime': 60 * 60,
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -147,24 +182,69 @@ AUTH_USER_MODEL = 'api.Usuario'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.autenticacion.JWTCacheAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PaginacionPorPagina',
     'PAGE_SIZE': 10,
 }
 
+# Máximo que un cliente puede pedir con ?page_size=
+MAX_PAGE_SIZE = 100
+
+# Listados de productos y pedidos leídos con values() en vez del serializador (api.lectura)
+LECTURA_RAPIDA = os.environ.get('LECTURA_RAPIDA', 'True') == 'True'
+
+# Memoria máxima (bytes) por proceso para los listados anónimos del catálogo
+CACHE_CATALOGO_MAX_BYTES = int(os.environ.get('CACHE_CATALOGO_MAX_BYTES', 32 * 1024 * 1024))
+
+# Similitud de trigramas (0 a 1) desde la que una palabra del nombre coincide con la búsqueda
+BUSQUEDA_SIMILITUD_MINIMA = float(os.environ.get('BUSQUEDA_SIMILITUD_MINIMA', 0.3))
+
+# Importación masiva de productos: filas por upsert y errores que se informan
+IMPORTACION_TAMANO_LOTE = int(os.environ.get('IMPORTACION_TAMANO_LOTE', 1000))
+IMPORTACION_MAX_ERRORES = int(os.environ.get('IMPORTACION_MAX_ERRORES', 1000))
+
+# Filas que trae cada viaje del cursor del servidor al exportar pedidos
+EXPORTACION_TAMANO_LOTE = int(os.environ.get('EXPORTACION_TAMANO_LOTE', 2000))
+
+# Notificaciones insertadas por bulk_create al difundir una promoción
+NOTIFICACIONES_TAMANO_LOTE = int(os.environ.get('NOTIFICACIONES_TAMANO_LOTE', 5000))
+
+# Pedidos por lote al reconstruir los resúmenes de ventas (reconstruir_resumenes)
+RESUMENES_TAMANO_LOTE = int(os.environ.get('RESUMENES_TAMANO_LOTE', 2000))
+
+# Server-Sent Events (api.eventos): lectura del registro de eventos, latido,
+# vigencia de los tickets de conexión y memoria por conexión
+EVENTOS_INTERVALO = float(os.environ.get('EVENTOS_INTERVALO', 0.5))
+EVENTOS_LATIDO = int(os.environ.get('EVENTOS_LATIDO', 15))
+EVENTOS_RETENCION = int(os.environ.get('EVENTOS_RETENCION', 300))
+EVENTOS_TICKET_TTL = int(os.environ.get('EVENTOS_TICKET_TTL', 30))
+EVENTOS_COLA = 100
+
+# Respuestas más pequeñas se envían sin comprimir (gzip / brotli)
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', 1024))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Variantes de Producto.imagen que genera api.imagenes (anchos en píxeles)
+IMAGEN_ANCHOS = [int(ancho) for ancho in os.environ.get('IMAGEN_ANCHOS', '160,320,640,1024').split(',')]
+IMAGEN_FORMATOS = ['webp', 'jpeg']
+IMAGEN_CALIDAD = int(os.environ.get('IMAGEN_CALIDAD', 80))
+
 CELERY_BEAT_SCHEDULE = {
     'actualizar-dolar-aduanero-mensual': {
         'task': 'api.tasks.tarea_actualizar_dolar_aduanero',
         'schedule': crontab(day_of_month=1, hour=0, minute=0),  # Primer día de cada mes a las 00:00
     },
+    'actualizar-dolar-observado': {
+        'task': 'api.tasks.tarea_actualizar_dolar',
+        'schedule': crontab(minute='*/30'),
+    },
 }
 
 SWAGGER_SETTINGS = {
@@ -184,6 +264,43 @@ SIMPLE_JWT = {
     'TOKEN_OBTAIN_PAIR_SERIALIZER': 'api.serializers.CustomTokenObtainPairSerializer',
 }
 
-CELERY_TASK_ALWAYS_EAGER = True
+# Segundos que el usuario de un JWT se toma del caché sin consultar la BD
+AUTENTICACION_CACHE_TTL = int(os.environ.get('AUTENTICACION_CACHE_TTL', 60))
+
+# Segundos que cada proceso reutiliza Configuracion.get_solo() sin consultar la BD
+CONFIGURACION_CACHE_TTL = int(os.environ.get('CONFIGURACION_CACHE_TTL', 60))
+
+# Caché del tipo de cambio (segundos). Pasado el TTL el valor se sigue
+# entregando mientras se refresca en segundo plano.
+TIPO_CAMBIO_TTL = int(os.environ.get('TIPO_CAMBIO_TTL', 60 * 60))
+TIPO_CAMBIO_MAX_OBSOLETO = int(os.environ.get('TIPO_CAMBIO_MAX_OBSOLETO', 24 * 60 * 60))
+
+# Caché compartido entre procesos web y worker. Por defecto es local a cada
+# proceso; con DJANGO_CACHE_BACKEND se puede usar uno de archivos o Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# Sin worker las tareas se ejecutan en línea (desarrollo y tests). Con
+# CELERY_TASK_ALWAYS_EAGER=False se encolan en el broker: por defecto uno de
+# archivos locales que no requiere servicios extra; en producción basta con
+# definir CELERY_BROKER_URL (redis://, amqp://).
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'True') == 'True'
 CELERY_TASK_EAGER_PROPAGATES = True
-CELERY_BROKER_URL = 'memory://'
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'filesystem://')
+CELERY_BROKER_TRANSPORT_OPTIONS = {}
+if CELERY_BROKER_URL.startswith('filesystem://'):
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': str(BASE_DIR / '.celery' / 'cola'),
+        'data_folder_out': str(BASE_DIR / '.celery' / 'cola'),
+        'control_folder': str(BASE_DIR / '.celery' / 'control'),
+    }
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Ninguna tarea debe quedar colgada esperando a un sitio externo
+CELERY_TASK_SOFT_TIME_LIMIT = 60
+CELERY_TASK_TIME_LIMIT = 90
@@ -0,0 +1,46 @@
+"""
+Perfil de producción: ``gunicorn -c gunicorn.conf.py backend.wsgi:application``.
+
+La API se sirve por WSGI con hilos ('gthread'). El flujo de eventos
+(/api/v1/eventos/) corre aparte por ASGI, en el servicio ``eventos`` de
+docker-compose, con GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+
+Todo se puede ajustar con variables de entorno; los valores por defecto se
+calculan a partir de los núcleos disponibles y del presupuesto de conexiones
+de PostgreSQL.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Con 'gthread' cada hilo atiende una petición a la vez: con tantos hilos como
+# conexiones tiene el pool del worker, ninguna petición espera una conexión.
+# Bajo ASGI (UvicornWorker) no hay un límite equivalente, porque cada petición
+# síncrona corre en su propio hilo. Por eso ahí solo se sirve el flujo de
+# eventos, que consulta la base desde el lector del registro.
+threads = int(os.environ.get('GUNICORN_THREADS', os.environ.get('DATABASE_POOL_MAX', 4)))
+os.environ['DATABASE_POOL_MAX'] = str(threads)
+
+# (2 x núcleos) + 1, sin pasar del presupuesto de conexiones de la base de
+# datos (max_connections de PostgreSQL menos las del worker de Celery, el
+# servicio de eventos y admin)
+conexiones_maximas = int(os.environ.get('DATABASE_MAX_CONEXIONES', 80))
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY',
+    max(1, min(multiprocessing.cpu_count() * 2 + 1, conexiones_maximas // int(os.environ['DATABASE_POOL_MAX']))),
+))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla los workers de a poco para acotar fugas de memoria sin reinicios simultáneos
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -1,10 +1,88 @@
-import React from 'react';
-import { Container, Typography, Button, Box } from '@mui/material';
+import React, { useEffect, useState } from 'react';
+import {
+  Container,
+  Typography,
+  Button,
+  Box,
+  CircularProgress,
+  Paper,
+  Table,
+  TableBody,
+  TableCell,
+  TableContainer,
+  TableHead,
+  TableRow,
+} from '@mui/material';
 import { Link } from 'react-router-dom';
+import { useSnackbar } from 'notistack';
+import api from '../../api/api';
+
+const formatoClp = (valor) => `${Math.round(Number(valor)).toLocaleString('es-CL')} CLP`;
+
+// Tabla de filas de resumen (pedidos, unidades y totales) con una primera columna propia
+function TablaResumen({ titulo, columna, filas, etiqueta }) {
+  return (
+    <Box sx={{ mt: 4 }}>
+      <Typography variant="h6" gutterBottom>
+        {titulo}
+      </Typography>
+      <TableContainer component={Paper}>
+        <Table size="small">
+          <TableHead>
+            <TableRow>
+              <TableCell>{columna}</TableCell>
+              <TableCell align="right">Pedidos</TableCell>
+              <TableCell align="right">Unidades</TableCell>
+              <TableCell align="right">Total CLP</TableCell>
+              <TableCell align="right">Total final CLP</TableCell>
+            </TableRow>
+          </TableHead>
+          <TableBody>
+            {filas.length === 0 ? (
+              <TableRow>
+                <TableCell colSpan={5}>Sin ventas.</TableCell>
+              </TableRow>
+            ) : (
+              filas.map((fila) => (
+                <TableRow key={etiqueta(fila)}>
+                  <TableCell>{etiqueta(fila)}</TableCell>
+                  <TableCell align="right">{fila.pedidos}</TableCell>
+                  <TableCell align="right">{fila.unidades}</TableCell>
+                  <TableCell align="right">{formatoClp(fila.total_clp)}</TableCell>
+                  <TableCell align="right">{formatoClp(fila.total_final_clp)}</TableCell>
+                </TableRow>
+              ))
+            )}
+          </TableBody>
+        </Table>
+      </TableContainer>
+    </Box>
+  );
+}
 
 function AdminDashboard() {
+  const [analitica, setAnalitica] = useState(null);
+  const [loading, setLoading] = useState(true);
+  const { enqueueSnackbar } = useSnackbar();
+
+  useEffect(() => {
+    const fetchAnalitica = async () => {
+      try {
+        // Resúmenes precalculados: la respuesta no depende de la cantidad de pedidos
+        const response = await api.get('analitica/ventas/');
+        setAnalitica(response.data);
+      } catch (error) {
+        console.error('Error al obtener las ventas', error);
+        enqueueSnackbar('Error al obtener las ventas.', { variant: 'error' });
+      } finally {
+        setLoading(false);
+      }
+    };
+    fetchAnalitica();
+  }, [enqueueSnackbar]);
+
   return (
-    <Container maxWidth="md" sx={{ mt: 5 }}>
+    <Container maxWidth="md" sx={{ mt: 5, mb: 5 }}>
       <Typography variant="h4" gutterBottom>
         Panel de Administrador
       </Typography>
@@ -19,6 +97,49 @@ function AdminDashboard() {
           Configurar Comisión
         </Button>
       </Box>
+
+      <Typography variant="h5" sx={{ mt: 5 }} gutterBottom>
+        Ventas
+      </Typography>
+      {loading ? (
+        <CircularProgress />
+      ) : analitica && (
+        <>
+          <Typography variant="body2" color="text.secondary" gutterBottom>
+            Totales del {analitica.desde} al {analitica.hasta}
+          </Typography>
+          <Box sx={{ display: 'flex', flexWrap: 'wrap', gap: 2 }}>
+            {[
+              ['Pedidos', analitica.totales.pedidos],
+              ['Unidades', analitica.totales.unidades],
+              ['Total CLP', formatoClp(analitica.totales.total_clp)],
+              ['Total final CLP', formatoClp(analitica.totales.total_final_clp)],
+              ['Peso total', `${analitica.totales.peso_total_kg} kg`],
+            ].map(([titulo, valor]) => (
+              <Paper key={titulo} sx={{ p: 2, minWidth: 150 }}>
+                <Typography variant="body2" color="text.secondary">
+                  {titulo}
+                </Typography>
+                <Typography variant="h6">{valor}</Typography>
+              </Paper>
+            ))}
+          </Box>
+          <TablaResumen titulo="Por estado (histórico)" columna="Estado" filas={analitica.por_estado} etiqueta={(fila) => fila.nombre} />
+          <TablaResumen
+            titulo={`Por día (${analitica.desde} a ${analitica.hasta})`}
+            columna="Fecha"
+            filas={analitica.por_dia}
+            etiqueta={(fila) => fila.fecha}
+          />
+          <TablaResumen titulo="Marcas más vendidas (histórico)" columna="Marca" filas={analitica.por_marca} etiqueta={(fila) => fila.marca} />
+          <TablaResumen
+            titulo="Productos más vendidos (histórico)"
+            columna="Producto"
+            filas={analitica.por_producto}
+            etiqueta={(fila) => fila.nombre || `#${fila.producto}`}
+          />
+        </>
+      )}
     </Container>
   );
 }
@@ -30,6 +30,9 @@ function ChangePassword() {
         old_password,
         new_password,
       });
+      // Los tokens anteriores quedan revocados con el cambio de contraseña
+      localStorage.setItem('access_token', response.data.access);
+      localStorage.setItem('refresh_token', response.data.refresh);
       enqueueSnackbar(response.data.message, { variant: 'success' });
       navigate('/profile');
     } catch (error) {
@@ -13,9 +13,13 @@ import {
 import { ExpandLess, ExpandMore } from '@mui/icons-material';
 import { useSnackbar } from 'notistack';
 
+// El flujo de eventos lo sirve un servicio ASGI aparte (docker-compose: eventos)
+const URL_EVENTOS = process.env.REACT_APP_EVENTOS_BASE_URL || api.defaults.baseURL;
+
 function OrderHistory() {
   const [orders, setOrders] = useState([]);
   const [openOrderIds, setOpenOrderIds] = useState([]);
+  const [orderDetails, setOrderDetails] = useState({});
   const [loading, setLoading] = useState(true);
   const { enqueueSnackbar } = useSnackbar();
 
@@ -46,7 +50,68 @@ function OrderHistory() {
     fetchOrders();
   }, [enqueueSnackbar]);
 
+  // Cambios de estado en vivo (Server-Sent Events) en vez de volver a consultar
+  useEffect(() => {
+    if (!localStorage.getItem('access_token') || typeof EventSource === 'undefined') {
+      return undefined;
+    }
+    let eventos = null;
+    let reintento = null;
+    let ultimo = '';
+    let activo = true;
+
+    // El token no va en la URL: cada conexión usa un ticket de un solo uso
+    const conectar = async () => {
+      try {
+        const { data } = await api.post('eventos/ticket/');
+        if (!activo) {
+          return;
+        }
+        const consulta = `ticket=${encodeURIComponent(data.ticket)}${ultimo ? `&ultimo=${ultimo}` : ''}`;
+        eventos = new EventSource(`${URL_EVENTOS}eventos/?${consulta}`);
+      } catch (error) {
+        reintento = activo && setTimeout(conectar, 10000);
+        return;
+      }
+      eventos.addEventListener('pedido', (evento) => {
+        ultimo = evento.lastEventId;
+        const { id, estado } = JSON.parse(evento.data);
+        setOrders((prevOrders) =>
+          prevOrders.map((order) => (order.id === id ? { ...order, estado } : order))
+        );
+        enqueueSnackbar(`El pedido #${id} cambió a "${estado}".`, { variant: 'info' });
+      });
+      // El reintento automático repetiría el ticket ya usado: se reconecta con uno nuevo
+      eventos.onerror = () => {
+        eventos.close();
+        reintento = activo && setTimeout(conectar, 3000);
+      };
+    };
+    conectar();
+    return () => {
+      activo = false;
+      clearTimeout(reintento);
+      if (eventos) {
+        eventos.close();
+      }
+    };
+  }, [enqueueSnackbar]);
+
+  // El listado no trae los detalles; se piden al abrir cada pedido
+  const fetchOrderDetails = async (orderId) => {
+    try {
+      const response = await api.get(`pedidos/${orderId}/`);
+      setOrderDetails((prevDetails) => ({ ...prevDetails, [orderId]: response.data.detalles }));
+    } catch (error) {
+      console.error('Error al obtener los detalles del pedido', error);
+      enqueueSnackbar('Error al obtener los detalles del pedido.', { variant: 'error' });
+    }
+  };
+
   const handleToggle = (orderId) => {
+    if (!openOrderIds.includes(orderId) && !orderDetails[orderId]) {
+      fetchOrderDetails(orderId);
+    }
     setOpenOrderIds((prevOpen) =>
       prevOpen.includes(orderId)
         ? prevOpen.filter((id) => id !== orderId)
@@ -76,14 +141,18 @@ function OrderHistory() {
               <ListItemButton onClick={() => handleToggle(order.id)}>
                 <ListItemText
                   primary={`Pedido #${order.id}`}
-                  secondary={`Total: ${order.total_final_clp} CLP - Fecha: ${new Date(order.fecha_pedido).toLocaleString()}`}
+                  secondary={`Estado: ${order.estado} - Total: ${order.total_final_clp} CLP - Fecha: ${new Date(order.fecha_pedido).toLocaleString()}`}
                 />
                 {openOrderIds.includes(order.id) ? <ExpandLess /> : <ExpandMore />}
               </ListItemButton>
               <Collapse in={openOrderIds.includes(order.id)} timeout="auto" unmountOnExit>
                 <List component="div" disablePadding>
-                  {order.detalles && order.detalles.length > 0 ? (
-                    order.detalles.map((detalle) => (
+                  {!orderDetails[order.id] ? (
+                    <ListItem sx={{ pl: 4 }}>
+                      <CircularProgress size={20} />
+                    </ListItem>
+                  ) : orderDetails[order.id].length > 0 ? (
+                    orderDetails[order.id].map((detalle) => (
                       <ListItem key={detalle.id} sx={{ pl: 4 }}>
                         <ListItemText
                           primary={detalle.producto.nombre}
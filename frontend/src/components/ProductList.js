@@ -43,7 +43,7 @@ function ProductList() {
   const filteredProducts = products.filter(
     (product) =>
       product.nombre.toLowerCase().includes(search.toLowerCase()) ||
-      product.descripcion.toLowerCase().includes(search.toLowerCase()) ||
+      product.descripcion_corta.toLowerCase().includes(search.toLowerCase()) ||
       product.marca.toLowerCase().includes(search.toLowerCase())
   );
 
@@ -80,7 +80,7 @@ function ProductList() {
                     {product.nombre}
                   </Typography>
                   <Typography variant="body2" color="text.secondary">
-                    {product.descripcion.substring(0, 100)}...
+                    {product.descripcion_corta}...
                   </Typography>
                   <Typography variant="h6" sx={{ mt: 2 }}>
                     ${product.precio_usd} USD